@@ -8,6 +8,8 @@ import wikipedia
 from openai import OpenAI
 from typing import Dict, List, Optional
 from models import db, Character, Question, CharacterAttribute
+from learning_system import LearningSystem
+from record_cache import publish_record_changes
 
 # Importar sistema de fuentes múltiples
 try:
@@ -369,6 +371,12 @@ Solo el JSON, sin explicaciones."""
                 stats['failed'] += 1
                 print(f"✗ Error importando {name}: {e}")
         
+        # Los personajes importados no pasan por LearningSystem: recalcular contadores
+        # y avisar a los workers, que no ven los commits de este proceso
+        if stats['success']:
+            LearningSystem().recalculate_system_stats()
+            publish_record_changes(db.session)
+        
         return stats
     
     def suggest_characters_by_category(self, category: str, limit: int = 10) -> List[str]:
@@ -1,12 +1,23 @@
 """
 Aplicación Flask principal - API REST para Akinator
 """
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 from models import db, Character, Question, SystemStats
 from game_engine import GameEngine
+from question_selector import QuestionSelector
 from learning_system import LearningSystem
+from scoring import create_scoring_engine
+from session_store import create_session_store
+from counter_buffer import CounterBuffer, question_times_asked_writer
+from learning_queue import LearningQueue
+from model_changes import create_change_feed
+from selection_cache import SelectionCache
+from speculation import Speculator
+from game_stream import GameStreams, create_stream_hub
+from session_token import SessionTokens
 import os
+import time
 
 
 
@@ -41,9 +52,139 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-pro
 # Inicializar base de datos
 db.init_app(app)
 
+# Motor de puntuación de candidatos: 'points' (original) o 'probabilistic'
+SCORING_ENGINE = os.getenv('SCORING_ENGINE', 'points')
+
+# Árbol de aperturas: niveles a compilar en segundo plano y artefacto precompilado
+OPENING_TREE_DEPTH = int(os.getenv('OPENING_TREE_DEPTH', '3'))
+OPENING_TREE_PATH = os.getenv('OPENING_TREE_PATH')
+
+# Selección a dos pasos: preguntas de primer nivel a evaluar (0 = greedy) y presupuesto
+LOOKAHEAD_TOP_K = int(os.getenv('LOOKAHEAD_TOP_K', '0'))
+LOOKAHEAD_BUDGET_MS = float(os.getenv('LOOKAHEAD_BUDGET_MS', '50'))
+
+# Archivo binario del modelo compartido entre workers (python backend/model_file.py --output ...)
+MODEL_FILE = os.getenv('MODEL_FILE')
+
+# Almacenamiento de sesiones: 'memory' (un proceso) o 'redis' (compartido entre workers)
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Sesiones abandonadas: inactividad máxima, límites en memoria (LRU) y barrido periódico
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', '10000'))
+SESSION_MAX_MB = float(os.getenv('SESSION_MAX_MB', '512'))
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+
+# Aviso de modelos nuevos entre workers: 'memory' (un proceso) o 'redis' (pub/sub)
+MODEL_CHANGE_FEED = os.getenv('MODEL_CHANGE_FEED', 'memory')
+
+# Caché de preguntas elegidas por camino de respuestas: entradas en memoria (0 = desactivada)
+# y segundos de vida de las entradas compartidas en Redis
+SELECTION_CACHE_SIZE = int(os.getenv('SELECTION_CACHE_SIZE', '10000'))
+SELECTION_CACHE_TTL = int(os.getenv('SELECTION_CACHE_TTL', '3600'))
+
+# Precálculo especulativo de las respuestas posibles: hilos del pool (0 = desactivado;
+# cuesta ~4 veces la CPU útil por respuesta) y ramas en cola o corriendo como máximo
+SPECULATION_WORKERS = int(os.getenv('SPECULATION_WORKERS', '0'))
+SPECULATION_MAX_PENDING = int(os.getenv('SPECULATION_MAX_PENDING', '50'))
+
+# Tokens de sesión firmados en lugar de sesiones guardadas (el cliente lleva el estado)
+# y estados recientes en memoria por worker (0 = reconstruir en cada respuesta)
+SESSION_TOKENS = os.getenv('SESSION_TOKENS', 'false').lower() in ('1', 'true', 'yes')
+SESSION_TOKEN_CACHE_SIZE = int(os.getenv('SESSION_TOKEN_CACHE_SIZE', '1000'))
+
+# Partidas por SSE: segundos entre keepalives y sin respuestas antes de cerrar el stream
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', str(SESSION_TTL)))
+
+# Escritura diferida de Question.times_asked: segundos entre lotes y preguntas pendientes máximas
+QUESTION_COUNTER_INTERVAL = float(os.getenv('QUESTION_COUNTER_INTERVAL', '5'))
+QUESTION_COUNTER_MAX_PENDING = int(os.getenv('QUESTION_COUNTER_MAX_PENDING', '500'))
+
 # Instancias globales
-game_engine = GameEngine()
+session_store = create_session_store(
+    SESSION_STORE,
+    redis_url=REDIS_URL,
+    ttl=SESSION_TTL,
+    max_sessions=SESSION_MAX_COUNT,
+    max_bytes=int(SESSION_MAX_MB * 1024 * 1024),
+    sweep_interval=SESSION_SWEEP_INTERVAL
+)
+game_engine = GameEngine(
+    scoring=create_scoring_engine(SCORING_ENGINE),
+    opening_tree_depth=OPENING_TREE_DEPTH,
+    opening_tree_path=OPENING_TREE_PATH,
+    question_selector=QuestionSelector(
+        db.session,
+        lookahead_top_k=LOOKAHEAD_TOP_K,
+        lookahead_budget_ms=LOOKAHEAD_BUDGET_MS,
+        model_path=MODEL_FILE
+    ),
+    session_store=session_store,
+    question_counter=CounterBuffer(
+        question_times_asked_writer(app),
+        interval=QUESTION_COUNTER_INTERVAL,
+        max_pending=QUESTION_COUNTER_MAX_PENDING
+    ),
+    change_feed=create_change_feed(MODEL_CHANGE_FEED, redis_url=REDIS_URL),
+    selection_cache=SelectionCache(
+        SELECTION_CACHE_SIZE,
+        client=session_store.shared_client,
+        ttl=SELECTION_CACHE_TTL
+    ) if SELECTION_CACHE_SIZE > 0 else None,
+    speculator=Speculator(
+        max_workers=SPECULATION_WORKERS,
+        max_pending=SPECULATION_MAX_PENDING
+    ) if SPECULATION_WORKERS > 0 else None,
+    session_tokens=SessionTokens(
+        app.config['SECRET_KEY'],
+        max_age=SESSION_TTL,
+        cache_size=SESSION_TOKEN_CACHE_SIZE
+    ) if SESSION_TOKENS else None
+)
 learning_system = LearningSystem()
+# Los streams siguen a las sesiones: con sesiones en Redis, las respuestas se enrutan entre workers
+game_streams = GameStreams(
+    game_engine,
+    create_stream_hub(session_store.shared_client),
+    heartbeat=STREAM_HEARTBEAT,
+    idle_timeout=STREAM_IDLE_TIMEOUT
+)
+
+# Cola de aprendizaje: sesiones por lote y segundos entre revisiones de la cola
+LEARNING_BATCH_SIZE = int(os.getenv('LEARNING_BATCH_SIZE', '50'))
+LEARNING_POLL_INTERVAL = float(os.getenv('LEARNING_POLL_INTERVAL', '2'))
+
+learning_queue = LearningQueue(
+    app,
+    learning_system,
+    on_batch=game_engine.refresh_model,
+    batch_size=LEARNING_BATCH_SIZE,
+    poll_interval=LEARNING_POLL_INTERVAL
+)
+
+
+@app.before_request
+def start_background_workers():
+    """Arranca la cola de aprendizaje y los receptores de cambios del modelo y de streams en cada worker"""
+    learning_queue.start()
+    game_engine.change_feed.start(app)
+    game_streams.hub.start(app)
+
+
+@app.before_request
+def start_request_timer():
+    """Marca el inicio de la petición (tiempo de servidor por respuesta)"""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_answer_time(response):
+    """Tiempo de servidor de cada respuesta por REST, para compararlo con el de los streams"""
+    if request.endpoint == 'answer_question' and 'request_started' in g:
+        game_streams.record_rest_answer(time.perf_counter() - g.request_started)
+    return response
 
 
 @app.route('/')
@@ -71,7 +212,8 @@ def answer_question():
         {
             "session_id": "uuid",
             "question_id": 1,
-            "answer": "yes" | "probably_yes" | "dont_know" | "probably_no" | "no"
+            "answer": "yes" | "probably_yes" | "dont_know" | "probably_no" | "no",
+            "session_token": "..."  (solo con SESSION_TOKENS)
         }
     """
     try:
@@ -83,12 +225,111 @@ def answer_question():
         if not all([session_id, question_id, answer]):
             return jsonify({'error': 'Faltan parámetros requeridos'}), 400
         
-        result = game_engine.process_answer(session_id, question_id, answer)
+        result = game_engine.process_answer(
+            session_id, question_id, answer, data.get('session_token')
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/game/answers', methods=['POST'])
+def answer_questions():
+    """
+    Procesa varias respuestas en orden en una sola petición (reproducciones,
+    clientes sin conexión, pruebas de carga)
+    
+    Body:
+        {
+            "session_id": "uuid",
+            "answers": [
+                {"question_id": 1, "answer": "yes"},
+                {"question_id": 7, "answer": "no"}
+            ],
+            "session_token": "..."  (solo con SESSION_TOKENS)
+        }
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        answers = data.get('answers')
+        
+        if not session_id or not isinstance(answers, list) or not answers:
+            return jsonify({'error': 'Faltan parámetros requeridos'}), 400
+        if len(answers) > GameEngine.MAX_QUESTIONS:
+            return jsonify({'error': f'Máximo {GameEngine.MAX_QUESTIONS} respuestas por lote'}), 400
+        if not all(isinstance(item, dict) and item.get('question_id') and item.get('answer')
+                   for item in answers):
+            return jsonify({'error': 'Cada respuesta requiere question_id y answer'}), 400
+        
+        result = game_engine.process_answers(
+            session_id,
+            [(item['question_id'], item['answer']) for item in answers],
+            data.get('session_token')
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/game/stream', methods=['GET'])
+def game_stream():
+    """
+    Canal SSE de una partida: inicia una partida nueva o, con ?session_id=
+    (y ?session_token= con SESSION_TOKENS), se vuelve a conectar a una en curso
+    
+    Eventos: start, attached, question, guess, give_up, failure, timeout
+    """
+    session_id = request.args.get('session_id') or None
+    session_token = request.args.get('session_token') or None
+    return Response(
+        stream_with_context(game_streams.open(session_id, session_token)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # nginx no debe acumular el stream en su buffer
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/game/stream/answer', methods=['POST'])
+def stream_answer():
+    """
+    Envía una respuesta al stream de la partida; el resultado llega como evento
+    
+    Body:
+        {
+            "session_id": "uuid",
+            "question_id": 1,
+            "answer": "yes" | "probably_yes" | "dont_know" | "probably_no" | "no",
+            "session_token": "..."  (solo con SESSION_TOKENS)
+        }
+    
+    Returns:
+        202 sin cuerpo si un stream la atiende; si no, el resultado como en
+        /api/game/answer
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        question_id = data.get('question_id')
+        answer = data.get('answer')
+        
+        if not all([session_id, question_id, answer]):
+            return jsonify({'error': 'Faltan parámetros requeridos'}), 400
+        
+        session_token = data.get('session_token')
+        if game_streams.submit(session_id, question_id, answer, session_token):
+            return '', 202
+        
+        return jsonify(game_engine.process_answer(
+            session_id, question_id, answer, session_token
+        ))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/game/confirm', methods=['POST'])
 def confirm_guess():
     """
@@ -98,7 +339,8 @@ def confirm_guess():
         {
             "session_id": "uuid",
             "character_id": 1,
-            "correct": true | false
+            "correct": true | false,
+            "session_token": "..."  (solo con SESSION_TOKENS)
         }
     """
     try:
@@ -110,11 +352,13 @@ def confirm_guess():
         if not all([session_id, character_id is not None, correct is not None]):
             return jsonify({'error': 'Faltan parámetros requeridos'}), 400
         
-        result = game_engine.confirm_guess(session_id, character_id, correct)
+        result = game_engine.confirm_guess(
+            session_id, character_id, correct, data.get('session_token')
+        )
         
-        # Analizar sesión para aprendizaje
-        if correct:
-            learning_system.analyze_game_session(session_id)
+        # La partida ya quedó encolada para aprendizaje: despertar la cola (se analiza en segundo plano)
+        if 'error' not in result:
+            learning_queue.notify()
         
         return jsonify(result)
     except Exception as e:
@@ -147,6 +391,7 @@ def add_character():
             return jsonify({'error': 'Faltan parámetros requeridos'}), 400
         
         character = learning_system.add_new_character(name, attributes, description)
+        game_engine.schedule_model_refresh([character.id])
         
         return jsonify({
             'success': True,
@@ -163,14 +408,16 @@ def get_stats():
     try:
         stats = learning_system.get_learning_stats()
         
-        # Agregar estadísticas de base de datos
-        total_characters = db.session.query(Character).count()
-        total_questions = db.session.query(Question).count()
+        # Agregar estadísticas de base de datos (contadores de SystemStats)
+        system_stats = learning_system.get_system_stats()
         
         stats['database'] = {
-            'total_characters': total_characters,
-            'total_questions': total_questions
+            'total_characters': system_stats.total_characters or 0,
+            'total_questions': system_stats.total_questions or 0
         }
+        stats['engine'] = game_engine.get_metrics()
+        stats['streams'] = game_streams.get_metrics()
+        stats['learning_queue'] = learning_queue.get_metrics()
         
         return jsonify(stats)
     except Exception as e:
@@ -218,6 +465,9 @@ def init_database():
         from init_data import initialize_data
         initialize_data(db)
         
+        # Los datos iniciales no pasan por LearningSystem: recalcular contadores
+        learning_system.recalculate_system_stats()
+        
         print("Base de datos inicializada exitosamente")
 
 
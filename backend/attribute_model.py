@@ -0,0 +1,566 @@
+"""
+Modelo en memoria de atributos de personajes
+Carga character_attributes una sola vez en una matriz densa personajes × atributos
+para que la selección de preguntas no consulte la base de datos en cada respuesta
+"""
+import hashlib
+from typing import Collection, Dict, Iterable, List, Optional
+import numpy as np
+from bitset import WORD_BITS, num_words, pack_mask, popcount, rows_to_bits
+from models import Character, Question, CharacterAttribute
+
+
+# Valores posibles de un atributo (No, Prob no, No sé, Prob sí, Sí)
+ANSWER_RANGE = (-2, -1, 0, 1, 2)
+VALUE_OFFSET = 2  # Desplazamiento para usar el valor como índice de bucket (0..4)
+MISSING_CONFIDENCE = 0.5  # Confianza del "No sé" asumido para atributos no definidos
+
+# Fracción mínima de filas a partir de la cual contar con bitsets es más barato
+BITSET_MIN_FRACTION = 1 / 32
+BITSET_COL_CHUNK = 64  # Columnas por bloque al contar con bitsets (limita memoria temporal)
+
+# Crecimiento amortizado de las matrices al agregar personajes
+GROWTH_FACTOR = 1.5
+MIN_GROWTH_ROWS = 64
+
+
+class QuestionRecord:
+    """Registro inmutable de una pregunta cargada en el modelo"""
+
+    __slots__ = ('id', 'text', 'attribute_key', 'times_asked', 'effectiveness_score')
+
+    def __init__(self, id: int, text: str, attribute_key: str,
+                 times_asked: int, effectiveness_score: float):
+        self.id = id
+        self.text = text
+        self.attribute_key = attribute_key
+        self.times_asked = times_asked or 0
+        self.effectiveness_score = effectiveness_score if effectiveness_score is not None else 1.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'text': self.text,
+            'attribute_key': self.attribute_key,
+            'times_asked': self.times_asked,
+            'effectiveness_score': self.effectiveness_score
+        }
+
+
+class AttributeModel:
+    """
+    Matriz densa de atributos (int8) con mapas id ↔ fila y clave ↔ columna
+
+    Los atributos no definidos para un personaje se guardan como 0 ("No sé"),
+    igual que asumía el cálculo original de distribuciones.
+
+    Un modelo es una instantánea inmutable: las matrices son de solo lectura y
+    los cambios producen un modelo nuevo (ver with_changes), así que las
+    partidas que lo usan nunca ven escrituras a medias.
+    """
+
+    def __init__(
+        self,
+        character_ids: List[int],
+        attribute_keys: List[str],
+        values: np.ndarray,
+        questions: List[QuestionRecord],
+        version: int = 1,
+        confidence: Optional[np.ndarray] = None,
+        values_buffer: Optional[np.ndarray] = None,
+        confidence_buffer: Optional[np.ndarray] = None
+    ):
+        """
+        Args:
+            character_ids: IDs de personajes en orden de fila
+            attribute_keys: Claves de atributo en orden de columna
+            values: Matriz int8 (personajes × atributos) con valores -2..2
+            questions: Preguntas disponibles ordenadas por ID
+            version: Versión del modelo (aumenta en cada refresco)
+            confidence: Matriz float32 con la confianza de cada valor. Por
+                defecto 1 donde hay valor y MISSING_CONFIDENCE donde no.
+            values_buffer: Matriz con capacidad extra de filas de la que
+                `values` es el prefijo (por defecto `values`)
+            confidence_buffer: Ídem para `confidence`
+        """
+        self.version = version
+        self.character_ids = np.asarray(character_ids, dtype=np.int64)
+        self.attribute_keys = list(attribute_keys)
+        if confidence is None:
+            confidence = np.where(values != 0, 1.0, MISSING_CONFIDENCE).astype(np.float32)
+
+        # Las filas libres de los buffers permiten agregar personajes sin copiar;
+        # los modelos solo ven su prefijo, como vista de solo lectura
+        self._values_buffer = values if values_buffer is None else values_buffer
+        self._confidence_buffer = confidence if confidence_buffer is None else confidence_buffer
+        self.values = values.view()
+        self.values.flags.writeable = False
+        self.confidence = confidence.view()
+        self.confidence.flags.writeable = False
+        self.id_to_row = {char_id: row for row, char_id in enumerate(character_ids)}
+        self.key_to_col = {key: col for col, key in enumerate(self.attribute_keys)}
+
+        self.questions = questions
+        self.question_index = {q.id: idx for idx, q in enumerate(questions)}
+        self.question_ids = np.array([q.id for q in questions], dtype=np.int64)
+        self.question_cols = np.array(
+            [self.key_to_col[q.attribute_key] for q in questions], dtype=np.int64
+        )
+        self.question_effectiveness = np.array(
+            [q.effectiveness_score for q in questions], dtype=np.float64
+        )
+        self._fingerprint = None
+        self._base_histograms = None
+        self._postings = None
+        self._question_distinct = None
+        self._all_candidates = None
+
+    @classmethod
+    def from_db(cls, db_session, version: int = 1) -> 'AttributeModel':
+        """
+        Construye el modelo leyendo personajes, atributos y preguntas
+
+        Args:
+            db_session: Sesión de SQLAlchemy
+            version: Versión a asignar al modelo construido
+
+        Returns:
+            AttributeModel con los datos actuales de la base de datos
+        """
+        character_ids = [
+            char_id for (char_id,) in
+            db_session.query(Character.id).order_by(Character.id).all()
+        ]
+        attribute_rows = _attribute_query(db_session).all()
+        questions = _load_questions(db_session)
+
+        # Columnas: todas las claves con preguntas o con atributos cargados
+        attribute_keys = sorted(
+            {q.attribute_key for q in questions} |
+            {attr_key for _, attr_key, _, _ in attribute_rows}
+        )
+        key_to_col = {key: col for col, key in enumerate(attribute_keys)}
+        id_to_row = {char_id: row for row, char_id in enumerate(character_ids)}
+
+        shape = (len(character_ids), len(attribute_keys))
+        values = np.zeros(shape, dtype=np.int8)
+        confidence = np.full(shape, MISSING_CONFIDENCE, dtype=np.float32)
+        _fill_attributes(values, confidence, attribute_rows, id_to_row, key_to_col)
+
+        return cls(character_ids, attribute_keys, values, questions, version, confidence)
+
+    def with_changes(self, db_session, character_ids: Iterable[int],
+                     version: int) -> 'AttributeModel':
+        """
+        Construye un modelo nuevo releyendo solo lo que cambió
+
+        Relee las preguntas (efectividad), los atributos de `character_ids` y
+        los personajes creados después del último del modelo. Los personajes
+        nuevos se agregan en las filas libres de los buffers (creciendo en
+        bloques amortizados); si cambian filas existentes, los buffers se copian
+        para no tocar los modelos en uso. Los histogramas base y las listas de
+        posteo se ajustan solo en las filas afectadas.
+
+        Las claves de atributo nuevas (de preguntas o atributos nuevos) se
+        insertan en su lugar del orden alfabético, como en from_db: los buffers
+        se copian con las columnas reubicadas, se leen los atributos de esas
+        claves y sus índices se calculan desde cero.
+
+        Con los mismos datos el resultado es idéntico (misma huella) a
+        reconstruir con from_db; borrar personajes o preguntas requiere from_db.
+
+        Args:
+            db_session: Sesión de SQLAlchemy
+            character_ids: IDs de personajes con atributos modificados
+            version: Versión a asignar al modelo construido
+
+        Returns:
+            AttributeModel nuevo
+        """
+        questions = _load_questions(db_session)
+        last_id = int(self.character_ids[-1]) if self.num_characters else 0
+        new_ids = [
+            char_id for (char_id,) in
+            db_session.query(Character.id).filter(Character.id > last_id).order_by(Character.id).all()
+        ]
+        changed_ids = sorted({char_id for char_id in character_ids if char_id in self.id_to_row})
+        reload_ids = changed_ids + new_ids
+        attribute_rows = []
+        if reload_ids:
+            attribute_rows = _attribute_query(db_session).filter(
+                CharacterAttribute.character_id.in_(reload_ids)
+            ).all()
+
+        added_keys = sorted(
+            ({q.attribute_key for q in questions} | {attr_key for _, attr_key, _, _ in attribute_rows})
+            - self.key_to_col.keys()
+        )
+        attribute_keys = sorted(self.attribute_keys + added_keys) if added_keys else self.attribute_keys
+        key_to_col = {key: col for col, key in enumerate(attribute_keys)}
+        old_cols = np.array([key_to_col[key] for key in self.attribute_keys], dtype=np.int64)
+        added_cols = np.array([key_to_col[key] for key in added_keys], dtype=np.int64)
+
+        old_count = self.num_characters
+        count = old_count + len(new_ids)
+        values_buffer, confidence_buffer = self._values_buffer, self._confidence_buffer
+        capacity = len(values_buffer)
+        grow = count > capacity
+        if grow:
+            capacity = max(count, int(capacity * GROWTH_FACTOR) + MIN_GROWTH_ROWS)
+        # Las claves nuevas caen en medio del orden alfabético: reservar columnas
+        # libres al final no evitaría la copia, así que solo las filas tienen holgura
+        if added_keys:
+            num_cols = len(attribute_keys)
+            values_buffer = _copy_columns(values_buffer, old_count, capacity, old_cols, num_cols, 0)
+            confidence_buffer = _copy_columns(
+                confidence_buffer, old_count, capacity, old_cols, num_cols, MISSING_CONFIDENCE
+            )
+            _fill_attributes(
+                values_buffer, confidence_buffer,
+                _attribute_query(db_session).filter(CharacterAttribute.attribute_key.in_(added_keys)),
+                self.id_to_row, key_to_col
+            )
+        elif grow or changed_ids:
+            values_buffer = _copy_rows(values_buffer, old_count, capacity)
+            confidence_buffer = _copy_rows(confidence_buffer, old_count, capacity)
+
+        changed_rows = np.array([self.id_to_row[char_id] for char_id in changed_ids], dtype=np.int64)
+        rows = np.concatenate([changed_rows, np.arange(old_count, count, dtype=np.int64)])
+        if len(rows):
+            values_buffer[rows] = 0
+            confidence_buffer[rows] = MISSING_CONFIDENCE
+            id_to_row = {char_id: row for char_id, row in zip(reload_ids, rows.tolist())}
+            _fill_attributes(values_buffer, confidence_buffer, attribute_rows, id_to_row, key_to_col)
+
+        model = AttributeModel(
+            self.character_ids.tolist() + new_ids,
+            attribute_keys,
+            values_buffer[:count],
+            questions,
+            version,
+            confidence_buffer[:count],
+            values_buffer,
+            confidence_buffer
+        )
+        model._inherit_indexes(self, changed_rows, rows, old_cols, added_cols)
+        return model
+
+    def _inherit_indexes(self, parent: 'AttributeModel', old_rows: np.ndarray, new_rows: np.ndarray,
+                         old_cols: np.ndarray, added_cols: np.ndarray):
+        """
+        Ajusta los índices ya calculados del modelo anterior en lugar de recalcularlos
+
+        Args:
+            parent: Modelo del que se derivó este
+            old_rows: Filas modificadas (con sus valores anteriores en parent)
+            new_rows: Filas modificadas y agregadas (con sus valores nuevos)
+            old_cols: Columna en este modelo de cada columna de parent
+            added_cols: Columnas nuevas (se calculan desde cero)
+        """
+        all_cols = np.arange(len(self.attribute_keys), dtype=np.int64)
+        all_rows = np.arange(self.num_characters, dtype=np.int64)
+        if parent._base_histograms is not None:
+            histograms = np.empty((len(all_cols), len(ANSWER_RANGE)), dtype=np.int64)
+            histograms[old_cols] = parent._base_histograms
+            if len(old_rows):
+                parent_cols = np.arange(len(parent.attribute_keys), dtype=np.int64)
+                histograms[old_cols] -= _dense_histograms(parent.values, old_rows, parent_cols)
+            histograms[old_cols] += _dense_histograms(self.values, new_rows, old_cols)
+            histograms[added_cols] = _dense_histograms(self.values, all_rows, added_cols)
+            self._base_histograms = histograms
+
+        if parent._postings is not None:
+            shape = (len(all_cols), len(ANSWER_RANGE), num_words(self.num_characters))
+            postings = np.zeros(shape, dtype=np.uint64)
+            postings[old_cols, :, :parent._postings.shape[2]] = parent._postings
+            # Apagar los bits de las filas afectadas y encender el bucket de su valor nuevo
+            postings &= ~rows_to_bits(new_rows, self.num_characters)
+            words = (new_rows // WORD_BITS)[np.newaxis, :]
+            bits = (np.uint64(1) << (new_rows % WORD_BITS).astype(np.uint64))[np.newaxis, :]
+            buckets = self.values[new_rows].T + VALUE_OFFSET
+            np.bitwise_or.at(postings, (all_cols[:, np.newaxis], buckets, words), bits)
+            postings[added_cols] = _dense_postings(self.values, added_cols)
+            self._postings = postings
+
+    @property
+    def num_characters(self) -> int:
+        return len(self.character_ids)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Hash SHA-256 del contenido del modelo
+
+        A diferencia de `version` (contador local del proceso), dos modelos
+        construidos desde los mismos datos tienen la misma huella.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update(self.character_ids.tobytes())
+            digest.update('\x00'.join(self.attribute_keys).encode('utf-8'))
+            digest.update(np.ascontiguousarray(self.values).tobytes())
+            digest.update(np.ascontiguousarray(self.confidence).tobytes())
+            digest.update(self.question_ids.tobytes())
+            digest.update(self.question_cols.tobytes())
+            digest.update(self.question_effectiveness.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @property
+    def base_histograms(self) -> np.ndarray:
+        """Histogramas (columnas × 5 buckets) de todos los personajes, calculados una vez"""
+        if self._base_histograms is None:
+            self._base_histograms = self.answer_histograms(
+                np.arange(self.num_characters, dtype=np.int64),
+                np.arange(len(self.attribute_keys), dtype=np.int64)
+            )
+        return self._base_histograms
+
+    @property
+    def question_distinct(self) -> np.ndarray:
+        """
+        Número de valores distintos de cada pregunta entre todos los personajes
+
+        Es una cota superior de los valores distintos en cualquier subconjunto de candidatos.
+        """
+        if self._question_distinct is None:
+            self._question_distinct = np.count_nonzero(
+                self.base_histograms[self.question_cols] > 0, axis=1
+            )
+        return self._question_distinct
+
+    @property
+    def all_candidates(self) -> np.ndarray:
+        """
+        Bitset con todas las filas, compartido por las sesiones nuevas
+
+        Las sesiones nunca modifican su bitset en el lugar (lo reemplazan al
+        filtrar), así que empezar una partida no copia nada proporcional al
+        número de personajes.
+        """
+        if self._all_candidates is None:
+            bits = rows_to_bits(np.arange(self.num_characters, dtype=np.int64), self.num_characters)
+            bits.flags.writeable = False
+            self._all_candidates = bits
+        return self._all_candidates
+
+    @property
+    def postings(self) -> np.ndarray:
+        """
+        Listas de posteo empaquetadas por (columna, valor)
+
+        Array uint64 (columnas × 5 × palabras) donde el bit de una fila está
+        encendido si el personaje tiene ese valor (incluido el 0 implícito de
+        los atributos no definidos). Se construye una vez por modelo.
+        """
+        if self._postings is None:
+            self._postings = _dense_postings(self.values, np.arange(len(self.attribute_keys), dtype=np.int64))
+        return self._postings
+
+    def available_question_indices(self, asked_questions: Collection[int]) -> np.ndarray:
+        """Índices (en questions) de las preguntas que no están en asked_questions"""
+        if len(asked_questions) == 0:
+            return np.arange(len(self.questions), dtype=np.int64)
+        asked = np.fromiter(asked_questions, dtype=np.int64, count=len(asked_questions))
+        return np.flatnonzero(~np.isin(self.question_ids, asked))
+
+    def rows_for(self, character_ids: Iterable[int]) -> np.ndarray:
+        """
+        Convierte IDs de personaje en índices de fila
+
+        Los IDs desconocidos por el modelo se ignoran.
+        """
+        id_to_row = self.id_to_row
+        return np.fromiter(
+            (id_to_row[char_id] for char_id in character_ids if char_id in id_to_row),
+            dtype=np.int64
+        )
+
+    def get_question(self, question_id: int) -> Optional[QuestionRecord]:
+        """Obtiene una pregunta del modelo por ID"""
+        idx = self.question_index.get(question_id)
+        return self.questions[idx] if idx is not None else None
+
+    def answer_distribution(self, rows: np.ndarray, col: int) -> Dict[int, int]:
+        """
+        Cuenta los valores de una columna entre las filas candidatas
+
+        Args:
+            rows: Índices de fila de los candidatos
+            col: Columna del atributo
+
+        Returns:
+            Dict {value: count} con los valores presentes (-2 a 2)
+        """
+        counts = np.bincount(self.values[rows, col] + VALUE_OFFSET, minlength=len(ANSWER_RANGE))
+        return {
+            value: int(count)
+            for value, count in zip(ANSWER_RANGE, counts)
+            if count > 0
+        }
+
+    def answer_histograms(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Cuenta los valores -2..2 de varias columnas a la vez entre las filas candidatas
+
+        Con muchas filas cuenta con AND + popcount sobre las listas de posteo;
+        con pocas, compara directamente la submatriz densa.
+
+        Args:
+            rows: Índices de fila de los candidatos
+            cols: Columnas de atributo a contar
+
+        Returns:
+            Matriz int64 (len(cols) × 5) con los conteos por bucket (-2..2)
+        """
+        if len(rows) >= self.num_characters * BITSET_MIN_FRACTION:
+            return self.bitset_histograms(rows_to_bits(rows, self.num_characters), cols)
+        return _dense_histograms(self.values, rows, cols)
+
+    def bitset_histograms(self, bits: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Cuenta los valores -2..2 de varias columnas con AND + popcount
+
+        Args:
+            bits: Bitset de candidatos (ver bitset.rows_to_bits)
+            cols: Columnas de atributo a contar
+
+        Returns:
+            Matriz int64 (len(cols) × 5) con los conteos por bucket (-2..2)
+        """
+        postings = self.postings
+        histograms = np.empty((len(cols), len(ANSWER_RANGE)), dtype=np.int64)
+        for start in range(0, len(cols), BITSET_COL_CHUNK):
+            chunk = cols[start:start + BITSET_COL_CHUNK]
+            histograms[start:start + len(chunk)] = popcount(postings[chunk] & bits)
+        return histograms
+
+
+class CandidateHistograms:
+    """
+    Histogramas de respuestas de los candidatos de una sesión
+
+    Guarda un vector de 5 buckets (-2..2) por columna del modelo. Al filtrar
+    candidatos solo se restan las filas eliminadas, así que el costo por
+    respuesta es proporcional a lo que cambió y no al total de candidatos.
+    """
+
+    __slots__ = ('counts', 'total')
+
+    def __init__(self, counts: np.ndarray, total: int):
+        """
+        Args:
+            counts: Matriz int32 (columnas × 5) con los conteos por bucket
+            total: Número de candidatos contados
+        """
+        self.counts = counts
+        self.total = total
+
+    @classmethod
+    def for_all(cls, model: AttributeModel) -> 'CandidateHistograms':
+        """Histogramas con todos los personajes del modelo como candidatos"""
+        return cls(model.base_histograms.astype(np.int32), model.num_characters)
+
+    @classmethod
+    def for_rows(cls, model: AttributeModel, rows: np.ndarray) -> 'CandidateHistograms':
+        """Histogramas calculados desde cero para un conjunto de filas"""
+        all_cols = np.arange(len(model.attribute_keys), dtype=np.int64)
+        return cls(model.answer_histograms(rows, all_cols).astype(np.int32), len(rows))
+
+    def update(self, model: AttributeModel, old_rows: np.ndarray, new_rows: np.ndarray,
+               old_bits: np.ndarray, new_bits: np.ndarray):
+        """
+        Ajusta los histogramas tras filtrar candidatos
+
+        Args:
+            model: Modelo al que pertenecen las filas
+            old_rows: Candidatos antes del filtrado
+            new_rows: Candidatos después del filtrado (subconjunto de old_rows)
+            old_bits: Bitset de old_rows
+            new_bits: Bitset de new_rows
+        """
+        num_removed = len(old_rows) - len(new_rows)
+        if num_removed == 0:
+            return
+
+        all_cols = np.arange(len(model.attribute_keys), dtype=np.int64)
+        if len(new_rows) < num_removed:
+            # Quedan menos candidatos que eliminados: es más barato recontar
+            self.counts = model.answer_histograms(new_rows, all_cols).astype(np.int32)
+        elif num_removed >= model.num_characters * BITSET_MIN_FRACTION:
+            self.counts -= model.bitset_histograms(old_bits & ~new_bits, all_cols)
+        else:
+            removed = old_rows[np.isin(old_rows, new_rows, assume_unique=True, invert=True)]
+            self.counts -= model.answer_histograms(removed, all_cols)
+        self.total = len(new_rows)
+
+
+def _attribute_query(db_session):
+    """Consulta de (personaje, clave, valor, confianza) de character_attributes"""
+    return db_session.query(
+        CharacterAttribute.character_id,
+        CharacterAttribute.attribute_key,
+        CharacterAttribute.value,
+        CharacterAttribute.confidence
+    )
+
+
+def _load_questions(db_session) -> List[QuestionRecord]:
+    """Preguntas ordenadas por ID"""
+    return [
+        QuestionRecord(*row) for row in db_session.query(
+            Question.id,
+            Question.text,
+            Question.attribute_key,
+            Question.times_asked,
+            Question.effectiveness_score
+        ).order_by(Question.id).all()
+    ]
+
+
+def _fill_attributes(values: np.ndarray, confidence: np.ndarray, attribute_rows,
+                     id_to_row: Dict[int, int], key_to_col: Dict[str, int]):
+    """Escribe filas de character_attributes en las matrices (ignora personajes desconocidos)"""
+    for char_id, attr_key, value, attr_confidence in attribute_rows:
+        row = id_to_row.get(char_id)
+        if row is not None:
+            col = key_to_col[attr_key]
+            values[row, col] = max(-2, min(2, value))
+            confidence[row, col] = 1.0 if attr_confidence is None else attr_confidence
+
+
+def _dense_histograms(values: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Cuenta los valores -2..2 de varias columnas comparando la submatriz densa"""
+    subset = values[np.ix_(rows, cols)]
+    histograms = np.empty((len(cols), len(ANSWER_RANGE)), dtype=np.int64)
+    for bucket, value in enumerate(ANSWER_RANGE):
+        histograms[:, bucket] = np.count_nonzero(subset == value, axis=0)
+    return histograms
+
+
+def _dense_postings(values: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Listas de posteo (len(cols) × 5 × palabras) de varias columnas de la matriz densa"""
+    values_by_col = np.ascontiguousarray(values[:, cols].T)
+    return np.stack(
+        [pack_mask(values_by_col == value) for value in ANSWER_RANGE],
+        axis=1
+    )
+
+
+def _copy_rows(buffer: np.ndarray, count: int, capacity: int) -> np.ndarray:
+    """Buffer nuevo de `capacity` filas con las primeras `count` filas de `buffer`"""
+    copy = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    copy[:count] = buffer[:count]
+    return copy
+
+
+def _copy_columns(buffer: np.ndarray, count: int, capacity: int, cols: np.ndarray,
+                  num_cols: int, fill) -> np.ndarray:
+    """
+    Buffer nuevo de `capacity` × `num_cols` con las primeras `count` filas de
+    `buffer` reubicadas en las columnas `cols` y `fill` en las demás
+    """
+    copy = np.empty((capacity, num_cols), dtype=buffer.dtype)
+    copy[:count] = fill
+    copy[:count, cols] = buffer[:count]
+    return copy
@@ -315,6 +315,9 @@ def run_batch_import(names: List[str], generate_images: bool = True, max_concurr
         max_concurrent: Número de tareas concurrentes
     """
     from ai_expansion import AIExpansionSystem
+    from learning_system import LearningSystem
+    from models import db
+    from record_cache import publish_record_changes
     
     ai_system = AIExpansionSystem()
     processor = BatchProcessor(ai_system, max_concurrent)
@@ -322,4 +325,10 @@ def run_batch_import(names: List[str], generate_images: bool = True, max_concurr
     # Ejecutar procesamiento asíncrono
     stats = asyncio.run(processor.process_batch(names, generate_images))
     
+    # Los personajes importados no pasan por LearningSystem: recalcular contadores
+    # y avisar a los workers, que no ven los commits de este proceso
+    if stats['success']:
+        LearningSystem().recalculate_system_stats()
+        publish_record_changes(db.session)
+    
     return stats
@@ -0,0 +1,169 @@
+"""
+Benchmark de partidas simuladas
+Juega una partida por personaje respondiendo como un jugador que piensa en él y
+compara los motores de puntuación: aciertos, preguntas promedio y tiempo de
+servidor por respuesta
+
+Uso como CLI:
+    python backend/benchmark.py                                   # base de datos configurada
+    python backend/benchmark.py --synthetic 2000 --attributes 120 --noise 0.1
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+
+ANSWERS = {2: 'yes', 1: 'probably_yes', 0: 'dont_know', -1: 'probably_no', -2: 'no'}
+
+
+def create_synthetic_data(db, num_characters: int, num_attributes: int, seed: int):
+    """
+    Llena una base vacía con personajes y preguntas aleatorios
+
+    Cada personaje define la mitad de los atributos en promedio, con valores
+    mayormente extremos (±2) y confianza entre 0.6 y 1.
+    """
+    from models import Character, Question, CharacterAttribute
+
+    rng = np.random.default_rng(seed)
+    keys = [f'attr_{index:03d}' for index in range(num_attributes)]
+    db.session.execute(db.insert(Question), [
+        {'text': f'¿Tiene {key}?', 'attribute_key': key, 'times_asked': 0, 'effectiveness_score': 1.0}
+        for key in keys
+    ])
+    db.session.execute(db.insert(Character), [
+        {'name': f'Personaje {index}', 'times_guessed': 0, 'times_played': 0}
+        for index in range(num_characters)
+    ])
+    character_ids = [char_id for (char_id,) in db.session.query(Character.id).order_by(Character.id)]
+
+    defined = rng.random((num_characters, num_attributes)) < 0.5
+    values = rng.choice([-2, -1, 1, 2], p=[0.4, 0.1, 0.1, 0.4], size=defined.shape)
+    confidence = rng.uniform(0.6, 1.0, size=defined.shape)
+    rows, cols = np.nonzero(defined)
+    db.session.execute(db.insert(CharacterAttribute), [
+        {
+            'character_id': character_ids[row],
+            'attribute_key': keys[col],
+            'value': int(values[row, col]),
+            'confidence': round(float(confidence[row, col]), 2)
+        }
+        for row, col in zip(rows.tolist(), cols.tolist())
+    ])
+    db.session.commit()
+
+
+def play_all(engine, characters: List[Dict], noise: float, seed: int) -> Dict:
+    """
+    Juega una partida por personaje
+
+    Args:
+        engine: GameEngine a medir
+        characters: Personajes {id, attributes} en los que "piensa" el jugador
+        noise: Probabilidad de que cada respuesta sea un valor al azar
+        seed: Semilla del ruido de respuestas
+
+    Returns:
+        Aciertos, rendiciones, preguntas promedio y percentiles por respuesta (ms)
+    """
+    rng = np.random.default_rng(seed)
+    correct = gave_up = questions = 0
+    timings = []
+    for character in characters:
+        result = engine.start_game()
+        session_id = result['session_id']
+        count = 0
+        while 'question' in result:
+            value = character['attributes'].get(result['question']['attribute_key'], 0)
+            if noise and rng.random() < noise:
+                value = int(rng.integers(-2, 3))
+            start = time.perf_counter()
+            result = engine.process_answer(session_id, result['question']['id'], ANSWERS[value])
+            timings.append(time.perf_counter() - start)
+            count += 1
+        questions += count
+        if result.get('type') == 'guess':
+            correct += result['character']['id'] == character['id']
+            engine.session_store.delete(session_id)
+        else:
+            gave_up += 1
+
+    timings_ms = np.array(timings) * 1000.0
+    return {
+        'games': len(characters),
+        'correct': correct,
+        'gave_up': gave_up,
+        'avg_questions': questions / len(characters) if characters else 0.0,
+        'p50_ms': float(np.percentile(timings_ms, 50)) if len(timings) else 0.0,
+        'p95_ms': float(np.percentile(timings_ms, 95)) if len(timings) else 0.0
+    }
+
+
+def load_characters(db, limit: Optional[int], seed: int) -> List[Dict]:
+    """Personajes con sus atributos (una muestra de `limit` si se indica)"""
+    from models import CharacterAttribute, Character
+
+    character_ids = [char_id for (char_id,) in db.session.query(Character.id).order_by(Character.id)]
+    if limit is not None and limit < len(character_ids):
+        rng = np.random.default_rng(seed)
+        character_ids = sorted(rng.choice(character_ids, size=limit, replace=False).tolist())
+
+    attributes = {char_id: {} for char_id in character_ids}
+    for char_id, key, value in db.session.query(
+        CharacterAttribute.character_id, CharacterAttribute.attribute_key, CharacterAttribute.value
+    ):
+        if char_id in attributes:
+            attributes[char_id][key] = value
+    return [{'id': char_id, 'attributes': attributes[char_id]} for char_id in character_ids]
+
+
+def main():
+    """Compara los motores de puntuación sobre la base configurada o una sintética"""
+    parser = argparse.ArgumentParser(description='Benchmark de partidas simuladas')
+    parser.add_argument('--engines', default='points,probabilistic',
+                        help='Motores de puntuación a comparar, separados por comas')
+    parser.add_argument('--games', type=int, default=None,
+                        help='Partidas por motor (por defecto una por personaje)')
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help='Probabilidad de que una respuesta sea al azar')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Personajes de una base sintética en memoria (en lugar de la configurada)')
+    parser.add_argument('--attributes', type=int, default=100,
+                        help='Atributos (y preguntas) de la base sintética')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla de datos, muestra y ruido')
+    args = parser.parse_args()
+    if args.synthetic is not None and args.synthetic < 1:
+        parser.error('--synthetic requiere al menos un personaje')
+
+    if args.synthetic is not None:
+        os.environ['DATABASE_URL'] = 'sqlite://'
+    from app import app
+    from counter_buffer import CounterBuffer
+    from game_engine import GameEngine
+    from models import db
+    from scoring import create_scoring_engine
+
+    with app.app_context():
+        db.create_all()
+        if args.synthetic is not None:
+            create_synthetic_data(db, args.synthetic, args.attributes, args.seed)
+        characters = load_characters(db, args.games, args.seed)
+
+        print(f"Partidas: {len(characters)} | Ruido: {args.noise:.0%} | Semilla: {args.seed}")
+        print(f"{'Motor':<15} {'Aciertos':>10} {'Rendidas':>9} {'Preguntas':>10} {'p50 ms':>8} {'p95 ms':>8}")
+        for name in args.engines.split(','):
+            engine = GameEngine(
+                scoring=create_scoring_engine(name),
+                # Las partidas simuladas no cuentan en Question.times_asked
+                question_counter=CounterBuffer(lambda counts: None, interval=3600)
+            )
+            stats = play_all(engine, characters, args.noise, args.seed)
+            db.session.rollback()
+            print(f"{name:<15} {stats['correct']:>5}/{stats['games']:<4} {stats['gave_up']:>9} "
+                  f"{stats['avg_questions']:>10.2f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Utilidades de bitsets empaquetados
+Un bitset es un array uint64 donde el bit i (orden little-endian) representa la fila i del modelo
+"""
+import numpy as np
+
+
+WORD_BITS = 64
+
+
+def num_words(size: int) -> int:
+    """Número de palabras uint64 necesarias para `size` bits"""
+    return (size + WORD_BITS - 1) // WORD_BITS
+
+
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    """
+    Empaqueta una máscara booleana a lo largo del último eje
+
+    Args:
+        mask: Array booleano (..., size)
+
+    Returns:
+        Array uint64 (..., num_words(size))
+    """
+    size = mask.shape[-1]
+    padding = num_words(size) * WORD_BITS - size
+    if padding:
+        pad_width = [(0, 0)] * (mask.ndim - 1) + [(0, padding)]
+        mask = np.pad(mask, pad_width)
+    packed = np.packbits(mask, axis=-1, bitorder='little')
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def rows_to_bits(rows: np.ndarray, size: int) -> np.ndarray:
+    """Bitset con los bits de `rows` encendidos"""
+    mask = np.zeros(num_words(size) * WORD_BITS, dtype=bool)
+    mask[rows] = True
+    return np.packbits(mask, bitorder='little').view(np.uint64)
+
+
+def bits_to_rows(bits: np.ndarray, size: int) -> np.ndarray:
+    """Filas (ordenadas) con el bit encendido"""
+    mask = np.unpackbits(bits.view(np.uint8), count=size, bitorder='little')
+    return np.flatnonzero(mask)
+
+
+def popcount(bits: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Cuenta los bits encendidos a lo largo de un eje"""
+    return np.bitwise_count(bits).sum(axis=axis, dtype=np.int64)
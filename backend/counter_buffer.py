@@ -0,0 +1,141 @@
+"""
+Contadores con escritura diferida
+Acumula incrementos en memoria y los escribe en lote con UPDATE atómicos, fuera
+del camino de las respuestas
+"""
+import atexit
+import threading
+from typing import Callable, Dict
+from sqlalchemy import bindparam, update
+from models import db, Question
+
+
+class CounterBuffer:
+    """
+    Buffer de incrementos por clave
+
+    Los incrementos se suman en un dict en memoria. Un hilo daemon los escribe
+    cada `interval` segundos, o antes si hay `max_pending` claves pendientes, y
+    al terminar el proceso se escribe lo que quede. Si la escritura falla, los
+    incrementos vuelven al buffer para el siguiente intento.
+    """
+
+    def __init__(self, flush_fn: Callable[[Dict[int, int]], None],
+                 interval: float = 5.0, max_pending: int = 500):
+        """
+        Args:
+            flush_fn: Escribe un dict {clave: incremento} en la base de datos
+            interval: Segundos máximos entre escrituras
+            max_pending: Claves pendientes que adelantan la escritura
+        """
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.flushed = 0
+        self.errors = 0
+
+    def increment(self, key: int, amount: int = 1):
+        """Suma `amount` a la clave (O(1), sin acceder a la base de datos)"""
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+            full = len(self._pending) >= self.max_pending
+
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Escribe los incrementos pendientes
+
+        Returns:
+            Número de claves escritas
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            try:
+                self.flush_fn(pending)
+            except Exception as e:
+                # Devolver los incrementos al buffer para no perderlos
+                with self._lock:
+                    for key, amount in pending.items():
+                        self._pending[key] = self._pending.get(key, 0) + amount
+                self.errors += 1
+                print(f"Error escribiendo contadores: {e}")
+                return 0
+
+            self.flushes += 1
+            self.flushed += sum(pending.values())
+            return len(pending)
+
+    def get_metrics(self) -> Dict:
+        return {
+            'pending': sum(self._pending.values()),
+            'flushes': self.flushes,
+            'flushed': self.flushed,
+            'errors': self.errors
+        }
+
+    def _start(self):
+        """Arranca el hilo de escritura (con el primer incremento, después del fork)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._flush_loop,
+                name='counter-flusher',
+                daemon=True
+            )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def question_times_asked_writer(app) -> Callable[[Dict[int, int]], None]:
+    """
+    Crea la función de escritura de Question.times_asked
+
+    Ejecuta un único UPDATE ... SET times_asked = times_asked + n por lote
+    (executemany), atómico frente a otros workers.
+
+    Args:
+        app: Aplicación Flask (el hilo de escritura necesita su contexto)
+    """
+    questions = Question.__table__
+    statement = (
+        update(questions)
+        .where(questions.c.id == bindparam('question_id'))
+        .values(times_asked=questions.c.times_asked + bindparam('amount'))
+    )
+
+    def write(counts: Dict[int, int]):
+        with app.app_context():
+            try:
+                db.session.execute(
+                    statement,
+                    [{'question_id': key, 'amount': amount} for key, amount in counts.items()]
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    return write
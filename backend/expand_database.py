@@ -13,6 +13,8 @@ os.chdir(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))
 
 from models import db, Character, Question
 from ai_expansion import AIExpansionSystem
+from learning_system import LearningSystem
+from record_cache import publish_record_changes
 from flask import Flask
 from dotenv import load_dotenv
 
@@ -43,6 +45,7 @@ def init_database():
             # Cargar datos iniciales
             from init_data import initialize_data
             initialize_data(db)
+            LearningSystem().recalculate_system_stats()
             print("✅ Base de datos inicializada\n")
 
 
@@ -214,6 +217,8 @@ def generate_questions(ai_system):
         
         try:
             db.session.commit()
+            LearningSystem().recalculate_system_stats()
+            publish_record_changes(db.session)
             print(f"\n✅ {added} preguntas agregadas exitosamente!")
             if skipped > 0:
                 print(f"⏭️  {skipped} preguntas omitidas (ya existían)")
@@ -2,10 +2,61 @@
 Motor principal del juego Akinator
 Maneja la lógica de partidas, matching de personajes y flujo del juego
 """
+import os
+import threading
+import time
 import uuid
-from typing import Dict, List, Optional, Tuple
-from models import db, Character, Question, CharacterAttribute, GameSession
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from attribute_model import AttributeModel, QuestionRecord
+from bitset import bits_to_rows, rows_to_bits
+from counter_buffer import CounterBuffer
+from model_changes import ChangeFeed, ModelChange
+from models import db, Character, Question, GameSession, LearningTask
+from opening_tree import OpeningTree
 from question_selector import QuestionSelector
+from record_cache import RecordCache, CharacterRecord
+from scoring import ScoringEngine, PointsScoringEngine
+from selection_cache import SelectionCache, NO_QUESTION
+from session_state import SessionState
+from session_token import SessionTokens, InvalidSessionToken
+from session_store import (
+    SessionStore, InMemorySessionStore, SessionCodec, SessionConflictError
+)
+from speculation import Speculator
+
+
+class AnswerOutcome:
+    """
+    Cómo sigue una partida tras una respuesta, antes de resolver registros
+    
+    Se calcula solo con la sesión y su modelo inmutable, así que las ramas
+    especulativas lo producen sin consultar la base de datos ni las cachés.
+    """
+    
+    __slots__ = ('type', 'progress', 'candidates_remaining', 'row', 'question', 'selected')
+    
+    def __init__(self, type: str, progress: int, candidates_remaining: int,
+                 row: Optional[int] = None, question: Optional[QuestionRecord] = None,
+                 selected: bool = False):
+        """
+        Args:
+            type: 'question', 'guess' o 'give_up'
+            progress: Progreso de la partida (0-100)
+            candidates_remaining: Candidatos que quedan
+            row: Fila del personaje adivinado en el modelo de la sesión
+            question: Siguiente pregunta
+            selected: La pregunta se eligió sin la caché de selección y falta guardarla
+        """
+        self.type = type
+        self.progress = progress
+        self.candidates_remaining = candidates_remaining
+        self.row = row
+        self.question = question
+        self.selected = selected
 
 
 class GameEngine:
@@ -25,9 +76,171 @@ class GameEngine:
     MIN_QUESTIONS = 5  # Mínimo de preguntas antes de adivinar
     MAX_QUESTIONS = 30  # Máximo de preguntas
     
-    def __init__(self):
-        self.sessions = {}  # Almacena sesiones activas en memoria
-        self.question_selector = QuestionSelector(db.session)
+    # Segundos mínimos entre recompilaciones del árbol de aperturas
+    OPENING_TREE_MIN_INTERVAL = 30
+    
+    # Modelos recientes que se conservan para restaurar sesiones serializadas
+    MAX_KNOWN_MODELS = 4
+    
+    def __init__(
+        self,
+        scoring: Optional[ScoringEngine] = None,
+        opening_tree_depth: int = 0,
+        opening_tree_path: Optional[str] = None,
+        question_selector: Optional[QuestionSelector] = None,
+        session_store: Optional[SessionStore] = None,
+        question_counter: Optional[CounterBuffer] = None,
+        change_feed: Optional[ChangeFeed] = None,
+        selection_cache: Optional[SelectionCache] = None,
+        speculator: Optional[Speculator] = None,
+        session_tokens: Optional[SessionTokens] = None
+    ):
+        """
+        Args:
+            scoring: Motor de puntuación de candidatos (por defecto el de puntos)
+            opening_tree_depth: Niveles del árbol de aperturas a compilar en
+                segundo plano (0 = no compilar)
+            opening_tree_path: Artefacto precompilado a cargar (opcional)
+            question_selector: Selector de preguntas (por defecto greedy sobre db.session)
+            session_store: Almacenamiento de sesiones (por defecto en memoria del proceso)
+            question_counter: Buffer de escritura diferida de Question.times_asked
+                (por defecto se actualiza en cada respuesta)
+            change_feed: Canal para avisar y recibir modelos nuevos de otros
+                workers (por defecto cada worker solo ve sus propios cambios)
+            selection_cache: Caché de preguntas elegidas por camino de
+                respuestas (por defecto se calcula cada selección)
+            speculator: Pool que precalcula el resultado de cada respuesta
+                posible mientras el jugador lee la pregunta (por defecto no especula)
+            session_tokens: Tokens firmados que llevan el estado de la partida
+                en el cliente en lugar de session_store (por defecto sesiones guardadas)
+        """
+        self.question_selector = question_selector or QuestionSelector(db.session)
+        self.scoring = scoring or PointsScoringEngine()
+        self.records = RecordCache(db.session)
+        self.question_counter = question_counter
+        self.selection_cache = selection_cache
+        self.speculator = speculator
+        
+        # Difusión de modelos nuevos entre workers
+        self.change_feed = change_feed
+        self._broadcast_records_version = self.records.version
+        if change_feed is not None:
+            change_feed.subscribe(self._apply_remote_change)
+        
+        # Sesiones activas; los backends que serializan usan el codec binario
+        self.session_store = session_store or InMemorySessionStore()
+        if self.session_store.codec is None:
+            self.session_store.codec = SessionCodec(
+                self._model_for,
+                self._opening_tree_for,
+                self._rebuild_session
+            )
+        self._known_models = OrderedDict()  # huella -> AttributeModel
+        
+        # Sin sesiones guardadas: el estado viaja en un token firmado
+        self.session_tokens = session_tokens
+        if session_tokens is not None:
+            session_tokens.model_for = self._model_for
+            session_tokens.tree_for = self._opening_tree_for
+            session_tokens.rebuild = self._rebuild_session
+        self.session_conflicts = 0
+        
+        # Construcción del modelo en segundo plano (cambios pendientes agrupados)
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self._refresh_dirty = False
+        self._refresh_characters = set()
+        self._refresh_full = False
+        
+        # Árbol de aperturas
+        self.opening_tree = None
+        self.opening_tree_depth = opening_tree_depth
+        self._tree_lock = threading.Lock()
+        self._tree_thread = None
+        self._tree_dirty = False
+        self._tree_compiled_at = 0.0
+        
+        if opening_tree_path and os.path.exists(opening_tree_path):
+            try:
+                self.opening_tree = OpeningTree.load(opening_tree_path)
+            except ValueError as e:
+                # Artefacto de un formato anterior: se recompila en segundo plano si hay profundidad
+                print(f"Árbol de aperturas ignorado ({opening_tree_path}): {e}")
+    
+    def refresh_model(self, character_ids: Optional[Iterable[int]] = None,
+                      broadcast: bool = True) -> AttributeModel:
+        """
+        Publica un modelo de atributos nuevo tras escrituras en la base de datos
+        
+        Las partidas en curso conservan el modelo con el que empezaron.
+        
+        Args:
+            character_ids: IDs de personajes modificados; con ellos el modelo se
+                construye como delta del actual (None = reconstrucción completa)
+            broadcast: Avisar el cambio a los demás workers por change_feed
+        """
+        if character_ids is not None:
+            character_ids = sorted(set(character_ids))
+        model = self.question_selector.refresh_model(character_ids)
+        if self.opening_tree_depth > 0:
+            self._schedule_opening_tree()
+        
+        if broadcast and self.change_feed is not None:
+            # La caché de registros se invalidó aquí (p. ej. personaje nuevo): los demás también
+            records_version = self.records.version
+            records_changed = records_version != self._broadcast_records_version
+            self._broadcast_records_version = records_version
+            self.change_feed.publish(model.version, character_ids, records_changed)
+        return model
+    
+    def _apply_remote_change(self, change: ModelChange):
+        """Aplica el modelo nuevo que publicó otro worker (mismo delta, sin reenviarlo)"""
+        if change.records:
+            self.records.invalidate()
+            self._broadcast_records_version = self.records.version
+        self.refresh_model(change.character_ids, broadcast=False)
+    
+    def schedule_model_refresh(self, character_ids: Optional[Iterable[int]] = None):
+        """
+        Programa refresh_model en segundo plano, sin bloquear la petición
+        
+        Los cambios que llegan durante una construcción se agrupan en la siguiente.
+        Debe llamarse dentro del contexto de la aplicación.
+        """
+        app = current_app._get_current_object()
+        with self._refresh_lock:
+            if character_ids is None:
+                self._refresh_full = True
+            else:
+                self._refresh_characters.update(character_ids)
+            self._refresh_dirty = True
+            if self._refresh_thread is not None:
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._model_refresh_worker,
+                args=(app,),
+                name='model-builder',
+                daemon=True
+            )
+            self._refresh_thread.start()
+    
+    def _model_refresh_worker(self, app):
+        """Construye y publica modelos mientras haya cambios pendientes"""
+        while True:
+            with self._refresh_lock:
+                if not self._refresh_dirty:
+                    self._refresh_thread = None
+                    return
+                character_ids = None if self._refresh_full else self._refresh_characters
+                self._refresh_characters = set()
+                self._refresh_full = False
+                self._refresh_dirty = False
+            
+            try:
+                with app.app_context():
+                    self.refresh_model(character_ids)
+            except Exception as e:
+                print(f"Error construyendo el modelo: {e}")
     
     def start_game(self) -> Dict:
         """
@@ -38,37 +251,98 @@ class GameEngine:
         """
         session_id = str(uuid.uuid4())
         
-        # Obtener todos los personajes como candidatos iniciales
-        all_characters = db.session.query(Character).all()
-        candidate_ids = [char.id for char in all_characters]
-        
-        # Inicializar estado de la sesión
-        self.sessions[session_id] = {
-            'candidate_ids': candidate_ids,
-            'candidate_scores': {char_id: 0 for char_id in candidate_ids},
-            'asked_questions': set(),
-            'answers': {},
-            'question_count': 0
-        }
+        # La partida usa el modelo vigente al empezar; todos los personajes son candidatos
+        model = self._current_model()
+        session = SessionState.new(model, self.scoring)
+        session.opening_tree = self._opening_tree_for(model)
         
         # Obtener primera pregunta
-        first_question = self.question_selector.select_best_question(
-            candidate_ids,
-            set(),
-            {}
-        )
+        first_question = self._select_next_question(session)
         
         if not first_question:
             return {'error': 'No hay preguntas disponibles'}
         
-        return {
+        if self.session_tokens is not None:
+            # El token hace de versión: la especulación solo sirve para ese token
+            version = self.session_tokens.issue(session_id, session)
+        else:
+            version = self.session_store.create(session_id, session)
+        self._speculate(session_id, session, version, first_question.id)
+        
+        result = {
             'session_id': session_id,
             'question': first_question.to_dict(),
             'progress': 0,
-            'candidates_remaining': len(candidate_ids)
+            'candidates_remaining': model.num_characters
         }
+        if self.session_tokens is not None:
+            result['session_token'] = version
+        return result
+    
+    def _current_model(self) -> AttributeModel:
+        """Modelo vigente, registrado por huella para restaurar sesiones"""
+        model = self.question_selector.model
+        fingerprint = model.fingerprint
+        if fingerprint not in self._known_models:
+            self._known_models[fingerprint] = model
+            while len(self._known_models) > self.MAX_KNOWN_MODELS:
+                self._known_models.popitem(last=False)
+        return model
+    
+    def _model_for(self, fingerprint: str) -> Optional[AttributeModel]:
+        """Modelo con una huella dada, si este proceso lo conoce"""
+        model = self._known_models.get(fingerprint)
+        if model is None and self._current_model().fingerprint == fingerprint:
+            model = self._current_model()
+        return model
+    
+    def _rebuild_session(self, question_ids: np.ndarray, answer_values: np.ndarray,
+                         model: Optional[AttributeModel] = None) -> SessionState:
+        """
+        Reconstruye una sesión reproduciendo sus respuestas sobre un modelo
+        
+        Sin modelo se usa el actual: la sesión se creó con un modelo que este
+        proceso no conoce (por ejemplo, otro worker lo actualizó tras aprender de
+        una partida). Los tokens de sesión pasan el modelo de su huella.
+        """
+        if model is None:
+            model = self._current_model()
+        session = SessionState.new(model, self.scoring)
+        for question_id, answer_value in zip(question_ids.tolist(), answer_values.tolist()):
+            session.record_answer(question_id, answer_value)
+            attribute_key = self._attribute_key(model, question_id)
+            if attribute_key is not None:
+                candidate_rows = self._candidate_rows(session)
+                self._update_candidate_scores(session, candidate_rows, attribute_key, answer_value)
+                self._apply_filter(session, candidate_rows)
+        return session
+    
+    def _load_session(self, session_id: str,
+                      session_token: Optional[str] = None) -> Optional[Tuple[SessionState, Union[int, str]]]:
+        """
+        Carga el estado de una partida y su versión
+        
+        Con tokens de sesión el estado sale del token, que hace de versión; si
+        no es válido para la sesión, la partida no se encuentra.
+        """
+        if self.session_tokens is None:
+            return self.session_store.load(session_id)
+        if not session_token:
+            return None
+        try:
+            return self.session_tokens.load(session_id, session_token), session_token
+        except InvalidSessionToken:
+            return None
+    
+    def _attribute_key(self, model: AttributeModel, question_id: int) -> Optional[str]:
+        """Atributo de una pregunta, desde el modelo o (si no la conoce) la caché de registros"""
+        question = model.get_question(question_id)
+        if question is None:
+            question = self.records.question(question_id)
+        return question.attribute_key if question else None
     
-    def process_answer(self, session_id: str, question_id: int, answer: str) -> Dict:
+    def process_answer(self, session_id: str, question_id: int, answer: str,
+                       session_token: Optional[str] = None) -> Dict:
         """
         Procesa una respuesta y devuelve la siguiente pregunta o adivinanza
         
@@ -76,206 +350,461 @@ class GameEngine:
             session_id: ID de la sesión
             question_id: ID de la pregunta respondida
             answer: Respuesta del usuario ('yes', 'probably_yes', etc.)
+            session_token: Token de la última respuesta (solo con tokens de sesión)
         
         Returns:
             Dict con siguiente pregunta o adivinanza
         """
-        if session_id not in self.sessions:
+        loaded = self._load_session(session_id, session_token)
+        if loaded is None:
             return {'error': 'Sesión no encontrada'}
         
-        session = self.sessions[session_id]
+        session, version = loaded
         
-        # Obtener pregunta
-        question = db.session.query(Question).get(question_id)
+        # Obtener pregunta (registro cacheado, sin hidratar el ORM)
+        question = self.records.question(question_id)
         if not question:
             return {'error': 'Pregunta no encontrada'}
         
         # Convertir respuesta a valor numérico
         answer_value = self.ANSWER_VALUES.get(answer, 0)
         
-        # Actualizar estado de la sesión
-        session['asked_questions'].add(question_id)
-        session['answers'][question.attribute_key] = answer_value
-        session['question_count'] += 1
+        # Resultado precalculado mientras el jugador leía la pregunta, si lo hay
+        speculated = None
+        if self.speculator is not None:
+            speculated = self.speculator.take(session_id, version, question_id, answer_value)
+        if speculated is not None:
+            outcome, session = speculated
+            result = self._outcome_result(session_id, session, outcome)
+        else:
+            result = self._apply_answer(session_id, session, question, answer_value)
+        
+        return self._finish_answers(session_id, session, version, result, [question_id])
+    
+    def process_answers(self, session_id: str, answers: List[Tuple[int, str]],
+                        session_token: Optional[str] = None) -> Dict:
+        """
+        Procesa una secuencia de respuestas en una sola petición
+        
+        El resultado es el mismo que enviarlas de a una con process_answer: si
+        una respuesta intermedia termina la partida (adivinanza o rendición),
+        las siguientes se ignoran, como haría un cliente secuencial. La
+        siguiente pregunta se selecciona una sola vez, al final, y la sesión se
+        guarda una sola vez. El lote es atómico: si alguna pregunta no existe no
+        se aplica ninguna respuesta.
+        
+        Args:
+            session_id: ID de la sesión
+            answers: Pares (question_id, respuesta) en orden
+            session_token: Token de la última respuesta (solo con tokens de sesión)
+        
+        Returns:
+            Dict con siguiente pregunta o adivinanza y answers_applied
+        """
+        if not answers:
+            return {'error': 'No hay respuestas que procesar'}
+        
+        loaded = self._load_session(session_id, session_token)
+        if loaded is None:
+            return {'error': 'Sesión no encontrada'}
+        
+        session, version = loaded
+        
+        questions = [self.records.question(question_id) for question_id, _ in answers]
+        if not all(questions):
+            return {'error': 'Pregunta no encontrada'}
         
-        # Actualizar estadísticas de la pregunta
-        question.times_asked += 1
-        db.session.commit()
+        applied = []
+        for question, (question_id, answer) in zip(questions, answers):
+            answer_value = self.ANSWER_VALUES.get(answer, 0)
+            select_next = len(applied) == len(answers) - 1
+            result = self._apply_answer(session_id, session, question, answer_value, select_next)
+            applied.append(question_id)
+            if result is not None:
+                break
+        
+        result = self._finish_answers(session_id, session, version, result, applied)
+        if 'error' not in result:
+            result['answers_applied'] = len(applied)
+        return result
+    
+    def _finish_answers(self, session_id: str, session: SessionState, version: Union[int, str],
+                        result: Dict, question_ids: List[int]) -> Dict:
+        """
+        Guarda la sesión tras aplicar respuestas y cuenta las preguntas respondidas
+        
+        Con tokens de sesión no se guarda nada: el resultado lleva el token nuevo.
+        
+        Returns:
+            El resultado, o un error si otra petición modificó la sesión
+        """
+        if self.session_tokens is not None:
+            if result['type'] != 'give_up':
+                try:
+                    token = self.session_tokens.issue(session_id, session)
+                except InvalidSessionToken as e:
+                    return {'error': str(e)}
+                result['session_token'] = token
+                if result['type'] == 'question':
+                    self._speculate(session_id, session, token, result['question']['id'])
+        elif result['type'] == 'give_up':
+            # La partida terminó sin adivinanza que confirmar: liberar la sesión
+            if not self.session_store.delete(session_id, version):
+                self.session_conflicts += 1
+                return {'error': 'La sesión fue modificada por otra petición'}
+        else:
+            # Guardar la sesión solo si ninguna otra petición la modificó mientras tanto
+            try:
+                new_version = self.session_store.save(session_id, session, version)
+            except SessionConflictError:
+                self.session_conflicts += 1
+                return {'error': 'La sesión fue modificada por otra petición'}
+            if result['type'] == 'question':
+                self._speculate(session_id, session, new_version, result['question']['id'])
+        
+        # Actualizar estadísticas de las preguntas (diferido en lote si hay buffer)
+        for question_id, amount in Counter(question_ids).items():
+            if self.question_counter is not None:
+                self.question_counter.increment(question_id, amount)
+            else:
+                db.session.query(Question).filter(Question.id == question_id).update(
+                    {Question.times_asked: Question.times_asked + amount},
+                    synchronize_session=False
+                )
+        if self.question_counter is None:
+            db.session.commit()
+        
+        return result
+    
+    def _speculate(self, session_id: str, session: SessionState, version: Union[int, str],
+                   question_id: int):
+        """
+        Programa el cálculo de cada respuesta posible a la pregunta servida
+        
+        Cada rama trabaja sobre una copia de la sesión guardada, así que el
+        resultado es el mismo que calcularía process_answer. Debe llamarse
+        dentro del contexto de la aplicación.
+        
+        Las ramas son cálculo puro sobre la sesión y su modelo inmutable (con
+        gevent corren en hilos nativos, que no deben usar los sockets ni los
+        locks del loop del worker): la pregunta se resuelve aquí, y la caché de
+        selección y los registros de personajes se usan al tomar la rama en
+        process_answer.
+        """
+        if self.speculator is None:
+            return
+        question = self.records.question(question_id)
+        if question is None:
+            return
+        
+        def branch(answer_value: int):
+            branch_session = session.copy()
+            outcome = self._answer_outcome(branch_session, question, answer_value, speculative=True)
+            return outcome, branch_session
+        
+        self.speculator.schedule(session_id, version, question_id, branch, self.ANSWER_VALUES.values())
+    
+    def _apply_answer(self, session_id: str, session: SessionState, question: QuestionRecord,
+                      answer_value: int, select_next: bool = True) -> Optional[Dict]:
+        """
+        Aplica una respuesta al estado de la sesión
+        
+        Args:
+            select_next: Seleccionar la siguiente pregunta; con False (respuestas
+                intermedias de un lote) solo se comprueba si la partida termina
+        
+        Returns:
+            Dict con siguiente pregunta o adivinanza, o None si select_next es
+            False y la partida sigue
+        """
+        outcome = self._answer_outcome(session, question, answer_value, select_next)
+        if outcome is None:
+            return None
+        return self._outcome_result(session_id, session, outcome)
+    
+    def _answer_outcome(self, session: SessionState, question: QuestionRecord, answer_value: int,
+                        select_next: bool = True, speculative: bool = False) -> Optional[AnswerOutcome]:
+        """
+        Aplica una respuesta y decide cómo sigue la partida, sin resolver registros
+        
+        Args:
+            select_next: Seleccionar la siguiente pregunta (ver _apply_answer)
+            speculative: Seleccionar sin la caché de selección; la pregunta
+                elegida se guarda en ella al tomar la rama (ver _outcome_result)
+        
+        Returns:
+            AnswerOutcome, o None si select_next es False y la partida sigue
+        """
+        # Actualizar estado de la sesión
+        self._advance_tree_path(session, question.id)
+        session.record_answer(question.id, answer_value)
         
         # Actualizar puntuaciones de candidatos
-        self._update_candidate_scores(session, question.attribute_key, answer_value)
+        candidate_rows = self._candidate_rows(session)
+        self._update_candidate_scores(session, candidate_rows, question.attribute_key, answer_value)
         
         # Filtrar candidatos con puntuación muy baja
-        session['candidate_ids'] = self._filter_candidates(session)
+        candidate_rows = self._apply_filter(session, candidate_rows)
         
         # Calcular progreso
-        progress = min(int((session['question_count'] / self.MAX_QUESTIONS) * 100), 100)
+        progress = min(int((session.question_count / self.MAX_QUESTIONS) * 100), 100)
         
         # Verificar si debemos hacer una adivinanza
-        should_guess, top_character = self._should_make_guess(session)
+        should_guess, top_character = self._should_make_guess(session, candidate_rows)
         
         if should_guess:
-            character = db.session.query(Character).get(top_character)
+            return AnswerOutcome('guess', progress, len(candidate_rows), row=top_character)
+        
+        # Si llegamos al máximo de preguntas, adivinar el mejor candidato
+        if session.question_count >= self.MAX_QUESTIONS:
+            if len(candidate_rows):
+                best_candidate = self.scoring.best_candidate(session, candidate_rows)
+                return AnswerOutcome('guess', 100, len(candidate_rows), row=best_candidate)
+            return AnswerOutcome('give_up', 100, 0)
+        
+        # Obtener siguiente pregunta
+        selected = False
+        if not select_next:
+            if self._has_next_question(session):
+                return None
+            next_question = None
+        elif speculative:
+            next_question = self._tree_question(session)
+            if next_question is None:
+                next_question = self._dynamic_question(session)
+                selected = True
+        else:
+            next_question = self._select_next_question(session)
+        
+        if not next_question and len(candidate_rows):
+            # No hay más preguntas, hacer mejor adivinanza posible
+            best_candidate = self.scoring.best_candidate(session, candidate_rows)
+            return AnswerOutcome('guess', progress, len(candidate_rows), row=best_candidate, selected=selected)
+        
+        return AnswerOutcome('question', progress, len(candidate_rows), question=next_question, selected=selected)
+    
+    def _outcome_result(self, session_id: str, session: SessionState, outcome: AnswerOutcome) -> Dict:
+        """
+        Respuesta de la API para un AnswerOutcome
+        
+        Resuelve el registro del personaje adivinado y, si la pregunta se
+        eligió en una rama especulativa, la guarda en la caché de selección.
+        """
+        if outcome.selected and self.selection_cache is not None:
+            question = outcome.question
+            self.selection_cache.put(
+                self._selection_key(session),
+                question.id if question else NO_QUESTION
+            )
+        
+        if outcome.type == 'guess':
+            character = self._get_character(session, outcome.row)
             return {
                 'session_id': session_id,
                 'type': 'guess',
                 'character': character.to_dict(),
-                'progress': progress,
-                'question_count': session['question_count']
+                'progress': outcome.progress,
+                'question_count': session.question_count
             }
         
-        # Si llegamos al máximo de preguntas, adivinar el mejor candidato
-        if session['question_count'] >= self.MAX_QUESTIONS:
-            if session['candidate_ids']:
-                best_candidate = max(
-                    session['candidate_ids'],
-                    key=lambda cid: session['candidate_scores'][cid]
-                )
-                character = db.session.query(Character).get(best_candidate)
-                return {
-                    'session_id': session_id,
-                    'type': 'guess',
-                    'character': character.to_dict(),
-                    'progress': 100,
-                    'question_count': session['question_count']
-                }
-            else:
-                return {
-                    'session_id': session_id,
-                    'type': 'give_up',
-                    'message': 'No pude adivinar tu personaje',
-                    'progress': 100
-                }
-        
-        # Obtener siguiente pregunta
-        next_question = self.question_selector.select_best_question(
-            session['candidate_ids'],
-            session['asked_questions'],
-            session['answers']
-        )
-        
-        if not next_question:
-            # No hay más preguntas, hacer mejor adivinanza posible
-            if session['candidate_ids']:
-                best_candidate = max(
-                    session['candidate_ids'],
-                    key=lambda cid: session['candidate_scores'][cid]
-                )
-                character = db.session.query(Character).get(best_candidate)
-                return {
-                    'session_id': session_id,
-                    'type': 'guess',
-                    'character': character.to_dict(),
-                    'progress': progress,
-                    'question_count': session['question_count']
-                }
+        if outcome.type == 'give_up':
+            return {
+                'session_id': session_id,
+                'type': 'give_up',
+                'message': 'No pude adivinar tu personaje',
+                'progress': outcome.progress
+            }
         
         return {
             'session_id': session_id,
             'type': 'question',
-            'question': next_question.to_dict(),
-            'progress': progress,
-            'candidates_remaining': len(session['candidate_ids']),
-            'question_count': session['question_count']
+            'question': outcome.question.to_dict(),
+            'progress': outcome.progress,
+            'candidates_remaining': outcome.candidates_remaining,
+            'question_count': session.question_count
         }
     
-    def _update_candidate_scores(self, session: Dict, attribute_key: str, answer_value: int):
-        """Actualiza las puntuaciones de los candidatos basado en la respuesta"""
-        # Obtener atributos de todos los candidatos para esta clave
-        attributes = db.session.query(CharacterAttribute).filter(
-            CharacterAttribute.character_id.in_(session['candidate_ids']),
-            CharacterAttribute.attribute_key == attribute_key
-        ).all()
-        
-        # Crear mapa de valores
-        attr_map = {attr.character_id: attr.value for attr in attributes}
-        
-        # Actualizar puntuaciones
-        for char_id in session['candidate_ids']:
-            char_value = attr_map.get(char_id, 0)  # Default "No sé"
-            
-            # Calcular diferencia absoluta
-            diff = abs(char_value - answer_value)
-            
-            # Puntuación: menor diferencia = mayor puntuación
-            # Diferencia 0 = +4 puntos
-            # Diferencia 1 = +2 puntos
-            # Diferencia 2 = 0 puntos
-            # Diferencia 3 = -2 puntos
-            # Diferencia 4 = -4 puntos
-            score_change = 4 - (diff * 2)
-            session['candidate_scores'][char_id] += score_change
-    
-    def _filter_candidates(self, session: Dict) -> List[int]:
-        """Filtra candidatos con puntuación muy baja"""
-        if not session['candidate_ids']:
-            return []
-        
-        # Obtener puntuación máxima
-        max_score = max(session['candidate_scores'].values())
-        
-        # Mantener candidatos dentro de un rango razonable del máximo
-        threshold = max_score - 10  # Tolerancia de 10 puntos
-        
-        filtered = [
-            char_id for char_id in session['candidate_ids']
-            if session['candidate_scores'][char_id] >= threshold
-        ]
-        
-        # Siempre mantener al menos el top 5
-        if len(filtered) < 5 and len(session['candidate_ids']) >= 5:
-            sorted_candidates = sorted(
-                session['candidate_ids'],
-                key=lambda cid: session['candidate_scores'][cid],
-                reverse=True
-            )
-            filtered = sorted_candidates[:5]
+    def _select_next_question(self, session: SessionState) -> Optional[QuestionRecord]:
+        """
+        Selecciona la siguiente pregunta de la sesión
         
-        return filtered if filtered else session['candidate_ids']
+        Mientras el camino de respuestas esté dentro del árbol de aperturas la
+        pregunta se obtiene en O(1); fuera de él se usa la selección dinámica.
+        """
+        question = self._tree_question(session)
+        if question is not None:
+            return question
+        
+        cache = self.selection_cache
+        if cache is not None:
+            key = self._selection_key(session)
+            question_id = cache.get(key)
+            if question_id is not None:
+                return session.model.get_question(question_id) if question_id != NO_QUESTION else None
+        
+        question = self._dynamic_question(session)
+        
+        if cache is not None:
+            cache.put(key, question.id if question else NO_QUESTION)
+        return question
     
-    def _should_make_guess(self, session: Dict) -> Tuple[bool, Optional[int]]:
+    def _dynamic_question(self, session: SessionState) -> Optional[QuestionRecord]:
+        """Pregunta de mayor ganancia para los candidatos de la sesión (cálculo puro)"""
+        return self.question_selector.select_best_question_from_histograms(
+            session.histograms,
+            session.asked_questions,
+            session.model,
+            session.candidates
+        )
+    
+    def _selection_key(self, session: SessionState) -> str:
+        """Clave de la caché de selección: el estado depende solo del modelo y del camino"""
+        return self.selection_cache.key(
+            session.model.fingerprint,
+            self.selection_namespace(),
+            session.question_ids,
+            session.answer_values
+        )
+    
+    def _tree_question(self, session: SessionState) -> Optional[QuestionRecord]:
+        """Pregunta del árbol de aperturas para la sesión (sale del árbol si ya no sirve)"""
+        tree = session.opening_tree
+        if tree is not None:
+            question_id = tree.question_for(session.tree_path)
+            if question_id is not None and not session.has_asked(question_id):
+                return session.model.get_question(question_id)
+            session.opening_tree = None
+        return None
+    
+    def _has_next_question(self, session: SessionState) -> bool:
+        """Si _select_next_question devolvería una pregunta, sin calcular cuál"""
+        if self._tree_question(session) is not None:
+            return True
+        available = session.model.available_question_indices(session.asked_questions)
+        return session.histograms.total > 0 and len(available) > 0
+    
+    def selection_namespace(self) -> str:
         """
-        Determina si debemos hacer una adivinanza
+        Configuración que cambia la pregunta elegida para un mismo camino
         
-        Returns:
-            (should_guess, character_id)
+        La comparten la caché de selecciones y el árbol de aperturas.
         """
-        if session['question_count'] < self.MIN_QUESTIONS:
-            return False, None
+        return f'{self.scoring.name}:{self.question_selector.lookahead_top_k}'
+    
+    def _advance_tree_path(self, session: SessionState, question_id: int):
+        """
+        Sale del árbol de aperturas si la pregunta respondida no es la que sirvió
         
-        if not session['candidate_ids']:
-            return False, None
+        Mientras se sigue el árbol, su camino son los valores respondidos, así que
+        registrar la respuesta ya lo avanza.
+        """
+        tree = session.opening_tree
+        if tree is not None and tree.question_for(session.tree_path) != question_id:
+            session.opening_tree = None
+    
+    def _opening_tree_for(self, model: AttributeModel) -> Optional[OpeningTree]:
+        """Devuelve el árbol de aperturas si es válido para el modelo, o programa su compilación"""
+        tree = self.opening_tree
+        if tree is not None and tree.matches(model, self.selection_namespace()):
+            return tree
+        
+        if self.opening_tree_depth > 0:
+            self._schedule_opening_tree()
+        return None
+    
+    def _schedule_opening_tree(self):
+        """Programa la compilación del árbol de aperturas en segundo plano"""
+        with self._tree_lock:
+            self._tree_dirty = True
+            if self._tree_thread is not None:
+                return
+            self._tree_thread = threading.Thread(
+                target=self._opening_tree_worker,
+                name='opening-tree-compiler',
+                daemon=True
+            )
+            self._tree_thread.start()
+    
+    def _opening_tree_worker(self):
+        """
+        Compila el árbol para el modelo actual
         
-        # Obtener top candidato
-        top_candidate = max(
-            session['candidate_ids'],
-            key=lambda cid: session['candidate_scores'][cid]
+        Las solicitudes que llegan durante una compilación se agrupan en una sola
+        recompilación, como mínimo OPENING_TREE_MIN_INTERVAL segundos después.
+        """
+        while True:
+            with self._tree_lock:
+                if not self._tree_dirty:
+                    self._tree_thread = None
+                    return
+                self._tree_dirty = False
+            
+            wait = self._tree_compiled_at + self.OPENING_TREE_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            
+            model = self.question_selector.model
+            try:
+                self.opening_tree = OpeningTree.compile(
+                    model,
+                    self.question_selector,
+                    self.scoring,
+                    self.opening_tree_depth,
+                    self.MIN_QUESTIONS,
+                    self.selection_namespace()
+                )
+            except Exception as e:
+                print(f"Error compilando árbol de aperturas: {e}")
+            self._tree_compiled_at = time.monotonic()
+    
+    def _candidate_rows(self, session: SessionState) -> np.ndarray:
+        """Filas candidatas (ordenadas) a partir del bitset de la sesión"""
+        return bits_to_rows(session.candidates, session.model.num_characters)
+    
+    def _apply_filter(self, session: SessionState, candidate_rows: np.ndarray) -> np.ndarray:
+        """Filtra candidatos y actualiza el bitset y los histogramas de la sesión"""
+        filtered_rows = self._filter_candidates(session, candidate_rows)
+        if len(filtered_rows) == len(candidate_rows):
+            return candidate_rows
+        
+        model = session.model
+        filtered_bits = rows_to_bits(filtered_rows, model.num_characters)
+        session.histograms.update(
+            model, candidate_rows, filtered_rows, session.candidates, filtered_bits
         )
-        top_score = session['candidate_scores'][top_candidate]
-        
-        # Calcular confianza relativa
-        other_scores = [
-            session['candidate_scores'][cid]
-            for cid in session['candidate_ids']
-            if cid != top_candidate
-        ]
-        
-        if not other_scores:
-            return True, top_candidate
-        
-        avg_other_score = sum(other_scores) / len(other_scores)
-        
-        # Si el top está significativamente por encima del resto
-        if top_score > avg_other_score + 8:  # 8 puntos de ventaja
-            return True, top_candidate
+        session.candidates = filtered_bits
+        return filtered_rows
+    
+    def _update_candidate_scores(self, session: SessionState, candidate_rows: np.ndarray,
+                                 attribute_key: str, answer_value: int):
+        """Actualiza las puntuaciones de los candidatos basado en la respuesta"""
+        col = session.model.key_to_col.get(attribute_key)
+        if col is None:
+            # Atributo desconocido para el modelo de la partida: no aporta información
+            return
         
-        # Si solo queda un candidato
-        if len(session['candidate_ids']) == 1:
-            return True, top_candidate
+        self.scoring.update_scores(session, candidate_rows, col, answer_value)
+    
+    def _filter_candidates(self, session: SessionState, candidate_rows: np.ndarray) -> np.ndarray:
+        """Filtra candidatos con puntuación muy baja"""
+        return self.scoring.filter_candidates(session, candidate_rows)
+    
+    def _should_make_guess(self, session: SessionState, candidate_rows: np.ndarray) -> Tuple[bool, Optional[int]]:
+        """
+        Determina si debemos hacer una adivinanza
         
-        return False, None
+        Returns:
+            (should_guess, fila del candidato en el modelo)
+        """
+        return self.scoring.should_make_guess(session, candidate_rows, self.MIN_QUESTIONS)
+    
+    def _get_character(self, session: SessionState, row: int) -> Optional[CharacterRecord]:
+        """Obtiene el personaje correspondiente a una fila del modelo de la sesión"""
+        character_id = int(session.model.character_ids[row])
+        return self.records.character(character_id)
     
-    def confirm_guess(self, session_id: str, character_id: int, correct: bool) -> Dict:
+    def confirm_guess(self, session_id: str, character_id: int, correct: bool,
+                      session_token: Optional[str] = None) -> Dict:
         """
         Confirma si la adivinanza fue correcta
         
@@ -283,44 +812,95 @@ class GameEngine:
             session_id: ID de la sesión
             character_id: ID del personaje adivinado
             correct: Si la adivinanza fue correcta
+            session_token: Token de la adivinanza (solo con tokens de sesión)
         
         Returns:
             Dict con resultado y estadísticas
         """
-        if session_id not in self.sessions:
+        loaded = self._load_session(session_id, session_token)
+        if loaded is None:
             return {'error': 'Sesión no encontrada'}
         
-        session = self.sessions[session_id]
+        session, version = loaded
+        
+        # Reclamar la sesión: si otra petición ya la confirmó, no se registra dos veces
+        # (con tokens no hay nada que borrar; lo impide el session_id único de GameSession)
+        if self.session_tokens is None and not self.session_store.delete(session_id, version):
+            self.session_conflicts += 1
+            return {'error': 'Sesión no encontrada'}
         
         # Guardar sesión en base de datos
         game_session = GameSession(
             session_id=session_id,
             guessed_character_id=character_id,
             success=correct,
-            questions_asked=list(session['asked_questions']),
-            answers_given=session['answers'],
-            num_questions=session['question_count']
+            questions_asked=list(dict.fromkeys(session.question_ids.tolist())),
+            answers_given=self._answers_by_key(session),
+            num_questions=session.question_count
         )
-        db.session.add(game_session)
-        
-        # Actualizar estadísticas del personaje
-        character = db.session.query(Character).get(character_id)
-        if character:
-            character.times_played += 1
-            if correct:
-                character.times_guessed += 1
         
-        db.session.commit()
-        
-        # Limpiar sesión
-        del self.sessions[session_id]
+        try:
+            db.session.add(game_session)
+            
+            # Encolar el aprendizaje en la misma transacción: toda partida confirmada queda en la cola
+            db.session.add(LearningTask(session_id=session_id))
+            
+            # Actualizar estadísticas del personaje (incremento atómico en la base de datos)
+            db.session.query(Character).filter(Character.id == character_id).update(
+                {
+                    Character.times_played: Character.times_played + 1,
+                    Character.times_guessed: Character.times_guessed + (1 if correct else 0)
+                },
+                synchronize_session=False
+            )
+            
+            db.session.commit()
+        except IntegrityError:
+            # Token ya confirmado (repetición del mismo token)
+            db.session.rollback()
+            self.session_conflicts += 1
+            return {'error': 'Sesión no encontrada'}
         
         return {
             'success': correct,
             'message': '¡Genial! Adiviné correctamente' if correct else 'Vaya, fallé esta vez',
-            'questions_used': session['question_count']
+            'questions_used': session.question_count
+        }
+    
+    def _answers_by_key(self, session: SessionState) -> Dict[str, int]:
+        """Respuestas de la sesión indexadas por atributo (la última respuesta de cada uno)"""
+        answers = {}
+        for question_id, answer_value in zip(session.question_ids.tolist(),
+                                             session.answer_values.tolist()):
+            attribute_key = self._attribute_key(session.model, question_id)
+            if attribute_key is not None:
+                answers[attribute_key] = answer_value
+        return answers
+    
+    def get_metrics(self) -> Dict:
+        """
+        Métricas del motor de juego
+        
+        Returns:
+            Dict con métricas de selección de preguntas y de sesiones
+        """
+        return {
+            'model': self.question_selector.get_model_stats(),
+            'model_changes': self.change_feed.get_metrics() if self.change_feed else None,
+            'lookahead': self.question_selector.get_lookahead_stats(),
+            'records': self.records.get_metrics(),
+            'selection_cache': self.selection_cache.get_metrics() if self.selection_cache else None,
+            'speculation': self.speculator.get_metrics() if self.speculator else None,
+            'session_tokens': self.session_tokens.get_metrics() if self.session_tokens else None,
+            'question_counter': self.question_counter.get_metrics() if self.question_counter else None,
+            'sessions': {
+                **self.session_store.get_metrics(),
+                'conflicts': self.session_conflicts
+            }
         }
     
-    def get_session_info(self, session_id: str) -> Optional[Dict]:
+    def get_session_info(self, session_id: str,
+                         session_token: Optional[str] = None) -> Optional[SessionState]:
         """Obtiene información de una sesión activa"""
-        return self.sessions.get(session_id)
+        loaded = self._load_session(session_id, session_token)
+        return loaded[0] if loaded else None
@@ -0,0 +1,404 @@
+"""
+Partidas por Server-Sent Events
+Un canal persistente por partida: el servidor empuja preguntas y adivinanzas
+por un stream SSE y el cliente envía las respuestas con un POST mínimo, sin
+abrir una petición completa con JSON de ida y vuelta por cada respuesta
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, Optional
+from models import db
+
+
+class _Timing:
+    """Tiempos acumulados de una operación (ms)"""
+
+    __slots__ = ('count', 'total_ms', 'last_ms', 'max_ms')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float):
+        elapsed_ms = seconds * 1000.0
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'last_ms': round(self.last_ms, 2),
+            'max_ms': round(self.max_ms, 2)
+        }
+
+
+class _Subscription:
+    """Cola de mensajes de la partida que atiende un stream"""
+
+    def __init__(self, hub: 'InMemoryStreamHub', session_id: str):
+        self.hub = hub
+        self.session_id = session_id
+        self.messages = queue.Queue()
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        """Siguiente mensaje, o None si no llegó ninguno en `timeout` segundos"""
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+
+class InMemoryStreamHub:
+    """
+    Entrega las respuestas al stream de cada partida dentro del proceso
+
+    Con un solo worker (o sesiones en memoria) el POST y el stream siempre
+    están en el mismo proceso.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._subscriptions = {}  # session_id -> _Subscription
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, session_id: str) -> _Subscription:
+        """Registra el stream de una partida (reemplaza uno anterior, p. ej. tras reconectar)"""
+        subscription = _Subscription(self, session_id)
+        with self._lock:
+            self._subscriptions[session_id] = subscription
+        return subscription
+
+    def publish(self, session_id: str, message: Dict) -> bool:
+        """
+        Entrega un mensaje al stream de la partida
+
+        Returns:
+            False si ningún stream atiende la partida
+        """
+        if self._deliver_local(session_id, message):
+            self.published += 1
+            return True
+        return False
+
+    def start(self, app):
+        """Sin receptor que arrancar dentro del proceso"""
+
+    def get_metrics(self) -> Dict:
+        return {
+            'hub': self.name,
+            'streams': len(self._subscriptions),
+            'published': self.published,
+            'dropped': self.dropped
+        }
+
+    def _deliver_local(self, session_id: str, message: Dict) -> bool:
+        subscription = self._subscriptions.get(session_id)
+        if subscription is None:
+            return False
+        subscription.messages.put(message)
+        return True
+
+    def _unsubscribe(self, subscription: _Subscription):
+        with self._lock:
+            if self._subscriptions.get(subscription.session_id) is subscription:
+                del self._subscriptions[subscription.session_id]
+
+
+class RedisStreamHub(InMemoryStreamHub):
+    """
+    Entrega las respuestas al worker que tiene abierto el stream de la partida
+
+    Cada worker escucha un único canal de pub/sub propio (no uno por partida).
+    Al abrir un stream se registra en Redis qué worker lo atiende; un POST que
+    llega a otro worker publica la respuesta en el canal de ese worker.
+    `publish` de Redis devuelve cuántos receptores hubo, así que un worker
+    caído se detecta en el acto.
+    """
+
+    name = 'redis'
+
+    # Segundos de espera antes de reconectar tras un error
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, client, prefix: str = 'akinator:stream:', owner_ttl: int = 3600):
+        """
+        Args:
+            client: Cliente redis-py (o compatible)
+            prefix: Prefijo de las claves de dueño y de los canales de worker
+            owner_ttl: Segundos de vida del registro de dueño de un stream
+        """
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.owner_ttl = owner_ttl
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.channel = f'{prefix}worker:{self.origin}'
+
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.routed = 0
+        self.errors = 0
+
+    def subscribe(self, session_id: str) -> _Subscription:
+        subscription = super().subscribe(session_id)
+        self.client.set(self._owner_key(session_id), self.origin, ex=self.owner_ttl)
+        return subscription
+
+    def publish(self, session_id: str, message: Dict) -> bool:
+        if super().publish(session_id, message):
+            return True
+
+        owner = self._owner(session_id)
+        if owner is None:
+            return False
+        payload = json.dumps({'session_id': session_id, 'message': message})
+        if not self.client.publish(f'{self.prefix}worker:{owner}', payload):
+            return False
+        self.published += 1
+        self.routed += 1
+        return True
+
+    def start(self, app):
+        """Arranca el receptor del canal del worker (después del fork)"""
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._listen,
+                name='game-streams',
+                daemon=True
+            )
+            self._thread.start()
+
+    def get_metrics(self) -> Dict:
+        return {
+            **super().get_metrics(),
+            'routed': self.routed,
+            'errors': self.errors
+        }
+
+    def _unsubscribe(self, subscription: _Subscription):
+        super()._unsubscribe(subscription)
+        session_id = subscription.session_id
+        if session_id in self._subscriptions:
+            # El cliente se reconectó a este mismo worker
+            return
+        try:
+            # Si se reconectó a otro worker, el registro ya es de ese worker
+            if self._owner(session_id) == self.origin:
+                self.client.delete(self._owner_key(session_id))
+        except Exception:
+            self.errors += 1
+
+    def _owner_key(self, session_id: str) -> str:
+        return f'{self.prefix}owner:{session_id}'
+
+    def _owner(self, session_id: str) -> Optional[str]:
+        """Worker que atiende el stream de la partida, según Redis"""
+        owner = self.client.get(self._owner_key(session_id))
+        return owner.decode('ascii') if isinstance(owner, bytes) else owner
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    envelope = json.loads(message['data'])
+                    if not self._deliver_local(envelope['session_id'], envelope['message']):
+                        # El stream se cerró entre el POST y la entrega
+                        self.dropped += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Error en el canal de streams de partidas, reconectando: {e}")
+                time.sleep(self.RECONNECT_DELAY)
+
+
+def create_stream_hub(client=None) -> InMemoryStreamHub:
+    """
+    Crea el distribuidor de respuestas a streams
+
+    Args:
+        client: Cliente redis-py compartido entre workers (por ejemplo el del
+            almacenamiento de sesiones); sin él, solo dentro del proceso
+    """
+    if client is None:
+        return InMemoryStreamHub()
+    return RedisStreamHub(client)
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Formatea un evento SSE con datos JSON"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class GameStreams:
+    """
+    Protocolo de partidas por SSE
+
+    - GET /api/game/stream inicia una partida y empuja un evento `start` con
+      la sesión y la primera pregunta; con ?session_id= se vuelve a conectar a
+      una partida en curso (evento `attached`)
+    - POST /api/game/stream/answer entrega la respuesta al stream, que la
+      procesa y empuja `question`, `guess`, `give_up` o `failure` (el nombre
+      `error` lo reserva EventSource para los errores de conexión)
+    - El stream termina tras `guess` o `give_up` (la confirmación sigue por
+      REST) o tras `idle_timeout` segundos sin respuestas; mientras tanto
+      envía comentarios de keepalive para que los proxies no lo corten
+
+    Las respuestas de una partida se procesan en orden en el worker que tiene
+    el stream (donde además vive su especulación, si está activa).
+    """
+
+    def __init__(self, engine, hub: Optional[InMemoryStreamHub] = None,
+                 heartbeat: float = 15.0, idle_timeout: float = 1800.0):
+        """
+        Args:
+            engine: GameEngine que procesa las partidas
+            hub: Distribuidor de respuestas a streams (por defecto en memoria)
+            heartbeat: Segundos entre keepalives
+            idle_timeout: Segundos sin respuestas antes de cerrar el stream
+        """
+        self.engine = engine
+        self.hub = hub or InMemoryStreamHub()
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+
+        self.opened = 0
+        self.active = 0
+        self.fallbacks = 0
+        self.message_timing = _Timing()
+        self.delivery_timing = _Timing()
+        self.rest_timing = _Timing()
+
+    def open(self, session_id: Optional[str] = None,
+             session_token: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream SSE de una partida (debe consumirse dentro del contexto de la aplicación)
+
+        Con tokens de sesión el stream guarda el token de la última respuesta,
+        así que los POST de respuestas no necesitan enviarlo. Si el POST lo
+        envía se usa ese: tras una respuesta por REST (sin stream que la
+        atendiera) el token guardado quedó viejo.
+
+        La sesión de base de datos se libera antes de cada espera: el stream
+        conserva el contexto de la aplicación hasta `idle_timeout` segundos y,
+        si no, retendría una conexión del pool todo ese tiempo.
+
+        Args:
+            session_id: Partida en curso a la que reconectarse (None = nueva partida)
+            session_token: Token de la partida en curso (solo con tokens de sesión)
+        """
+        if session_id is None:
+            first = self.engine.start_game()
+            if 'error' in first:
+                yield sse_event('failure', first)
+                return
+            session_id = first['session_id']
+            session_token = first.get('session_token')
+            first_event = sse_event('start', first)
+        elif self.engine.get_session_info(session_id, session_token) is None:
+            yield sse_event('failure', {'error': 'Sesión no encontrada'})
+            return
+        else:
+            first_event = sse_event('attached', {'session_id': session_id})
+
+        # Suscribirse antes de enviar la pregunta: ninguna respuesta se pierde
+        subscription = self.hub.subscribe(session_id)
+        self.opened += 1
+        self.active += 1
+        try:
+            yield first_event
+            idle = 0.0
+            while True:
+                db.session.remove()
+                message = subscription.get(self.heartbeat)
+                if message is None:
+                    idle += self.heartbeat
+                    if idle >= self.idle_timeout:
+                        yield sse_event('timeout', {'session_id': session_id})
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+
+                idle = 0.0
+                start = time.perf_counter()
+                self.delivery_timing.record(max(0.0, time.time() - message['sent_at']))
+                session_token = message.get('session_token') or session_token
+                result = self.engine.process_answer(
+                    session_id,
+                    message['question_id'],
+                    message['answer'],
+                    session_token
+                )
+                session_token = result.get('session_token', session_token)
+                event = 'failure' if 'error' in result else result['type']
+                payload = sse_event(event, result)
+                self.message_timing.record(time.perf_counter() - start)
+                yield payload
+
+                if event in ('guess', 'give_up'):
+                    return
+        finally:
+            subscription.close()
+            self.active -= 1
+
+    def submit(self, session_id: str, question_id: int, answer: str,
+               session_token: Optional[str] = None) -> bool:
+        """
+        Entrega una respuesta al stream de la partida
+
+        Args:
+            session_id: ID de la sesión
+            question_id: Pregunta respondida
+            answer: Respuesta del jugador
+            session_token: Token de sesión actual del cliente (solo con tokens de sesión)
+
+        Returns:
+            False si ningún stream la atiende (el llamador la procesa por REST)
+        """
+        message = {
+            'question_id': question_id,
+            'answer': answer,
+            'session_token': session_token,
+            'sent_at': time.time()
+        }
+        if self.hub.publish(session_id, message):
+            return True
+        self.fallbacks += 1
+        return False
+
+    def record_rest_answer(self, seconds: float):
+        """Registra el tiempo de servidor de una respuesta por /api/game/answer (para comparar)"""
+        self.rest_timing.record(seconds)
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.hub.get_metrics(),
+            'opened': self.opened,
+            'active': self.active,
+            'fallbacks': self.fallbacks,
+            'message': self.message_timing.to_dict(),
+            'delivery': self.delivery_timing.to_dict(),
+            'rest_answer': self.rest_timing.to_dict()
+        }
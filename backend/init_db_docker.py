@@ -8,7 +8,7 @@ import sys
 # Agregar el directorio padre al path para importar módulos
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.app import app, db
+from backend.app import app, db, learning_system
 from backend.models import Character, Question
 from backend.init_data import initialize_data
 
@@ -31,6 +31,7 @@ def init_database():
         
         print("📊 Inicializando base de datos con datos de ejemplo...")
         initialize_data(db)
+        learning_system.recalculate_system_stats()
         
         # Verificar datos insertados
         character_count = db.session.query(Character).count()
@@ -0,0 +1,190 @@
+"""
+Cola de aprendizaje en segundo plano
+Las partidas confirmadas se encolan en la tabla learning_tasks y un hilo del
+proceso las analiza por lotes, fuera del tiempo de respuesta de /api/game/confirm
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import delete, func, select
+from models import db, LearningTask
+
+
+class LearningQueue:
+    """
+    Cola durable de sesiones pendientes de aprendizaje
+
+    Las tareas viven en la base de datos, así que sobreviven a reinicios y se
+    comparten entre workers. Cada lote se reclama con DELETE ... RETURNING en
+    la misma transacción que aplica el aprendizaje: si el análisis falla, el
+    rollback devuelve las tareas a la cola, y dos workers nunca procesan la
+    misma tarea.
+    """
+
+    def __init__(
+        self,
+        app,
+        learning_system,
+        on_batch: Optional[Callable[[Set[int]], None]] = None,
+        batch_size: int = 50,
+        poll_interval: float = 2.0
+    ):
+        """
+        Args:
+            app: Aplicación Flask (el hilo necesita su contexto)
+            learning_system: LearningSystem que analiza los lotes de sesiones
+            on_batch: Callback tras aplicar un lote con los IDs de personajes cuyos
+                atributos cambiaron (por ejemplo, refrescar el modelo)
+            batch_size: Máximo de sesiones por lote
+            poll_interval: Segundos entre revisiones de la cola cuando está vacía
+        """
+        self.app = app
+        self.learning_system = learning_system
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+
+    def notify(self):
+        """
+        Avisa que hay tareas nuevas
+
+        GameEngine.confirm_guess inserta la tarea en la misma transacción que
+        la partida, así que una partida confirmada nunca queda fuera de la cola
+        (ni una tarea sin su partida).
+        """
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """Arranca el hilo de procesamiento si no está corriendo"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._worker,
+                name='learning-queue',
+                daemon=True
+            )
+            self._thread.start()
+
+    def process_batch(self) -> int:
+        """
+        Reclama y analiza un lote de sesiones en una sola transacción
+
+        LearningSystem combina el lote en memoria: un UPDATE de efectividad para
+        todas las preguntas y un UPDATE de los contadores de SystemStats.
+
+        Returns:
+            Número de sesiones procesadas
+        """
+        start = time.perf_counter()
+        session_ids = [session_id for _, session_id in self._claim(self.batch_size)]
+        if not session_ids:
+            db.session.commit()
+            return 0
+
+        try:
+            changed = self.learning_system.analyze_game_sessions(session_ids, commit=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error en lote de aprendizaje, reintentando de a una sesión: {e}")
+            session_ids, changed = self._process_individually(len(session_ids))
+
+        self.processed += len(session_ids)
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - start) * 1000.0
+
+        if session_ids and self.on_batch:
+            self.on_batch(changed)
+        return len(session_ids)
+
+    def get_metrics(self) -> Dict:
+        """
+        Métricas de la cola
+
+        Returns:
+            Dict con backlog, lag (segundos de la tarea más antigua) y contadores
+        """
+        backlog, oldest = db.session.execute(
+            select(func.count(LearningTask.id), func.min(LearningTask.created_at))
+        ).one()
+        lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+        return {
+            'backlog': backlog,
+            'lag_seconds': round(lag, 1),
+            'processed': self.processed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'last_batch_ms': round(self.last_batch_ms, 1)
+        }
+
+    def _claim(self, limit: int) -> List[Tuple[int, str]]:
+        """Elimina (sin confirmar) las `limit` tareas más antiguas y devuelve (id, sesión)"""
+        tasks = LearningTask.__table__
+        oldest_ids = select(tasks.c.id).order_by(tasks.c.id).limit(limit)
+        ids = db.session.execute(oldest_ids).scalars().all()
+        if not ids:
+            return []
+
+        claimed = db.session.execute(
+            delete(tasks).where(tasks.c.id.in_(ids)).returning(tasks.c.id, tasks.c.session_id)
+        ).all()
+        # RETURNING no garantiza orden: procesar en orden de llegada
+        return sorted(tuple(row) for row in claimed)
+
+    def _process_individually(self, limit: int) -> Tuple[List[str], Set[int]]:
+        """
+        Procesa las tareas de un lote fallido de a una
+
+        Las que fallan solas se descartan (se cuentan en `failed`) para que una
+        sesión defectuosa no bloquee la cola.
+
+        Returns:
+            Sesiones procesadas e IDs de personajes cuyos atributos cambiaron
+        """
+        tasks = LearningTask.__table__
+        processed = []
+        changed = set()
+        for _ in range(limit):
+            claimed = self._claim(1)
+            if not claimed:
+                break
+            task_id, session_id = claimed[0]
+            try:
+                characters = self.learning_system.analyze_game_sessions([session_id], commit=False)
+                db.session.commit()
+                processed.append(session_id)
+                changed |= characters
+            except Exception as e:
+                db.session.rollback()
+                # El rollback devolvió la tarea a la cola: descartarla
+                db.session.execute(delete(tasks).where(tasks.c.id == task_id))
+                db.session.commit()
+                self.failed += 1
+                print(f"Error analizando sesión {session_id}: {e}")
+        return processed, changed
+
+    def _worker(self):
+        """Vacía la cola por lotes; cuando está vacía espera un aviso o poll_interval"""
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.process_batch() == self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"Error en la cola de aprendizaje: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
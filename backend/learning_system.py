@@ -2,14 +2,28 @@
 Sistema de aprendizaje incremental
 Mejora el sistema basado en las partidas jugadas
 """
-from typing import Dict, List
-from models import db, Character, Question, CharacterAttribute, GameSession, SystemStats
-from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+from sqlalchemy import bindparam, false, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import (
+    db, Character, Question, CharacterAttribute, GameSession, LearningTask, SystemStats
+)
+
+
+# INSERT con ON CONFLICT DO UPDATE de cada base de datos soportada
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
 
 
 class LearningSystem:
     """Sistema que aprende de las partidas para mejorar"""
     
+    # Promedio móvil exponencial de la efectividad: nuevo = actual * DECAY + boost * (1 - DECAY)
+    EFFECTIVENESS_DECAY = 0.9
+    
     def __init__(self):
         pass
     
@@ -48,11 +62,10 @@ class LearningSystem:
             )
             db.session.add(char_attr)
         
+        # Actualizar estadísticas en la misma transacción
+        self._increment_system_stats(total_characters=1)
         db.session.commit()
         
-        # Actualizar estadísticas
-        self._update_system_stats()
-        
         return character
     
     def update_character_attributes(self, character_id: int, attributes: Dict[str, int]):
@@ -63,106 +76,238 @@ class LearningSystem:
             character_id: ID del personaje
             attributes: Dict {attribute_key: value}
         """
+        current = self._load_attributes([character_id])
+        rows = {}
         for attr_key, value in attributes.items():
-            # Buscar atributo existente
-            existing_attr = db.session.query(CharacterAttribute).filter_by(
-                character_id=character_id,
-                attribute_key=attr_key
-            ).first()
-            
-            if existing_attr:
+            existing = current.get((character_id, attr_key))
+            if existing:
                 # Actualizar valor con promedio ponderado
-                existing_attr.value = int((existing_attr.value + value) / 2)
-                existing_attr.confidence = min(existing_attr.confidence + 0.1, 1.0)
+                existing_value, existing_confidence = existing
+                rows[(character_id, attr_key)] = (
+                    int((existing_value + value) / 2),
+                    min(existing_confidence + 0.1, 1.0)
+                )
             else:
                 # Crear nuevo atributo
-                new_attr = CharacterAttribute(
-                    character_id=character_id,
-                    attribute_key=attr_key,
-                    value=value,
-                    confidence=0.8
-                )
-                db.session.add(new_attr)
+                rows[(character_id, attr_key)] = (value, 0.8)
         
+        self._upsert_attributes(rows)
         db.session.commit()
     
-    def analyze_game_session(self, session_id: str):
+    def analyze_game_session(self, session_id: str, commit: bool = True):
         """
         Analiza una sesión de juego completada para aprender
         
         Args:
             session_id: ID de la sesión a analizar
+            commit: Confirmar la transacción al terminar (False para agrupar
+                varias sesiones en una sola transacción)
         """
         session = db.session.query(GameSession).filter_by(session_id=session_id).first()
         if not session:
             return
         
         # Actualizar efectividad de preguntas
-        self._update_question_effectiveness(session)
+        self._update_question_effectiveness(session, commit)
         
         # Si fue exitoso, reforzar atributos del personaje
         if session.success and session.guessed_character_id:
-            self._reinforce_character_attributes(session)
+            self._reinforce_character_attributes(session, commit)
     
-    def _update_question_effectiveness(self, session: GameSession):
+    def analyze_game_sessions(self, session_ids: List[str], commit: bool = True) -> Set[int]:
         """
-        Actualiza la efectividad de las preguntas basado en el resultado
+        Analiza en lote varias partidas confirmadas
+        
+        Cuenta todas las partidas en SystemStats y aprende de las acertadas (como
+        hacía la confirmación), aplicando la efectividad de todas las preguntas
+        con un único UPDATE.
+        
+        Args:
+            session_ids: IDs de las sesiones, en orden de confirmación
+            commit: Confirmar la transacción al terminar
+        
+        Returns:
+            IDs de los personajes cuyos atributos cambiaron
         """
-        if not session.questions_asked:
-            return
+        order = {session_id: index for index, session_id in enumerate(session_ids)}
+        sessions = db.session.query(GameSession).filter(
+            GameSession.session_id.in_(session_ids)
+        ).all()
+        sessions.sort(key=lambda session: order[session.session_id])
+        if not sessions:
+            return set()
         
-        # Factor de ajuste basado en éxito y número de preguntas
+        successful = [session for session in sessions if session.success]
+        self._apply_question_effectiveness(successful)
+        reinforced = [session for session in successful if session.guessed_character_id]
+        self._reinforce_attributes(reinforced)
+        
+        self._increment_system_stats(
+            total_games=len(sessions),
+            successful_guesses=len(successful)
+        )
+        
+        if commit:
+            db.session.commit()
+        return {session.guessed_character_id for session in reinforced if session.answers_given}
+    
+    def _effectiveness_boost(self, session: GameSession) -> float:
+        """Factor de ajuste basado en éxito y número de preguntas"""
         if session.success:
             # Éxito con pocas preguntas = preguntas muy efectivas
-            effectiveness_boost = 1.0 + (1.0 / max(session.num_questions, 1))
-        else:
-            # Fallo = preguntas menos efectivas
-            effectiveness_boost = 0.95
-        
-        # Actualizar cada pregunta
-        for question_id in session.questions_asked:
-            question = db.session.query(Question).get(question_id)
-            if question:
-                # Promedio móvil exponencial
-                question.effectiveness_score = (
-                    question.effectiveness_score * 0.9 + effectiveness_boost * 0.1
-                )
+            return 1.0 + (1.0 / max(session.num_questions, 1))
+        # Fallo = preguntas menos efectivas
+        return 0.95
+    
+    def _update_question_effectiveness(self, session: GameSession, commit: bool = True):
+        """
+        Actualiza la efectividad de las preguntas basado en el resultado
+        """
+        self._apply_question_effectiveness([session])
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
     
-    def _reinforce_character_attributes(self, session: GameSession):
+    def _apply_question_effectiveness(self, sessions: List[GameSession]):
         """
-        Refuerza los atributos del personaje basado en respuestas correctas
+        Aplica el promedio móvil de efectividad de varias partidas con un solo UPDATE
+        
+        Aplicar k actualizaciones e ← e * d + b_i * (1 - d) equivale a una
+        transformación afín e ← e * m + a, así que se combinan en memoria por
+        pregunta y la base de datos aplica cada (m, a) sobre el valor actual
+        sin leerlo antes.
         """
-        if not session.answers_given:
+        decay = self.EFFECTIVENESS_DECAY
+        updates = {}  # question_id -> [multiplicador, sumando]
+        for session in sessions:
+            if not session.questions_asked:
+                continue
+            boost = self._effectiveness_boost(session) * (1.0 - decay)
+            for question_id in session.questions_asked:
+                multiplier, addend = updates.get(question_id, (1.0, 0.0))
+                updates[question_id] = (multiplier * decay, addend * decay + boost)
+        
+        if not updates:
             return
         
-        character_id = session.guessed_character_id
+        questions = Question.__table__
+        db.session.execute(
+            update(questions)
+            .where(questions.c.id == bindparam('question_id'))
+            .values(effectiveness_score=(
+                questions.c.effectiveness_score * bindparam('multiplier') + bindparam('addend')
+            )),
+            [
+                {'question_id': question_id, 'multiplier': multiplier, 'addend': addend}
+                for question_id, (multiplier, addend) in updates.items()
+            ]
+        )
+    
+    def _reinforce_character_attributes(self, session: GameSession, commit: bool = True):
+        """
+        Refuerza los atributos del personaje basado en respuestas correctas
+        """
+        self._reinforce_attributes([session])
+        
+        if commit:
+            db.session.commit()
+    
+    def _reinforce_attributes(self, sessions: List[GameSession]):
+        """
+        Refuerza los atributos de varias partidas acertadas con una lectura y una escritura
+        
+        Carga de una vez los atributos de los personajes adivinados, aplica las
+        partidas en orden en memoria (un personaje puede aparecer varias veces
+        en el lote) y escribe el resultado con un único upsert.
+        """
+        sessions = [session for session in sessions if session.answers_given]
+        if not sessions:
+            return
         
-        # Para cada respuesta dada, reforzar el atributo
-        for attr_key, answer_value in session.answers_given.items():
-            # Buscar atributo existente
-            char_attr = db.session.query(CharacterAttribute).filter_by(
-                character_id=character_id,
-                attribute_key=attr_key
-            ).first()
+        current = self._load_attributes({session.guessed_character_id for session in sessions})
+        rows = {}
+        for session in sessions:
+            character_id = session.guessed_character_id
             
-            if char_attr:
-                # Ajustar valor hacia la respuesta del usuario (aprendizaje)
-                # Promedio ponderado: 80% valor actual, 20% respuesta usuario
-                char_attr.value = int(char_attr.value * 0.8 + answer_value * 0.2)
-                char_attr.confidence = min(char_attr.confidence + 0.05, 1.0)
-            else:
-                # Crear nuevo atributo basado en la respuesta
-                new_attr = CharacterAttribute(
-                    character_id=character_id,
-                    attribute_key=attr_key,
-                    value=answer_value,
-                    confidence=0.7
-                )
-                db.session.add(new_attr)
+            # Para cada respuesta dada, reforzar el atributo
+            for attr_key, answer_value in session.answers_given.items():
+                existing = current.get((character_id, attr_key))
+                if existing:
+                    # Ajustar valor hacia la respuesta del usuario (aprendizaje)
+                    # Promedio ponderado: 80% valor actual, 20% respuesta usuario
+                    value, confidence = existing
+                    row = (int(value * 0.8 + answer_value * 0.2), min(confidence + 0.05, 1.0))
+                else:
+                    # Crear nuevo atributo basado en la respuesta
+                    row = (answer_value, 0.7)
+                current[(character_id, attr_key)] = rows[(character_id, attr_key)] = row
         
-        db.session.commit()
+        self._upsert_attributes(rows)
+    
+    def _load_attributes(self, character_ids) -> Dict[Tuple[int, str], Tuple[int, float]]:
+        """
+        Atributos actuales de varios personajes en una sola consulta
+        
+        Las filas quedan bloqueadas hasta el commit para que dos workers no
+        lean el mismo valor y pisen el aprendizaje del otro. En PostgreSQL se
+        usa FOR UPDATE. SQLite no lo soporta y una transacción no bloquea la
+        base hasta su primera escritura, así que antes de leer se ejecuta un
+        UPDATE vacío: toma el bloqueo de escritura, como BEGIN IMMEDIATE, y los
+        demás escritores esperan al commit.
+        
+        Returns:
+            Dict {(character_id, attribute_key): (value, confidence)}
+        """
+        if db.session.get_bind().dialect.name == 'sqlite':
+            db.session.execute(
+                update(CharacterAttribute)
+                .where(false())
+                .values(value=CharacterAttribute.value)
+            )
+        
+        rows = db.session.query(
+            CharacterAttribute.character_id,
+            CharacterAttribute.attribute_key,
+            CharacterAttribute.value,
+            CharacterAttribute.confidence
+        ).filter(
+            CharacterAttribute.character_id.in_(list(character_ids))
+        ).with_for_update().all()
+        return {
+            (character_id, attr_key): (value, confidence)
+            for character_id, attr_key, value, confidence in rows
+        }
+    
+    def _upsert_attributes(self, rows: Dict[Tuple[int, str], Tuple[int, float]]):
+        """
+        Escribe atributos con un único INSERT ... ON CONFLICT DO UPDATE
+        
+        El conflicto se resuelve sobre la restricción unique_character_attribute
+        (character_id, attribute_key).
+        
+        Args:
+            rows: Dict {(character_id, attribute_key): (value, confidence)}
+        """
+        if not rows:
+            return
+        
+        insert = UPSERT_INSERTS[db.session.get_bind().dialect.name]
+        statement = insert(CharacterAttribute.__table__).values([
+            {
+                'character_id': character_id,
+                'attribute_key': attr_key,
+                'value': value,
+                'confidence': confidence
+            }
+            for (character_id, attr_key), (value, confidence) in rows.items()
+        ])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['character_id', 'attribute_key'],
+            set_={
+                'value': statement.excluded.value,
+                'confidence': statement.excluded.confidence
+            }
+        ))
     
     def get_learning_stats(self) -> Dict:
         """
@@ -171,9 +316,10 @@ class LearningSystem:
         Returns:
             Dict con métricas de aprendizaje
         """
-        # Estadísticas de sesiones
-        total_sessions = db.session.query(GameSession).count()
-        successful_sessions = db.session.query(GameSession).filter_by(success=True).count()
+        # Estadísticas de sesiones (contadores incrementales, sin contar tablas)
+        system_stats = self.get_system_stats()
+        total_sessions = system_stats.total_games or 0
+        successful_sessions = system_stats.successful_guesses or 0
         
         # Promedio de preguntas
         avg_questions = db.session.query(db.func.avg(GameSession.num_questions)).scalar() or 0
@@ -216,8 +362,35 @@ class LearningSystem:
             ]
         }
     
-    def _update_system_stats(self):
-        """Actualiza las estadísticas globales del sistema"""
+    def _increment_system_stats(self, **deltas: int):
+        """
+        Suma contadores de SystemStats con un UPDATE atómico (sin contar tablas)
+        
+        Si todavía no existe la fila de estadísticas, se crea una vez con los
+        conteos completos (que ya incluyen los cambios de esta transacción).
+        """
+        stats_table = SystemStats.__table__
+        values = {name: stats_table.c[name] + amount for name, amount in deltas.items()}
+        values['last_updated'] = datetime.utcnow()
+        
+        result = db.session.execute(update(stats_table).values(**values))
+        if result.rowcount == 0:
+            self.recalculate_system_stats(commit=False)
+    
+    def get_system_stats(self) -> SystemStats:
+        """Fila de estadísticas globales (se calcula una vez si no existe)"""
+        stats = db.session.query(SystemStats).first()
+        if stats is None:
+            stats = self.recalculate_system_stats()
+        return stats
+    
+    def recalculate_system_stats(self, commit: bool = True) -> SystemStats:
+        """
+        Recalcula las estadísticas globales del sistema con conteos completos
+        
+        Los contadores se mantienen de forma incremental; esto solo hace falta al
+        crearlos o tras cargar datos por fuera de LearningSystem (scripts de importación).
+        """
         stats = db.session.query(SystemStats).first()
         if not stats:
             stats = SystemStats()
@@ -225,7 +398,13 @@ class LearningSystem:
         
         stats.total_characters = db.session.query(Character).count()
         stats.total_questions = db.session.query(Question).count()
-        stats.total_games = db.session.query(GameSession).count()
-        stats.successful_guesses = db.session.query(GameSession).filter_by(success=True).count()
+        # Las partidas que siguen en la cola se sumarán al procesarlas
+        analyzed = db.session.query(GameSession).filter(
+            GameSession.session_id.notin_(db.session.query(LearningTask.session_id))
+        )
+        stats.total_games = analyzed.count()
+        stats.successful_guesses = analyzed.filter(GameSession.success.is_(True)).count()
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        return stats
@@ -0,0 +1,276 @@
+"""
+Difusión de cambios del modelo entre workers
+Cada worker construye su propio modelo en memoria; cuando uno publica un modelo
+nuevo avisa a los demás, que aplican el mismo delta en lugar de quedarse con
+datos viejos
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+
+class ModelChange:
+    """
+    Aviso de un modelo nuevo publicado por un worker
+
+    - character_ids: personajes modificados (None = reconstrucción completa)
+    - records: si además hay que descartar la caché de registros
+    """
+
+    __slots__ = ('origin', 'sequence', 'version', 'character_ids', 'records', 'sent_at')
+
+    def __init__(self, origin: str, sequence: int, version: int,
+                 character_ids: Optional[List[int]], records: bool, sent_at: float):
+        self.origin = origin
+        self.sequence = sequence
+        self.version = version
+        self.character_ids = character_ids
+        self.records = records
+        self.sent_at = sent_at
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'origin': self.origin,
+            'sequence': self.sequence,
+            'version': self.version,
+            'character_ids': self.character_ids,
+            'records': self.records,
+            'sent_at': self.sent_at
+        })
+
+    @classmethod
+    def from_json(cls, data) -> 'ModelChange':
+        fields = json.loads(data)
+        return cls(
+            fields['origin'],
+            fields['sequence'],
+            fields['version'],
+            fields['character_ids'],
+            fields['records'],
+            fields['sent_at']
+        )
+
+
+class ChangeFeed:
+    """
+    Canal de avisos de cambios del modelo (interfaz)
+
+    Los avisos propios se ignoran. Los ajenos se entregan a los suscriptores
+    en un hilo del canal, dentro del contexto de la aplicación, y se miden el
+    retraso de propagación (envío → recepción) y el tiempo de recarga.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.app = None
+        self._handlers = []
+        self._sequence = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.last_delay_ms = 0.0
+        self.max_delay_ms = 0.0
+        self.last_reload_ms = 0.0
+        self._total_delay_ms = 0.0
+
+    def subscribe(self, handler: Callable[[ModelChange], None]):
+        """Registra una función que recibe los avisos de otros workers"""
+        self._handlers.append(handler)
+
+    def publish(self, version: int, character_ids: Optional[List[int]] = None, records: bool = False):
+        """
+        Avisa a los demás workers que se publicó un modelo nuevo
+
+        Args:
+            version: Versión local del modelo publicado (informativa)
+            character_ids: Personajes modificados (None = reconstrucción completa)
+            records: Si los demás deben descartar su caché de registros
+        """
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        change = ModelChange(self.origin, sequence, version, character_ids, records, time.time())
+        try:
+            self._send(change)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Error publicando cambio del modelo: {e}")
+
+    def start(self, app):
+        """Arranca el hilo receptor (después del fork, con el contexto de `app`)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.app = app
+            self._thread = threading.Thread(
+                target=self._listen,
+                name=f'model-changes-{self.name}',
+                daemon=True
+            )
+            self._thread.start()
+
+    def get_metrics(self) -> Dict:
+        return {
+            'feed': self.name,
+            'published': self.published,
+            'received': self.received,
+            'errors': self.errors,
+            'last_delay_ms': round(self.last_delay_ms, 1),
+            'avg_delay_ms': round(self._total_delay_ms / self.received, 1) if self.received else 0,
+            'max_delay_ms': round(self.max_delay_ms, 1),
+            'last_reload_ms': round(self.last_reload_ms, 1)
+        }
+
+    def _deliver(self, change: ModelChange):
+        """Entrega un aviso ajeno a los suscriptores y registra las métricas"""
+        if change.origin == self.origin:
+            return
+
+        delay_ms = max(0.0, (time.time() - change.sent_at) * 1000.0)
+        self.received += 1
+        self.last_delay_ms = delay_ms
+        self.max_delay_ms = max(self.max_delay_ms, delay_ms)
+        self._total_delay_ms += delay_ms
+
+        start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                for handler in self._handlers:
+                    handler(change)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error aplicando cambio del modelo: {e}")
+        self.last_reload_ms = (time.perf_counter() - start) * 1000.0
+
+    def _send(self, change: ModelChange):
+        raise NotImplementedError
+
+    def _listen(self):
+        raise NotImplementedError
+
+
+class InMemoryChangeFeed(ChangeFeed):
+    """
+    Canal dentro de un mismo proceso
+
+    Los canales creados con el mismo `bus` se avisan entre sí (útil para
+    pruebas con varios motores); con un solo worker no hay a quién avisar.
+    """
+
+    name = 'memory'
+
+    def __init__(self, bus: Optional[List['InMemoryChangeFeed']] = None):
+        """
+        Args:
+            bus: Lista compartida de canales conectados (por defecto uno propio)
+        """
+        super().__init__()
+        self.bus = bus if bus is not None else []
+        self.bus.append(self)
+        self._inbox = queue.Queue()
+
+    def poll(self, timeout: Optional[float] = None) -> bool:
+        """
+        Entrega el siguiente aviso pendiente en el hilo actual
+
+        Returns:
+            False si no llegó ningún aviso en `timeout` segundos
+        """
+        try:
+            change = self._inbox.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        self._deliver(change)
+        return True
+
+    def _send(self, change: ModelChange):
+        for feed in self.bus:
+            if feed is not self:
+                feed._inbox.put(change)
+
+    def _listen(self):
+        while True:
+            self.poll()
+
+
+class RedisChangeFeed(ChangeFeed):
+    """
+    Canal compartido entre workers con Redis pub/sub
+
+    Pub/sub no guarda mensajes: si la conexión se corta, los avisos de ese
+    intervalo se pierden, así que al reconectar se entrega una reconstrucción
+    completa (character_ids=None) para resincronizar.
+    """
+
+    name = 'redis'
+
+    # Segundos de espera antes de reconectar tras un error
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, client, channel: str = 'akinator:model-changes'):
+        """
+        Args:
+            client: Cliente redis-py (o compatible)
+            channel: Canal de pub/sub
+        """
+        super().__init__()
+        self.client = client
+        self.channel = channel
+
+    def _send(self, change: ModelChange):
+        self.client.publish(self.channel, change.to_json())
+
+    def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if connected_before:
+                    self._deliver(ModelChange('resync', 0, 0, None, True, time.time()))
+                connected_before = True
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._deliver(ModelChange.from_json(message['data']))
+            except Exception as e:
+                self.errors += 1
+                print(f"Error en el canal de cambios del modelo, reconectando: {e}")
+                time.sleep(self.RECONNECT_DELAY)
+
+
+def create_change_feed(name: str = 'memory', redis_url: Optional[str] = None) -> ChangeFeed:
+    """
+    Crea un canal de cambios del modelo por nombre
+
+    Args:
+        name: 'memory' (un solo proceso) o 'redis' (compartido entre workers)
+        redis_url: URL de conexión, requerida para 'redis'
+
+    Returns:
+        Instancia de ChangeFeed
+
+    Raises:
+        ValueError: Si el nombre es desconocido o falta la URL de Redis
+    """
+    if name == InMemoryChangeFeed.name:
+        return InMemoryChangeFeed()
+
+    if name == RedisChangeFeed.name:
+        if not redis_url:
+            raise ValueError('MODEL_CHANGE_FEED=redis requiere REDIS_URL')
+        import redis
+        return RedisChangeFeed(redis.Redis.from_url(redis_url))
+
+    raise ValueError(f'Canal de cambios del modelo desconocido: {name}')
@@ -0,0 +1,237 @@
+"""
+Archivo binario del modelo de atributos
+Se escribe desde la base de datos con la CLI y cada worker lo mapea en memoria
+(mmap de solo lectura): los N workers comparten una sola copia en la caché de
+páginas del sistema y arrancar es validar el archivo, no recorrer la tabla de
+atributos con el ORM
+
+Uso como CLI:
+    python backend/model_file.py --output model.akm
+
+Formato (little-endian, secciones alineadas a 64 bytes):
+    cabecera    HEADER (magia, formato, versión del modelo, marca de aprendizaje,
+                tamaños, offsets y SHA-256 del resto del archivo)
+    metadatos   JSON utf-8: claves de atributo (columnas), preguntas y huella
+    ids         int64[personajes]: ID de personaje de cada fila
+    valores     int8[personajes × atributos]
+    confianza   float32[personajes × atributos]
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Tuple
+import numpy as np
+from sqlalchemy import func
+from attribute_model import AttributeModel, QuestionRecord
+from models import GameSession, LearningTask
+
+
+MAGIC = b'AKMF'
+FORMAT_VERSION = 1
+# magia, formato, versión del modelo, marca, personajes, atributos, bytes de
+# metadatos, offsets de ids / valores / confianza, SHA-256
+HEADER = struct.Struct('<4sHQQIIIQQQ32s')
+ALIGNMENT = 64
+METADATA_OFFSET = HEADER.size + (-HEADER.size % ALIGNMENT)
+
+
+def write_model_file(model: AttributeModel, path: str, watermark: int = 0):
+    """
+    Escribe el modelo en un archivo binario
+
+    Se escribe en un archivo temporal y se reemplaza de forma atómica: los
+    workers que ya mapearon la versión anterior la siguen leyendo sin errores.
+
+    Args:
+        model: Modelo a guardar
+        path: Ruta del archivo
+        watermark: Última partida aprendida incluida en el modelo (ver learning_watermark)
+    """
+    metadata = json.dumps({
+        'fingerprint': model.fingerprint,
+        'attribute_keys': model.attribute_keys,
+        'questions': [
+            [q.id, q.text, q.attribute_key, q.times_asked, q.effectiveness_score]
+            for q in model.questions
+        ],
+        'created_at': time.time()
+    }).encode('utf-8')
+
+    sections = [
+        metadata,
+        np.ascontiguousarray(model.character_ids, dtype='<i8').tobytes(),
+        np.ascontiguousarray(model.values, dtype=np.int8).tobytes(),
+        np.ascontiguousarray(model.confidence, dtype='<f4').tobytes()
+    ]
+    offsets = []
+    body = bytearray()
+    for section in sections:
+        body += bytes(-(HEADER.size + len(body)) % ALIGNMENT)
+        offsets.append(HEADER.size + len(body))
+        body += section
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        model.version,
+        watermark,
+        model.num_characters,
+        len(model.attribute_keys),
+        len(metadata),
+        offsets[1],
+        offsets[2],
+        offsets[3],
+        hashlib.sha256(body).digest()
+    )
+
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, path)
+
+
+def read_model_file(path: str, verify: bool = True) -> Tuple[AttributeModel, int]:
+    """
+    Mapea un archivo de modelo en memoria (solo lectura, sin copiar las matrices)
+
+    Args:
+        path: Ruta del archivo
+        verify: Comprobar el SHA-256 del contenido
+
+    Returns:
+        Tupla (modelo, marca de aprendizaje)
+
+    Raises:
+        ValueError: Si el archivo no es un modelo válido o está corrupto
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < HEADER.size:
+        raise ValueError(f'Archivo de modelo truncado: {path}')
+    (magic, format_version, version, watermark, num_characters, num_keys, metadata_size,
+     ids_offset, values_offset, confidence_offset, checksum) = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f'No es un archivo de modelo: {path}')
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f'Formato de modelo no soportado: {format_version}')
+
+    cells = num_characters * num_keys
+    if (ids_offset < METADATA_OFFSET + metadata_size
+            or values_offset < ids_offset + num_characters * 8
+            or confidence_offset < values_offset + cells
+            or confidence_offset + cells * 4 != len(buffer)):
+        raise ValueError(f'Tamaño de archivo de modelo inválido: {path}')
+    if verify and hashlib.sha256(memoryview(buffer)[HEADER.size:]).digest() != checksum:
+        raise ValueError(f'Checksum inválido en el archivo de modelo: {path}')
+
+    metadata = json.loads(buffer[METADATA_OFFSET:METADATA_OFFSET + metadata_size].decode('utf-8'))
+    if len(metadata['attribute_keys']) != num_keys:
+        raise ValueError(f'Metadatos inconsistentes en el archivo de modelo: {path}')
+
+    character_ids = np.frombuffer(buffer, dtype='<i8', count=num_characters, offset=ids_offset)
+    values = np.frombuffer(buffer, dtype=np.int8, count=cells, offset=values_offset)
+    confidence = np.frombuffer(buffer, dtype='<f4', count=cells, offset=confidence_offset)
+
+    model = AttributeModel(
+        character_ids.tolist(),
+        metadata['attribute_keys'],
+        values.reshape(num_characters, num_keys),
+        [QuestionRecord(*question) for question in metadata['questions']],
+        version,
+        confidence.reshape(num_characters, num_keys)
+    )
+    # Con el checksum verificado el contenido es el mismo que se hasheó al escribir
+    if verify:
+        model._fingerprint = metadata['fingerprint']
+    return model, watermark
+
+
+def learning_watermark(db_session) -> int:
+    """
+    ID de partida hasta el cual todo el aprendizaje ya está aplicado
+
+    Es la partida anterior a la más vieja con una tarea pendiente en la cola
+    (o la última partida si no hay pendientes): una partida pendiente con ID
+    menor que otra ya aprendida no puede quedar por debajo de la marca. La
+    partida y su tarea se confirman en la misma transacción, así que no hay
+    partidas confirmadas sin encolar.
+
+    Las partidas posteriores a la marca pueden haber cambiado atributos
+    después de escribir el archivo. Al cargar se releen sus personajes, así
+    que una marca más baja de lo necesario solo relee filas de más.
+    """
+    pending = db_session.query(LearningTask.session_id)
+    oldest_pending = db_session.query(func.min(GameSession.id)).filter(
+        GameSession.session_id.in_(pending)
+    ).scalar()
+    if oldest_pending is not None:
+        return oldest_pending - 1
+    return db_session.query(func.max(GameSession.id)).scalar() or 0
+
+
+def load_model(path: str, db_session, verify: bool = True) -> AttributeModel:
+    """
+    Carga el modelo desde el archivo y lo pone al día con la base de datos
+
+    Las preguntas, los personajes nuevos y los personajes reforzados por
+    partidas posteriores a la marca se aplican como delta
+    (AttributeModel.with_changes). Si no hubo cambios de atributos, las
+    matrices siguen compartidas con el archivo; en cuanto un delta modifica
+    filas existentes (al cargar o con el primer lote de aprendizaje), el
+    worker pasa a tener su propia copia de las matrices.
+
+    Raises:
+        ValueError: Si el archivo no es un modelo válido o está corrupto
+    """
+    model, watermark = read_model_file(path, verify)
+    changed_ids = [
+        char_id for (char_id,) in db_session.query(GameSession.guessed_character_id).filter(
+            GameSession.id > watermark,
+            GameSession.success.is_(True),
+            GameSession.guessed_character_id.isnot(None)
+        ).distinct().all()
+    ]
+    return model.with_changes(db_session, changed_ids, model.version)
+
+
+def main():
+    """Escribe el archivo de modelo desde la base de datos configurada"""
+    import argparse
+    from app import app, db
+
+    parser = argparse.ArgumentParser(description='Escribe el archivo binario del modelo')
+    parser.add_argument('--output', default='model.akm', help='Archivo de salida')
+    parser.add_argument('--version', type=int, default=None,
+                        help='Versión del modelo (por defecto la del archivo existente + 1)')
+    args = parser.parse_args()
+
+    version = args.version
+    if version is None:
+        version = 1
+        if os.path.exists(args.output):
+            try:
+                version = read_model_file(args.output, verify=False)[0].version + 1
+            except ValueError:
+                pass
+
+    start = time.perf_counter()
+    with app.app_context():
+        watermark = learning_watermark(db.session)
+        model = AttributeModel.from_db(db.session, version=version)
+    write_model_file(model, args.output, watermark)
+    elapsed = time.perf_counter() - start
+
+    size_mb = os.path.getsize(args.output) / (1024 * 1024)
+    print(f"✓ Modelo v{version}: {model.num_characters} personajes × "
+          f"{len(model.attribute_keys)} atributos ({elapsed:.2f}s)")
+    print(f"✓ Huella: {model.fingerprint[:12]} | Marca de aprendizaje: {watermark}")
+    print(f"✓ Guardado en {args.output} ({size_mb:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
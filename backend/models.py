@@ -104,6 +104,29 @@ class GameSession(db.Model):
         return f'<GameSession {self.session_id}>'
 
 
+class LearningTask(db.Model):
+    """Partida confirmada pendiente de analizar por el sistema de aprendizaje"""
+    __tablename__ = 'learning_tasks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LearningTask {self.session_id}>'
+
+
+class DataVersion(db.Model):
+    """Contador de cambios escritos por otros procesos (herramientas de importación)"""
+    __tablename__ = 'data_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+
 class SystemStats(db.Model):
     """Estadísticas globales del sistema"""
     __tablename__ = 'system_stats'
@@ -0,0 +1,179 @@
+"""
+Árbol de aperturas precompilado
+Compila las primeras preguntas de la estrategia en un árbol indexado por el camino
+de respuestas, para servir las aperturas sin recalcular la ganancia de información
+
+Uso como CLI:
+    python backend/opening_tree.py --depth 4 --output opening_tree.json
+"""
+import json
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+from attribute_model import AttributeModel, ANSWER_RANGE
+from session_state import SessionState
+
+
+FORMAT_VERSION = 2
+
+
+class OpeningTree:
+    """
+    Árbol de decisión de las primeras preguntas
+
+    Cada nodo se identifica por la tupla de valores de respuesta (-2..2) dados
+    desde el inicio de la partida y guarda el ID de la pregunta a realizar.
+    El árbol solo es válido para el modelo (huella) y la configuración de
+    selección (motor de puntuación y lookahead) con los que se compiló.
+    """
+
+    def __init__(self, nodes: Dict[Tuple[int, ...], int], model_fingerprint: str,
+                 selection: str, depth: int, created_at: Optional[float] = None):
+        """
+        Args:
+            nodes: Dict {camino de respuestas: question_id}
+            model_fingerprint: Huella del modelo usado al compilar
+            selection: Configuración de selección usada al compilar
+                (GameEngine.selection_namespace)
+            depth: Número de niveles de preguntas compilados
+            created_at: Timestamp de compilación
+        """
+        self.nodes = nodes
+        self.model_fingerprint = model_fingerprint
+        self.selection = selection
+        self.depth = depth
+        self.created_at = created_at or time.time()
+
+    def matches(self, model: AttributeModel, selection: str) -> bool:
+        """Indica si el árbol fue compilado para este modelo y configuración de selección"""
+        return self.model_fingerprint == model.fingerprint and self.selection == selection
+
+    def question_for(self, path: Tuple[int, ...]) -> Optional[int]:
+        """ID de la pregunta para un camino de respuestas, o None si está fuera del árbol"""
+        return self.nodes.get(path)
+
+    @classmethod
+    def compile(cls, model: AttributeModel, selector, scoring, depth: int,
+                min_questions: int, selection: str) -> 'OpeningTree':
+        """
+        Compila el árbol simulando el flujo de GameEngine.process_answer
+
+        Args:
+            model: Modelo de atributos
+            selector: QuestionSelector usado para elegir cada pregunta
+            scoring: ScoringEngine de las partidas
+            depth: Número de niveles de preguntas a compilar
+            min_questions: Mínimo de preguntas antes de adivinar (GameEngine.MIN_QUESTIONS)
+            selection: Configuración de selección de `selector` y `scoring`
+                (GameEngine.selection_namespace)
+
+        Returns:
+            OpeningTree con hasta 1 + 5 + ... + 5^(depth-1) nodos
+        """
+        nodes = {}
+        root = SessionState(model, None, scoring.init_scores(model), scoring.init_stats(model))
+        pending = [((), root, np.arange(model.num_characters, dtype=np.int64))]
+
+        while pending:
+            path, session, rows = pending.pop()
+            question = selector.select_best_question_for_rows(
+                rows,
+                session.asked_questions,
+                model
+            )
+            if question is None:
+                continue
+
+            nodes[path] = question.id
+            if len(path) + 1 >= depth:
+                continue
+
+            col = model.key_to_col[question.attribute_key]
+            for answer_value in ANSWER_RANGE:
+                child = session.copy()
+                child.record_answer(question.id, answer_value)
+                scoring.update_scores(child, rows, col, answer_value)
+                child_rows = scoring.filter_candidates(child, rows)
+
+                # Si la partida adivinaría aquí, no hay pregunta siguiente
+                should_guess, _ = scoring.should_make_guess(child, child_rows, min_questions)
+                if should_guess or len(child_rows) == 0:
+                    continue
+
+                pending.append((path + (answer_value,), child, child_rows))
+
+        return cls(nodes, model.fingerprint, selection, depth)
+
+    def to_dict(self) -> Dict:
+        return {
+            'format_version': FORMAT_VERSION,
+            'model_fingerprint': self.model_fingerprint,
+            'selection': self.selection,
+            'depth': self.depth,
+            'created_at': self.created_at,
+            'nodes': {
+                ','.join(str(value) for value in path): question_id
+                for path, question_id in self.nodes.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'OpeningTree':
+        """
+        Raises:
+            ValueError: Si el formato del artefacto no es compatible
+        """
+        if data.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Formato de árbol no soportado: {data.get('format_version')}")
+
+        nodes = {
+            tuple(int(value) for value in key.split(',')) if key else (): question_id
+            for key, question_id in data['nodes'].items()
+        }
+        return cls(nodes, data['model_fingerprint'], data['selection'],
+                   data['depth'], data.get('created_at'))
+
+    def save(self, path: str):
+        """Guarda el árbol como artefacto JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> 'OpeningTree':
+        """Carga un árbol desde un artefacto JSON"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def main():
+    """Compila el árbol de aperturas desde la base de datos configurada"""
+    import argparse
+    from app import app, game_engine
+
+    parser = argparse.ArgumentParser(description='Compila el árbol de aperturas')
+    parser.add_argument('--depth', type=int, default=4, help='Niveles de preguntas a compilar')
+    parser.add_argument('--output', default='opening_tree.json', help='Archivo de salida')
+    args = parser.parse_args()
+
+    with app.app_context():
+        model = game_engine.question_selector.model
+
+    start = time.perf_counter()
+    tree = OpeningTree.compile(
+        model,
+        game_engine.question_selector,
+        game_engine.scoring,
+        args.depth,
+        game_engine.MIN_QUESTIONS,
+        game_engine.selection_namespace()
+    )
+    elapsed = time.perf_counter() - start
+    tree.save(args.output)
+
+    print(f"✓ Árbol compilado: {len(tree.nodes)} nodos, profundidad {args.depth} ({elapsed:.2f}s)")
+    print(f"✓ Modelo: {tree.model_fingerprint[:12]} | Selección: {tree.selection}")
+    print(f"✓ Guardado en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,146 +2,451 @@
 Algoritmo de selección inteligente de preguntas basado en entropía
 """
 import math
-from collections import defaultdict
-from typing import List, Dict, Set
-from models import Question, Character, CharacterAttribute
+import os
+import threading
+import time
+from typing import Callable, Collection, Iterable, List, Dict, Optional
+import numpy as np
+from attribute_model import AttributeModel, CandidateHistograms, QuestionRecord, ANSWER_RANGE
+from bitset import rows_to_bits
+from model_file import load_model
+from speculation import native_lock
 
 
 class QuestionSelector:
     """Selecciona la mejor pregunta usando ganancia de información"""
     
-    def __init__(self, db_session):
+    # Preguntas evaluadas por bloque en la búsqueda por cotas
+    SEARCH_CHUNK = 32
+    # Holgura numérica al comparar cotas con la mejor ganancia (preserva empates)
+    BOUND_TOLERANCE = 1e-9
+    
+    def __init__(
+        self,
+        db_session,
+        model: Optional[AttributeModel] = None,
+        lookahead_top_k: int = 0,
+        lookahead_budget_ms: float = 50.0,
+        model_path: Optional[str] = None
+    ):
+        """
+        Args:
+            db_session: Sesión de SQLAlchemy (solo se usa al construir el modelo)
+            model: Modelo de atributos precargado (opcional)
+            lookahead_top_k: Preguntas de primer nivel a evaluar con ganancia
+                esperada a dos pasos (0 = selección greedy)
+            lookahead_budget_ms: Tiempo máximo por selección en modo lookahead
+            model_path: Archivo binario del modelo (ver model_file) a mapear en
+                memoria al construir el primer modelo, en lugar de leer la base
+        """
         self.db = db_session
+        self._model = model
+        self.model_path = model_path
+        self._build_lock = threading.Lock()
+        self.model_builds = {'file': 0, 'full': 0, 'delta': 0, 'last_ms': 0.0}
+        self.lookahead_top_k = lookahead_top_k
+        self.lookahead_budget_ms = lookahead_budget_ms
+        self.lookahead_stats = {
+            'selections': 0,
+            'changed': 0,
+            'budget_exhausted': 0,
+            'total_ms': 0.0
+        }
+        # Las ramas especulativas seleccionan desde hilos nativos aun con gevent
+        self._stats_lock = native_lock()
+    
+    @property
+    def model(self) -> AttributeModel:
+        """
+        Última instantánea publicada del modelo, construida en el primer uso
+        
+        Leerla no toma locks: quien la obtiene la sigue usando aunque se
+        publique otra mientras tanto.
+        """
+        model = self._model
+        if model is None:
+            with self._build_lock:
+                if self._model is None:
+                    self._model = self._initial_model()
+                model = self._model
+        return model
+    
+    def _initial_model(self) -> AttributeModel:
+        """Primer modelo: desde el archivo mapeado si está configurado y es válido"""
+        start = time.perf_counter()
+        if self.model_path and os.path.exists(self.model_path):
+            try:
+                model = load_model(self.model_path, self.db)
+                self.model_builds['file'] += 1
+                self.model_builds['last_ms'] = (time.perf_counter() - start) * 1000.0
+                return model
+            except ValueError as e:
+                print(f"Archivo de modelo inválido, se lee la base de datos: {e}")
+        
+        model = AttributeModel.from_db(self.db)
+        self.model_builds['full'] += 1
+        self.model_builds['last_ms'] = (time.perf_counter() - start) * 1000.0
+        return model
+    
+    def refresh_model(self, character_ids: Optional[Iterable[int]] = None) -> AttributeModel:
+        """
+        Construye una instantánea nueva del modelo y la publica
+        
+        Debe llamarse después de escribir personajes, atributos o preguntas.
+        Con `character_ids` solo relee esos personajes, los nuevos y las
+        preguntas (AttributeModel.with_changes); sin ellos reconstruye desde
+        cero. Las construcciones se
+        serializan para que cada delta parta del último modelo publicado, y la
+        publicación es un cambio atómico de referencia.
+        
+        Args:
+            character_ids: IDs de personajes con atributos modificados (None = todo)
+        """
+        with self._build_lock:
+            start = time.perf_counter()
+            current = self._model
+            version = current.version + 1 if current is not None else 1
+            
+            if current is not None and character_ids is not None:
+                model = current.with_changes(self.db, character_ids, version)
+                self.model_builds['delta'] += 1
+            else:
+                model = AttributeModel.from_db(self.db, version=version)
+                self.model_builds['full'] += 1
+            
+            self.model_builds['last_ms'] = (time.perf_counter() - start) * 1000.0
+            self._model = model
+        return model
     
     def select_best_question(
         self, 
         candidate_ids: List[int], 
-        asked_questions: Set[int],
-        answers: Dict[str, int]
-    ) -> Question:
+        asked_questions: Collection[int],
+        answers: Dict[str, int],
+        model: Optional[AttributeModel] = None
+    ) -> QuestionRecord:
         """
         Selecciona la pregunta que maximiza la ganancia de información
         
         Args:
             candidate_ids: IDs de personajes candidatos actuales
-            asked_questions: Set de IDs de preguntas ya realizadas
+            asked_questions: IDs de las preguntas ya realizadas
             answers: Diccionario de respuestas previas {attribute_key: value}
+            model: Modelo a usar (por defecto el modelo actual del selector)
         
         Returns:
-            Objeto Question con la mejor pregunta
+            QuestionRecord con la mejor pregunta
         """
         if not candidate_ids:
             return None
         
-        # Obtener todas las preguntas disponibles
-        available_questions = self.db.query(Question).filter(
-            ~Question.id.in_(asked_questions)
-        ).all()
+        model = model or self.model
+        return self.select_best_question_for_rows(
+            model.rows_for(candidate_ids),
+            asked_questions,
+            model
+        )
+    
+    def select_best_question_for_rows(
+        self,
+        candidate_rows: np.ndarray,
+        asked_questions: Collection[int],
+        model: Optional[AttributeModel] = None
+    ) -> QuestionRecord:
+        """
+        Igual que select_best_question pero con candidatos como filas del modelo
         
-        if not available_questions:
+        Args:
+            candidate_rows: Índices de fila de los candidatos en el modelo
+            asked_questions: IDs de las preguntas ya realizadas
+            model: Modelo al que pertenecen las filas (por defecto el actual)
+        
+        Returns:
+            QuestionRecord con la mejor pregunta
+        """
+        if len(candidate_rows) == 0:
             return None
         
-        # Calcular entropía actual
-        current_entropy = self._calculate_entropy(len(candidate_ids))
+        model = model or self.model
+        available = model.available_question_indices(asked_questions)
+        if len(available) == 0:
+            return None
         
-        best_question = None
-        best_gain = -1
+        histograms_for = lambda indices: model.answer_histograms(
+            candidate_rows, model.question_cols[indices]
+        )
         
-        for question in available_questions:
-            # Calcular ganancia de información para esta pregunta
-            gain = self._calculate_information_gain(
-                question,
-                candidate_ids,
-                current_entropy
+        if self._use_lookahead(len(candidate_rows)):
+            return self._lookahead_question(
+                model,
+                available,
+                histograms_for(available),
+                rows_to_bits(candidate_rows, model.num_characters),
+                len(candidate_rows)
             )
-            
-            # Ajustar por efectividad histórica
-            adjusted_gain = gain * question.effectiveness_score
-            
-            if adjusted_gain > best_gain:
-                best_gain = adjusted_gain
-                best_question = question
         
-        return best_question
+        # Cota con los valores distintos del modelo completo (no requiere contar)
+        return self._best_question(
+            model,
+            available,
+            model.question_distinct[available],
+            histograms_for,
+            len(candidate_rows)
+        )
     
-    def _calculate_entropy(self, num_candidates: int) -> float:
-        """Calcula la entropía del conjunto actual"""
-        if num_candidates <= 1:
-            return 0.0
+    def select_best_question_from_histograms(
+        self,
+        histograms: CandidateHistograms,
+        asked_questions: Collection[int],
+        model: Optional[AttributeModel] = None,
+        candidates: Optional[np.ndarray] = None
+    ) -> QuestionRecord:
+        """
+        Igual que select_best_question pero leyendo los histogramas incrementales de la sesión
         
-        # Asumiendo distribución uniforme
-        probability = 1.0 / num_candidates
-        return -num_candidates * (probability * math.log2(probability))
+        Args:
+            histograms: Histogramas de respuestas de los candidatos actuales
+            asked_questions: IDs de las preguntas ya realizadas
+            model: Modelo al que pertenecen los histogramas (por defecto el actual)
+            candidates: Bitset de candidatos (necesario para el modo lookahead)
+        
+        Returns:
+            QuestionRecord con la mejor pregunta
+        """
+        if histograms.total == 0:
+            return None
+        
+        model = model or self.model
+        available = model.available_question_indices(asked_questions)
+        if len(available) == 0:
+            return None
+        
+        counts = histograms.counts
+        
+        if candidates is not None and self._use_lookahead(histograms.total):
+            return self._lookahead_question(
+                model,
+                available,
+                counts[model.question_cols[available]],
+                candidates,
+                histograms.total
+            )
+        
+        distinct = np.count_nonzero(counts[model.question_cols[available]] > 0, axis=1)
+        return self._best_question(
+            model,
+            available,
+            distinct,
+            lambda indices: counts[model.question_cols[indices]],
+            histograms.total
+        )
     
-    def _calculate_information_gain(
+    def _best_question(
         self,
-        question: Question,
-        candidate_ids: List[int],
-        current_entropy: float
-    ) -> float:
+        model: AttributeModel,
+        question_indices: np.ndarray,
+        distinct_values: np.ndarray,
+        histograms_for: Callable[[np.ndarray], np.ndarray],
+        total: int
+    ) -> QuestionRecord:
         """
-        Calcula la ganancia de información de una pregunta
+        Elige la pregunta de mayor ganancia de información con poda por cotas
         
         Ganancia = Entropía(S) - Σ((|Sv|/|S|) * Entropía(Sv))
-        """
-        # Obtener distribución de respuestas para esta pregunta
-        distribution = self._get_answer_distribution(question, candidate_ids)
         
-        if not distribution:
-            return 0.0
+        Con distribución uniforme Entropía(S) = log2(|S|), así que la ganancia
+        se obtiene directamente de los histogramas de 5 buckets (-2..2).
+        Los personajes sin el atributo definido cuentan como "No sé" (0).
         
-        # Calcular entropía ponderada después de la pregunta
-        weighted_entropy = 0.0
-        total_candidates = len(candidate_ids)
+        La ganancia de una pregunta nunca supera log2(min(valores distintos, |S|)),
+        así que las preguntas se evalúan por bloques en orden de cota ajustada
+        por effectiveness_score y la búsqueda se detiene cuando ninguna cota
+        restante puede superar a la mejor. El resultado (incluidos los empates)
+        es el mismo que el de la búsqueda exhaustiva.
         
-        for value, count in distribution.items():
-            if count > 0:
-                probability = count / total_candidates
-                subset_entropy = self._calculate_entropy(count)
-                weighted_entropy += probability * subset_entropy
+        Args:
+            model: Modelo de atributos
+            question_indices: Índices de las preguntas disponibles en model.questions
+            distinct_values: Cota de valores distintos de cada pregunta entre los candidatos
+            histograms_for: Función que devuelve los histogramas (n × 5) de unos índices
+            total: Número de candidatos
         
-        # Ganancia de información
-        gain = current_entropy - weighted_entropy
+        Returns:
+            QuestionRecord con la mayor ganancia ajustada por effectiveness_score
+        """
+        effectiveness = model.question_effectiveness[question_indices]
+        bounds = effectiveness * np.log2(np.clip(np.minimum(distinct_values, total), 1, None))
+        order = np.argsort(-bounds, kind='stable')
         
-        return gain
+        best_gain = -1.0
+        best_position = None
+        for start in range(0, len(order), self.SEARCH_CHUNK):
+            positions = order[start:start + self.SEARCH_CHUNK]
+            positions = positions[bounds[positions] >= best_gain - self.BOUND_TOLERANCE]
+            if len(positions) == 0:
+                break
+            
+            gains = information_gain_from_histograms(
+                histograms_for(question_indices[positions]),
+                total
+            ) * effectiveness[positions]
+            
+            # Ante empates gana la pregunta que aparece primero, como en la búsqueda exhaustiva
+            chunk_best = gains.max()
+            chunk_position = int(positions[gains == chunk_best].min())
+            if chunk_best > best_gain or (chunk_best == best_gain and chunk_position < best_position):
+                best_gain = chunk_best
+                best_position = chunk_position
+        
+        return model.questions[question_indices[best_position]]
+    
+    def _use_lookahead(self, total: int) -> bool:
+        """El lookahead solo tiene sentido con más candidatos que una sola pregunta puede separar"""
+        return self.lookahead_top_k > 0 and total > len(ANSWER_RANGE)
     
-    def _get_answer_distribution(
+    def _lookahead_question(
         self,
-        question: Question,
-        candidate_ids: List[int]
-    ) -> Dict[int, int]:
+        model: AttributeModel,
+        question_indices: np.ndarray,
+        histograms: np.ndarray,
+        candidates: np.ndarray,
+        total: int
+    ) -> QuestionRecord:
         """
-        Obtiene la distribución de respuestas para una pregunta entre los candidatos
+        Elige la pregunta con mejor ganancia esperada a dos pasos
+        
+        Para las `lookahead_top_k` mejores preguntas de primer nivel calcula
+        
+            valor(q) = ganancia(q) + Σ_v P(v) * max_q2 ganancia(q2 | candidatos con valor v)
+        
+        contando cada rama con AND + popcount sobre las listas de posteo. Las
+        preguntas se evalúan en orden de ganancia de primer nivel y la búsqueda
+        se corta al agotar `lookahead_budget_ms` (la greedy siempre se evalúa).
+        
+        Args:
+            model: Modelo de atributos
+            question_indices: Índices de las preguntas disponibles en model.questions
+            histograms: Histogramas (preguntas × 5) de los candidatos actuales
+            candidates: Bitset de candidatos
+            total: Número de candidatos
         
         Returns:
-            Dict {value: count} donde value es -2, -1, 0, 1, 2
+            QuestionRecord con el mejor valor a dos pasos
         """
-        distribution = defaultdict(int)
+        start = time.perf_counter()
+        deadline = start + self.lookahead_budget_ms / 1000.0
+        
+        effectiveness = model.question_effectiveness[question_indices]
+        gains = information_gain_from_histograms(histograms, total) * effectiveness
+        # Orden estable: ante empates primero la de menor ID, como la greedy
+        order = np.argsort(-gains, kind='stable')[:self.lookahead_top_k]
+        greedy_position = int(order[0])
+        
+        cols = model.question_cols[question_indices]
+        postings = model.postings
+        best_position = greedy_position
+        best_value = -1.0
+        exhausted = False
         
-        # Obtener atributos de los candidatos para esta pregunta
-        attributes = self.db.query(CharacterAttribute).filter(
-            CharacterAttribute.character_id.in_(candidate_ids),
-            CharacterAttribute.attribute_key == question.attribute_key
-        ).all()
+        for position in order:
+            if position != greedy_position and time.perf_counter() > deadline:
+                exhausted = True
+                break
+            
+            col = cols[position]
+            value = gains[position]
+            for bucket in range(len(ANSWER_RANGE)):
+                branch_total = int(histograms[position, bucket])
+                if branch_total <= 1:
+                    continue
+                branch_histograms = model.bitset_histograms(candidates & postings[col, bucket], cols)
+                branch_gains = information_gain_from_histograms(branch_histograms, branch_total)
+                value += branch_total / total * float((branch_gains * effectiveness).max())
+            
+            if value > best_value:
+                best_value = value
+                best_position = int(position)
         
-        # Contar respuestas
-        for attr in attributes:
-            distribution[attr.value] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with self._stats_lock:
+            stats = self.lookahead_stats
+            stats['selections'] += 1
+            stats['changed'] += best_position != greedy_position
+            stats['budget_exhausted'] += exhausted
+            stats['total_ms'] += elapsed_ms
         
-        # Personajes sin este atributo definido (asumir "No sé" = 0)
-        characters_with_attr = len(attributes)
-        if characters_with_attr < len(candidate_ids):
-            distribution[0] += len(candidate_ids) - characters_with_attr
+        return model.questions[question_indices[best_position]]
+    
+    def get_lookahead_stats(self) -> Dict:
+        """
+        Métricas del modo lookahead
         
-        return dict(distribution)
+        Returns:
+            Dict con selecciones, cambios respecto a la greedy y tiempo promedio
+        """
+        with self._stats_lock:
+            stats = dict(self.lookahead_stats)
+        selections = stats['selections']
+        return {
+            'enabled': self.lookahead_top_k > 0,
+            'top_k': self.lookahead_top_k,
+            'budget_ms': self.lookahead_budget_ms,
+            'selections': selections,
+            'changed': stats['changed'],
+            'change_rate': round(stats['changed'] / selections, 4) if selections else 0,
+            'budget_exhausted': stats['budget_exhausted'],
+            'avg_ms': round(stats['total_ms'] / selections, 3) if selections else 0
+        }
     
-    def get_fallback_question(self, asked_questions: Set[int]) -> Question:
+    def get_model_stats(self) -> Dict:
+        """
+        Métricas de las instantáneas del modelo
+        
+        Returns:
+            Dict con la versión publicada, su tamaño y las construcciones completas/delta
+        """
+        model = self._model
+        return {
+            'version': model.version if model is not None else 0,
+            'characters': model.num_characters if model is not None else 0,
+            'file_loads': self.model_builds['file'],
+            'full_builds': self.model_builds['full'],
+            'delta_builds': self.model_builds['delta'],
+            'last_build_ms': round(self.model_builds['last_ms'], 1)
+        }
+    
+    def get_fallback_question(self, asked_questions: Collection[int]) -> QuestionRecord:
         """
         Obtiene una pregunta de respaldo cuando el algoritmo falla
         Prioriza preguntas con alta efectividad que no se han hecho
         """
-        question = self.db.query(Question).filter(
-            ~Question.id.in_(asked_questions)
-        ).order_by(Question.effectiveness_score.desc()).first()
+        available_questions = [
+            question for question in self.model.questions
+            if question.id not in asked_questions
+        ]
+        if not available_questions:
+            return None
         
-        return question
+        return max(available_questions, key=lambda q: q.effectiveness_score)
+
+
+def information_gain_from_histograms(histograms: np.ndarray, total: int) -> np.ndarray:
+    """
+    Ganancia de información de cada fila de histogramas de respuestas
+    
+    Args:
+        histograms: Matriz (preguntas × buckets) con conteos de candidatos
+        total: Número total de candidatos
+    
+    Returns:
+        Array float64 con la ganancia de cada pregunta (sin ajustar)
+    """
+    if total <= 1:
+        return np.zeros(len(histograms), dtype=np.float64)
+    
+    counts = histograms.astype(np.float64)
+    # c * log2(c), con 0 * log2(0) = 0 (los subconjuntos de 1 tienen entropía 0)
+    safe_counts = np.where(counts > 0, counts, 1.0)
+    weighted_entropy = (counts * np.log2(safe_counts)).sum(axis=1) / total
+    
+    return math.log2(total) - weighted_entropy
@@ -0,0 +1,246 @@
+"""
+Caché de registros de preguntas y personajes
+Evita consultar e hidratar objetos ORM en el camino de las respuestas: los datos
+que no cambian al jugar (texto, atributo, nombre, descripción, imagen) se leen
+una vez por proceso y se descartan cuando alguien los modifica
+"""
+import threading
+import time
+import weakref
+from itertools import chain
+from typing import Dict, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from attribute_model import QuestionRecord
+from models import Character, DataVersion, Question
+
+
+# Campos cacheados cuya modificación invalida la caché (los contadores no)
+QUESTION_FIELDS = ('text', 'attribute_key')
+CHARACTER_FIELDS = ('name', 'description', 'image_url')
+
+# Clave en Session.info que marca una transacción con cambios en registros cacheados
+DIRTY_FLAG = 'record_cache_dirty'
+
+# Fila de data_versions que incrementan los procesos que escriben registros fuera de los workers
+RECORDS_VERSION = 'records'
+
+
+class CharacterRecord:
+    """
+    Registro inmutable de un personaje
+
+    Los contadores se guardan como estaban al leer el registro (no invalidan la
+    caché), solo para mantener la forma de Character.to_dict().
+    """
+
+    __slots__ = ('id', 'name', 'description', 'image_url', 'times_guessed', 'times_played')
+
+    def __init__(self, id: int, name: str, description: Optional[str], image_url: Optional[str],
+                 times_guessed: int, times_played: int):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.image_url = image_url
+        self.times_guessed = times_guessed or 0
+        self.times_played = times_played or 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'image_url': self.image_url,
+            'times_guessed': self.times_guessed,
+            'times_played': self.times_played
+        }
+
+
+class RecordCache:
+    """
+    Caché read-through y versionada de QuestionRecord y CharacterRecord
+
+    Las lecturas que fallan consultan solo las columnas necesarias (sin objetos
+    ORM). Cada invalidación incrementa `version`; una lectura que empezó antes
+    de una invalidación no guarda su resultado, así nunca vuelve a entrar un
+    registro viejo.
+
+    La invalidación es automática: cualquier commit en este proceso que cree,
+    borre o modifique el texto/atributo de una pregunta o el nombre/descripción/
+    imagen de un personaje (LearningSystem, /api/character/add) descarta la
+    caché. Las herramientas de importación corren en otro proceso y sus commits
+    no disparan esos eventos: incrementan la versión `records` de data_versions
+    (publish_record_changes), que la caché compara cada `check_interval` segundos.
+    """
+
+    _instances = weakref.WeakSet()
+    _listening = False
+    _listen_lock = threading.Lock()
+
+    def __init__(self, db_session, check_interval: Optional[float] = 5.0):
+        """
+        Args:
+            db_session: Sesión de SQLAlchemy usada en los fallos de caché
+            check_interval: Segundos entre consultas de la versión que publican
+                otros procesos (None = solo invalidación dentro del proceso)
+        """
+        self.db = db_session
+        self.check_interval = check_interval
+        self.version = 0
+        self._questions = {}
+        self._characters = {}
+        self._external_version = None
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.external_invalidations = 0
+
+        RecordCache._instances.add(self)
+        RecordCache._listen()
+
+    def question(self, question_id: int) -> Optional[QuestionRecord]:
+        """Registro de una pregunta, o None si no existe"""
+        self._check_external_changes()
+        record = self._questions.get(question_id)
+        if record is not None:
+            self.hits += 1
+            return record
+
+        self.misses += 1
+        version = self.version
+        row = self.db.query(
+            Question.id,
+            Question.text,
+            Question.attribute_key,
+            Question.times_asked,
+            Question.effectiveness_score
+        ).filter(Question.id == question_id).first()
+        if row is None:
+            return None
+
+        record = QuestionRecord(*row)
+        if version == self.version:
+            self._questions[question_id] = record
+        return record
+
+    def character(self, character_id: int) -> Optional[CharacterRecord]:
+        """Registro de un personaje, o None si no existe"""
+        self._check_external_changes()
+        record = self._characters.get(character_id)
+        if record is not None:
+            self.hits += 1
+            return record
+
+        self.misses += 1
+        version = self.version
+        row = self.db.query(
+            Character.id,
+            Character.name,
+            Character.description,
+            Character.image_url,
+            Character.times_guessed,
+            Character.times_played
+        ).filter(Character.id == character_id).first()
+        if row is None:
+            return None
+
+        record = CharacterRecord(*row)
+        if version == self.version:
+            self._characters[character_id] = record
+        return record
+
+    def invalidate(self):
+        """Descarta todos los registros cacheados"""
+        self.version += 1
+        self._questions = {}
+        self._characters = {}
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'version': self.version,
+            'questions': len(self._questions),
+            'characters': len(self._characters),
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'external_invalidations': self.external_invalidations
+        }
+
+    def _check_external_changes(self):
+        """Descarta la caché si otro proceso publicó cambios (a lo sumo una consulta por intervalo)"""
+        if self.check_interval is None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        version = self.db.query(DataVersion.version).filter(
+            DataVersion.name == RECORDS_VERSION
+        ).scalar() or 0
+        if self._external_version is not None and version != self._external_version:
+            self.invalidate()
+            self.external_invalidations += 1
+        self._external_version = version
+
+    @classmethod
+    def _listen(cls):
+        """Registra (una vez por proceso) los eventos de SQLAlchemy que invalidan las cachés"""
+        with cls._listen_lock:
+            if cls._listening:
+                return
+            event.listen(Session, 'after_flush', _mark_dirty)
+            event.listen(Session, 'after_commit', _invalidate_if_dirty)
+            event.listen(Session, 'after_soft_rollback', _clear_dirty)
+            cls._listening = True
+
+
+def publish_record_changes(db_session):
+    """
+    Avisa a los workers que este proceso cambió preguntas o personajes
+
+    Incrementa la versión `records` de data_versions y confirma la
+    transacción. Lo llaman las herramientas de importación después de
+    escribir; cada worker descarta su caché de registros en su próxima
+    comprobación (ver RecordCache.check_interval).
+
+    Args:
+        db_session: Sesión de SQLAlchemy
+    """
+    updated = db_session.query(DataVersion).filter(DataVersion.name == RECORDS_VERSION).update(
+        {DataVersion.version: DataVersion.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db_session.add(DataVersion(name=RECORDS_VERSION, version=1))
+    db_session.commit()
+
+
+def _changes_cached_fields(obj, session) -> bool:
+    """Indica si un objeto ORM del flush afecta a un registro cacheado"""
+    if isinstance(obj, Question):
+        fields = QUESTION_FIELDS
+    elif isinstance(obj, Character):
+        fields = CHARACTER_FIELDS
+    else:
+        return False
+
+    if obj in session.new or obj in session.deleted:
+        return True
+    attrs = inspect(obj).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+
+def _mark_dirty(session, flush_context):
+    objects = chain(session.new, session.dirty, session.deleted)
+    if any(_changes_cached_fields(obj, session) for obj in objects):
+        session.info[DIRTY_FLAG] = True
+
+
+def _invalidate_if_dirty(session):
+    if session.info.pop(DIRTY_FLAG, False):
+        for cache in list(RecordCache._instances):
+            cache.invalidate()
+
+
+def _clear_dirty(session, previous_transaction):
+    session.info.pop(DIRTY_FLAG, None)
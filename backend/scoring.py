@@ -0,0 +1,366 @@
+"""
+Motores de puntuación de candidatos
+Actualizan las puntuaciones de una partida con operaciones vectorizadas sobre el modelo
+"""
+from typing import TYPE_CHECKING, Optional, Tuple
+import numpy as np
+from attribute_model import AttributeModel, VALUE_OFFSET
+
+if TYPE_CHECKING:
+    from session_state import SessionState
+
+
+class CandidateStats:
+    """
+    Estadísticas de los candidatos de una sesión mantenidas por el motor de puntuación
+
+    Permiten decidir la adivinanza y el umbral de filtrado sin recorrer de nuevo
+    todos los candidatos.
+    """
+
+    __slots__ = ('leader', 'leader_score', 'total', 'count', 'pruned_max', 'ranking')
+
+    def __init__(self, leader: Optional[int], leader_score: float, total: float,
+                 count: int, pruned_max: float = -np.inf, ranking: Optional[np.ndarray] = None):
+        """
+        Args:
+            leader: Fila del mejor candidato (ante empates, el primero en el
+                orden de candidatos: el de fila menor, o el primero de `ranking`)
+            leader_score: Puntuación del mejor candidato
+            total: Agregado de puntuaciones de los candidatos (depende del motor)
+            count: Número de candidatos
+            pruned_max: Mayor puntuación entre los candidatos ya descartados
+            ranking: Orden de los candidatos desde que el respaldo de los
+                mejores N los ordenó por puntuación (None = orden de fila)
+        """
+        self.leader = leader
+        self.leader_score = leader_score
+        self.total = total
+        self.count = count
+        self.pruned_max = pruned_max
+        self.ranking = ranking
+
+    def copy(self) -> 'CandidateStats':
+        # ranking nunca se modifica en el lugar, se reemplaza
+        return CandidateStats(self.leader, self.leader_score, self.total,
+                              self.count, self.pruned_max, self.ranking)
+
+
+class ScoringEngine:
+    """
+    Interfaz de un motor de puntuación
+
+    Las puntuaciones de una sesión son un array alineado a las filas del modelo
+    (session.scores) y sus estadísticas un CandidateStats (session.stats).
+    Los candidatos se pasan como array ordenado de filas.
+
+    Cada respuesta recorre los candidatos una sola vez al actualizar (líder y
+    agregados se calculan en esa misma pasada); el filtrado solo vuelve a
+    tocar las filas eliminadas y la decisión de adivinar es O(1).
+    """
+
+    name = 'base'
+
+    def init_scores(self, model: AttributeModel) -> np.ndarray:
+        """Crea el vector de puntuaciones inicial para todas las filas del modelo"""
+        return np.zeros(model.num_characters, dtype=np.float64)
+
+    def init_stats(self, model: AttributeModel) -> CandidateStats:
+        """Estadísticas iniciales con todas las filas como candidatas"""
+        raise NotImplementedError
+
+    def update_scores(self, session: 'SessionState', rows: np.ndarray, col: int, answer_value: int):
+        """Aplica una respuesta a las puntuaciones de los candidatos `rows`"""
+        raise NotImplementedError
+
+    def filter_candidates(self, session: 'SessionState', rows: np.ndarray) -> np.ndarray:
+        """Devuelve las filas candidatas que siguen en juego (subconjunto de `rows`)"""
+        raise NotImplementedError
+
+    def should_make_guess(self, session: 'SessionState', rows: np.ndarray,
+                          min_questions: int) -> Tuple[bool, Optional[int]]:
+        """
+        Determina si debemos hacer una adivinanza
+
+        Returns:
+            (should_guess, row)
+        """
+        raise NotImplementedError
+
+    def best_candidate(self, session: 'SessionState', rows: np.ndarray) -> Optional[int]:
+        """Fila del candidato con mayor puntuación"""
+        if len(rows) == 0:
+            return None
+        return session.stats.leader
+
+    def _update_leader(self, stats: CandidateStats, rows: np.ndarray, new_scores: np.ndarray):
+        """
+        Actualiza el líder con las puntuaciones recién calculadas de `rows`
+
+        Ante empates gana el primero en el orden de candidatos, como el max()
+        original sobre la lista de candidatos.
+        """
+        if len(rows) == 0:
+            return
+        if stats.ranking is None:
+            top_index = int(np.argmax(new_scores))
+        else:
+            ranked = np.searchsorted(rows, stats.ranking)
+            top_index = int(ranked[np.argmax(new_scores[ranked])])
+        stats.leader = int(rows[top_index])
+        stats.leader_score = new_scores[top_index]
+
+    def _keep_top(self, session: 'SessionState', rows: np.ndarray, count: int) -> np.ndarray:
+        """
+        Filas (ordenadas) de los `count` mejores candidatos
+
+        Replica el respaldo original, que ordenaba la lista de candidatos por
+        puntuación (orden estable) y se quedaba con los primeros: los empates se
+        resuelven por el orden de la lista, y el orden resultante queda como
+        ranking de la sesión. Una selección parcial O(n) deja solo los
+        candidatos que pueden entrar antes de ordenar.
+        """
+        stats = session.stats
+        order = rows if stats.ranking is None else stats.ranking
+        scores = session.scores[order]
+
+        contenders = np.arange(len(order))
+        if len(order) > count:
+            cut = len(scores) - count
+            kth_score = np.partition(scores, cut)[cut]
+            contenders = np.flatnonzero(scores >= kth_score)
+
+        best = contenders[np.argsort(-scores[contenders], kind='stable')[:count]]
+        stats.ranking = order[best]
+        return np.sort(stats.ranking)
+
+    def _drop_from_ranking(self, stats: CandidateStats, kept: np.ndarray):
+        """Quita del ranking las filas descartadas (conserva el orden del resto)"""
+        if stats.ranking is not None and len(stats.ranking) > len(kept):
+            stats.ranking = stats.ranking[np.isin(stats.ranking, kept, assume_unique=True)]
+
+    def _removed_rows(self, rows: np.ndarray, kept: np.ndarray) -> np.ndarray:
+        """Filas de `rows` que no están en `kept` (ambas ordenadas)"""
+        return rows[np.isin(rows, kept, assume_unique=True, invert=True)]
+
+
+class PointsScoringEngine(ScoringEngine):
+    """
+    Puntuación entera original
+
+    Cada respuesta suma 4 - 2 * |valor_personaje - respuesta| puntos y los
+    candidatos se filtran con tolerancias fijas de 10 y 8 puntos.
+
+    CandidateStats.total es la suma de puntuaciones de los candidatos: se
+    actualiza en O(5) desde el histograma de la columna respondida y al
+    filtrar se restan solo las filas eliminadas.
+    """
+
+    name = 'points'
+
+    FILTER_TOLERANCE = 10  # Puntos por debajo del máximo para seguir en juego
+    GUESS_MARGIN = 8  # Ventaja sobre el promedio del resto para adivinar
+    MIN_CANDIDATES = 5  # Siempre mantener al menos el top 5
+
+    def init_scores(self, model: AttributeModel) -> np.ndarray:
+        return np.zeros(model.num_characters, dtype=np.int32)
+
+    def init_stats(self, model: AttributeModel) -> CandidateStats:
+        leader = 0 if model.num_characters else None
+        return CandidateStats(leader, 0, 0, model.num_characters)
+
+    def update_scores(self, session: 'SessionState', rows: np.ndarray, col: int, answer_value: int):
+        stats = session.stats
+        bucket_values = np.arange(-2, 3)
+
+        # Diferencia 0 = +4, 1 = +2, 2 = 0, 3 = -2, 4 = -4
+        bucket_delta = 4 - 2 * np.abs(bucket_values - answer_value)
+        char_buckets = session.model.values[rows, col] + VALUE_OFFSET
+
+        new_scores = session.scores[rows] + bucket_delta[char_buckets]
+        session.scores[rows] = new_scores
+
+        # La suma cambia según cuántos candidatos hay en cada bucket de la columna
+        histograms = session.histograms
+        if histograms is not None and histograms.total == len(rows):
+            bucket_counts = histograms.counts[col]
+        else:
+            bucket_counts = np.bincount(char_buckets, minlength=len(bucket_values))
+        stats.total += int(bucket_counts @ bucket_delta)
+
+        self._update_leader(stats, rows, new_scores)
+
+    def filter_candidates(self, session: 'SessionState', rows: np.ndarray) -> np.ndarray:
+        if len(rows) == 0:
+            return rows
+
+        scores = session.scores
+        stats = session.stats
+
+        # El máximo incluye a los candidatos ya descartados, como el filtro original
+        threshold = max(stats.leader_score, stats.pruned_max) - self.FILTER_TOLERANCE
+        filtered = rows[scores[rows] >= threshold]
+
+        if len(filtered) < self.MIN_CANDIDATES and len(rows) >= self.MIN_CANDIDATES:
+            filtered = self._keep_top(session, rows, self.MIN_CANDIDATES)
+
+        if len(filtered) == 0:
+            return rows
+
+        if len(filtered) < len(rows):
+            removed_scores = scores[self._removed_rows(rows, filtered)]
+            stats.total -= int(removed_scores.sum())
+            stats.pruned_max = max(stats.pruned_max, int(removed_scores.max()))
+            stats.count = len(filtered)
+            self._drop_from_ranking(stats, filtered)
+
+        return filtered
+
+    def should_make_guess(self, session: 'SessionState', rows: np.ndarray,
+                          min_questions: int) -> Tuple[bool, Optional[int]]:
+        if session.question_count < min_questions:
+            return False, None
+
+        if len(rows) == 0:
+            return False, None
+
+        stats = session.stats
+        if stats.count == 1:
+            return True, stats.leader
+
+        avg_other_score = (stats.total - stats.leader_score) / (stats.count - 1)
+
+        # Si el top está significativamente por encima del resto
+        if stats.leader_score > avg_other_score + self.GUESS_MARGIN:
+            return True, stats.leader
+
+        return False, None
+
+
+class ProbabilisticScoringEngine(ScoringEngine):
+    """
+    Puntuación probabilística con log-probabilidades
+
+    Mantiene log P(personaje | respuestas) sin normalizar. La verosimilitud de
+    cada respuesta mezcla una tabla de ruido de respuesta con la distribución
+    uniforme según CharacterAttribute.confidence:
+
+        P(respuesta | valor, confianza) = c * L[valor, respuesta] + (1 - c) / 5
+
+    Los atributos no definidos cuentan como "No sé" (0) con confianza
+    MISSING_CONFIDENCE, igual que en el selector de preguntas. La adivinanza se
+    decide por la masa de probabilidad del mejor candidato en lugar de márgenes
+    fijos de puntos. Acierta más que el motor de puntos, pero no hace menos
+    preguntas: con muchos personajes hace más (ver benchmark.py).
+
+    CandidateStats.total es Σ exp(score - leader_score) sobre los candidatos,
+    así que la probabilidad del líder es 1 / total.
+    """
+
+    name = 'probabilistic'
+
+    # Peso relativo de una respuesta según la distancia al valor del personaje
+    DISTANCE_WEIGHTS = (0.80, 0.15, 0.03, 0.015, 0.005)
+    PRUNE_RATIO = 1e-3  # Probabilidad mínima relativa al mejor candidato
+    MIN_CANDIDATES = 5
+
+    def __init__(self, guess_threshold: float = 0.80):
+        """
+        Args:
+            guess_threshold: Masa de probabilidad del mejor candidato para adivinar
+        """
+        self.guess_threshold = guess_threshold
+        self.prune_log_ratio = -np.log(self.PRUNE_RATIO)
+
+        values = np.arange(-2, 3)
+        weights = np.array(self.DISTANCE_WEIGHTS)[np.abs(values[:, None] - values[None, :])]
+        likelihood = weights / weights.sum(axis=1, keepdims=True)
+        self.likelihood = likelihood  # [valor_personaje, respuesta]
+
+    def init_stats(self, model: AttributeModel) -> CandidateStats:
+        leader = 0 if model.num_characters else None
+        return CandidateStats(leader, 0.0, float(model.num_characters), model.num_characters)
+
+    def update_scores(self, session: 'SessionState', rows: np.ndarray, col: int, answer_value: int):
+        model = session.model
+        stats = session.stats
+
+        answer_likelihood = self.likelihood[:, answer_value + VALUE_OFFSET]
+        confidence = model.confidence[rows, col]
+        probability = (
+            confidence * answer_likelihood[model.values[rows, col] + VALUE_OFFSET]
+            + (1.0 - confidence) / len(answer_likelihood)
+        )
+        new_scores = session.scores[rows] + np.log(probability)
+        session.scores[rows] = new_scores
+
+        self._update_leader(stats, rows, new_scores)
+        if len(rows):
+            stats.total = float(np.exp(new_scores - stats.leader_score).sum())
+
+    def posterior(self, session: 'SessionState', rows: np.ndarray) -> np.ndarray:
+        """Probabilidad normalizada de cada candidato (alineada a `rows`)"""
+        log_probs = session.scores[rows]
+        weights = np.exp(log_probs - log_probs.max())
+        return weights / weights.sum()
+
+    def filter_candidates(self, session: 'SessionState', rows: np.ndarray) -> np.ndarray:
+        if len(rows) <= self.MIN_CANDIDATES:
+            return rows
+
+        scores = session.scores
+        stats = session.stats
+        filtered = rows[scores[rows] >= stats.leader_score - self.prune_log_ratio]
+
+        if len(filtered) < self.MIN_CANDIDATES:
+            filtered = self._keep_top(session, rows, self.MIN_CANDIDATES)
+
+        if len(filtered) < len(rows):
+            removed_scores = scores[self._removed_rows(rows, filtered)]
+            removed_mass = float(np.exp(removed_scores - stats.leader_score).sum())
+            # El líder siempre sigue en juego y aporta 1 a la masa relativa
+            stats.total = max(stats.total - removed_mass, 1.0)
+            stats.count = len(filtered)
+            self._drop_from_ranking(stats, filtered)
+
+        return filtered
+
+    def should_make_guess(self, session: 'SessionState', rows: np.ndarray,
+                          min_questions: int) -> Tuple[bool, Optional[int]]:
+        if session.question_count < min_questions:
+            return False, None
+
+        if len(rows) == 0:
+            return False, None
+
+        stats = session.stats
+        if stats.count == 1 or 1.0 / stats.total >= self.guess_threshold:
+            return True, stats.leader
+
+        return False, None
+
+
+SCORING_ENGINES = {
+    PointsScoringEngine.name: PointsScoringEngine,
+    ProbabilisticScoringEngine.name: ProbabilisticScoringEngine,
+}
+
+
+def create_scoring_engine(name: str = 'points', **kwargs) -> ScoringEngine:
+    """
+    Crea un motor de puntuación por nombre
+
+    Args:
+        name: 'points' (original) o 'probabilistic'
+        **kwargs: Argumentos del constructor del motor
+
+    Returns:
+        Instancia de ScoringEngine
+
+    Raises:
+        ValueError: Si el nombre no corresponde a ningún motor
+    """
+    engine_class = SCORING_ENGINES.get(name)
+    if engine_class is None:
+        raise ValueError(f'Motor de puntuación desconocido: {name}')
+    return engine_class(**kwargs)
@@ -0,0 +1,142 @@
+"""
+Caché de selección de preguntas por camino de respuestas
+Muchos jugadores piensan en los mismos personajes y responden lo mismo: el
+estado de la partida (candidatos, puntuaciones, histogramas) depende solo del
+modelo, del motor de puntuación y de la secuencia de (pregunta, respuesta), así
+que la pregunta elegida para ese estado se puede reutilizar entre sesiones
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+
+
+# Valor guardado cuando la selección no encontró pregunta (los IDs empiezan en 1)
+NO_QUESTION = 0
+
+
+class SelectionCache:
+    """
+    Tabla de transposición acotada (LRU) de camino → pregunta elegida
+
+    La clave es un hash del modelo (huella, compartida entre workers), de la
+    configuración de selección y del camino exacto de respuestas. Un modelo
+    nuevo tiene otra huella, así que sus selecciones nunca usan entradas del
+    anterior; las viejas salen por LRU.
+
+    Con un cliente Redis (el del almacenamiento de sesiones) la caché local
+    funciona como primer nivel y Redis como segundo nivel compartido entre
+    workers. Los errores de Redis se cuentan y se ignoran: la caché nunca
+    impide seleccionar.
+    """
+
+    def __init__(self, max_entries: int = 10000, client=None,
+                 prefix: str = 'akinator:selection:', ttl: int = 3600):
+        """
+        Args:
+            max_entries: Máximo de entradas en memoria del proceso
+            client: Cliente redis-py para compartir entradas (opcional)
+            prefix: Prefijo de las claves en Redis
+            ttl: Segundos de vida de una entrada en Redis
+        """
+        self.max_entries = max_entries
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(model_fingerprint: str, namespace: str, question_ids: np.ndarray,
+            answer_values: np.ndarray) -> str:
+        """
+        Clave canónica de un estado de partida
+
+        Args:
+            model_fingerprint: Huella del modelo de la sesión
+            namespace: Configuración que afecta la selección (motor, lookahead)
+            question_ids: Preguntas respondidas, en orden (int32)
+            answer_values: Valores de respuesta alineados (int8)
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model_fingerprint.encode('ascii'))
+        digest.update(namespace.encode('utf-8'))
+        digest.update(np.ascontiguousarray(question_ids, dtype='<i4').tobytes())
+        digest.update(np.ascontiguousarray(answer_values, dtype=np.int8).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str, shared: bool = True) -> Optional[int]:
+        """
+        Pregunta guardada para la clave
+
+        Args:
+            key: Clave de SelectionCache.key
+            shared: Consultar también Redis (False desde hilos sin acceso al cliente)
+
+        Returns:
+            ID de la pregunta, NO_QUESTION si no había pregunta, o None si no está
+        """
+        with self._lock:
+            question_id = self._entries.get(key)
+            if question_id is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return question_id
+
+        if shared and self.client is not None:
+            try:
+                value = self.client.get(self.prefix + key)
+            except Exception:
+                self.errors += 1
+                value = None
+            if value is not None:
+                question_id = int(value)
+                self._remember(key, question_id)
+                self.shared_hits += 1
+                return question_id
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, question_id: int, shared: bool = True):
+        """Guarda la pregunta elegida (NO_QUESTION si no hubo)"""
+        self._remember(key, question_id)
+        if shared and self.client is not None:
+            try:
+                self.client.set(self.prefix + key, question_id, ex=self.ttl)
+            except Exception:
+                self.errors += 1
+
+    def clear(self):
+        """Descarta las entradas en memoria del proceso"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'shared': self.client is not None,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0,
+            'evicted': self.evicted,
+            'errors': self.errors
+        }
+
+    def _remember(self, key: str, question_id: int):
+        with self._lock:
+            self._entries[key] = question_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
@@ -0,0 +1,135 @@
+"""
+Estado compacto de una partida
+Todo el estado por sesión vive en arrays tipados alineados a las filas del modelo,
+sin diccionarios ni enteros de Python por personaje
+"""
+import sys
+from typing import Optional, Tuple
+import numpy as np
+from attribute_model import AttributeModel, CandidateHistograms
+from scoring import CandidateStats
+
+
+class SessionState:
+    """
+    Estado de una partida en curso
+
+    - scores: puntuación de cada fila del modelo (int32 o float64 según el motor)
+    - candidates: bitset de filas candidatas (1 bit por personaje)
+    - histograms: conteos int32 por columna y respuesta de los candidatos
+    - question_ids / answer_values: preguntas respondidas y sus valores (-2..2),
+      en orden, como arrays int32 / int8
+
+    Mientras la partida sigue el árbol de aperturas, el camino del árbol son los
+    valores respondidos, así que no se guarda aparte.
+    """
+
+    __slots__ = ('model', 'candidates', 'scores', 'stats', 'histograms',
+                 'question_ids', 'answer_values', 'opening_tree')
+
+    def __init__(
+        self,
+        model: AttributeModel,
+        candidates: Optional[np.ndarray],
+        scores: np.ndarray,
+        stats: CandidateStats,
+        histograms: Optional[CandidateHistograms] = None,
+        question_ids: Optional[np.ndarray] = None,
+        answer_values: Optional[np.ndarray] = None,
+        opening_tree=None
+    ):
+        """
+        Args:
+            model: Modelo de atributos de la partida
+            candidates: Bitset de filas candidatas (None si no se mantiene)
+            scores: Puntuaciones alineadas a las filas del modelo
+            stats: Estadísticas de los candidatos del motor de puntuación
+            histograms: Histogramas incrementales de los candidatos (opcional)
+            question_ids: IDs de las preguntas respondidas, en orden
+            answer_values: Valores de respuesta alineados a question_ids
+            opening_tree: Árbol de aperturas que sigue la partida (o None)
+        """
+        self.model = model
+        self.candidates = candidates
+        self.scores = scores
+        self.stats = stats
+        self.histograms = histograms
+        self.question_ids = question_ids if question_ids is not None else np.empty(0, dtype=np.int32)
+        self.answer_values = answer_values if answer_values is not None else np.empty(0, dtype=np.int8)
+        self.opening_tree = opening_tree
+
+    @classmethod
+    def new(cls, model: AttributeModel, scoring) -> 'SessionState':
+        """
+        Estado inicial con todos los personajes del modelo como candidatos
+
+        El bitset inicial es compartido y las puntuaciones en cero se reservan
+        sin inicializar memoria, así que crear una sesión no recorre los personajes.
+        """
+        return cls(
+            model,
+            model.all_candidates,
+            scoring.init_scores(model),
+            scoring.init_stats(model),
+            CandidateHistograms.for_all(model)
+        )
+
+    @property
+    def question_count(self) -> int:
+        return len(self.question_ids)
+
+    @property
+    def asked_questions(self) -> np.ndarray:
+        """IDs de las preguntas ya realizadas"""
+        return self.question_ids
+
+    @property
+    def tree_path(self) -> Tuple[int, ...]:
+        """Camino de respuestas dentro del árbol de aperturas"""
+        return tuple(int(value) for value in self.answer_values)
+
+    def has_asked(self, question_id: int) -> bool:
+        return bool((self.question_ids == question_id).any())
+
+    def record_answer(self, question_id: int, answer_value: int):
+        """Agrega una respuesta al historial de la partida"""
+        self.question_ids = np.append(self.question_ids, np.int32(question_id))
+        self.answer_values = np.append(self.answer_values, np.int8(answer_value))
+
+    def copy(self) -> 'SessionState':
+        """Copia independiente (el modelo y el árbol se comparten, son inmutables)"""
+        histograms = self.histograms
+        if histograms is not None:
+            histograms = CandidateHistograms(histograms.counts.copy(), histograms.total)
+        return SessionState(
+            self.model,
+            self.candidates,  # nunca se modifica en el lugar, se reemplaza al filtrar
+            self.scores.copy(),
+            self.stats.copy(),
+            histograms,
+            self.question_ids,  # record_answer crea arrays nuevos
+            self.answer_values,
+            self.opening_tree
+        )
+
+    def nbytes(self) -> int:
+        """
+        Bytes ocupados por el estado de la sesión (sin contar modelo ni árbol)
+
+        Se cuentan los datos de cada array que la sesión referencia, también
+        los que son vistas (el bitset filtrado sale de `.view()`, y para
+        sys.getsizeof una vista solo ocupa su cabecera). Solo se excluye el
+        bitset inicial, que pertenece al modelo y comparten todas las sesiones.
+        """
+        total = sys.getsizeof(self) + sys.getsizeof(self.stats)
+        arrays = [self.candidates, self.scores, self.question_ids, self.answer_values]
+        if self.histograms is not None:
+            total += sys.getsizeof(self.histograms)
+            arrays.append(self.histograms.counts)
+        for array in arrays:
+            if array is None or array is self.model.all_candidates:
+                continue
+            total += sys.getsizeof(array)
+            if not array.flags.owndata:
+                total += array.nbytes
+        return total
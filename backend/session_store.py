@@ -0,0 +1,564 @@
+"""
+Almacenamiento de sesiones de juego
+Permite que cualquier worker atienda cualquier respuesta de una partida guardando
+el estado fuera del proceso (Redis) o, en un solo proceso, en memoria.
+
+Cada sesión guardada tiene un número de versión: `save` solo escribe si la
+versión no cambió desde el `load` (concurrencia optimista), así dos respuestas
+simultáneas a la misma partida no se pisan.
+"""
+import json
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+from attribute_model import AttributeModel, CandidateHistograms
+from bitset import bits_to_rows
+from scoring import CandidateStats
+from session_state import SessionState
+
+
+FORMAT_VERSION = 2
+MAGIC = b'AKS'
+HEADER = struct.Struct('<3sBI')  # magic, versión de formato, longitud del encabezado JSON
+
+
+class SessionConflictError(Exception):
+    """La sesión fue modificada por otra petición entre la lectura y la escritura"""
+
+
+class SessionCopier:
+    """
+    Codec del almacenamiento en memoria sin serializar
+
+    Guarda el estado tal cual y entrega una copia en cada lectura, para que las
+    modificaciones de una petición no sean visibles hasta que se guardan.
+    """
+
+    def dumps(self, session: SessionState) -> SessionState:
+        return session
+
+    def loads(self, session: SessionState) -> SessionState:
+        return session.copy()
+
+    def nbytes(self, session: SessionState) -> int:
+        return session.nbytes()
+
+
+class SessionCodec:
+    """
+    Serialización binaria compacta de una sesión
+
+    Formato: encabezado fijo + JSON con los datos escalares + arrays crudos
+    (bitset de candidatos, puntuaciones solo de los candidatos e histogramas en
+    int32), todo comprimido con zlib. El modelo se referencia por su huella;
+    si el proceso que lee no conoce ese modelo, la sesión se reconstruye
+    reproduciendo las respuestas sobre el modelo actual.
+    """
+
+    def __init__(
+        self,
+        model_for: Callable[[str], Optional[AttributeModel]],
+        tree_for: Callable[[AttributeModel], object],
+        rebuild: Callable[[np.ndarray, np.ndarray], SessionState],
+        compress_level: int = 1
+    ):
+        """
+        Args:
+            model_for: Devuelve el modelo con una huella dada, o None si no se conoce
+            tree_for: Devuelve el árbol de aperturas vigente para un modelo (o None)
+            rebuild: Reconstruye una sesión desde (question_ids, answer_values)
+            compress_level: Nivel de compresión zlib
+        """
+        self.model_for = model_for
+        self.tree_for = tree_for
+        self.rebuild = rebuild
+        self.compress_level = compress_level
+
+    def dumps(self, session: SessionState) -> bytes:
+        model = session.model
+        stats = session.stats
+        rows = bits_to_rows(session.candidates, model.num_characters)
+        scores = session.scores[rows]
+        counts = session.histograms.counts.astype(np.int32, copy=False)
+
+        header = {
+            'model': model.fingerprint,
+            'questions': session.question_ids.tolist(),
+            'values': session.answer_values.tolist(),
+            'tree': session.opening_tree is not None,
+            'stats': [stats.leader, float(stats.leader_score), float(stats.total),
+                      stats.count, float(stats.pruned_max)],
+            'ranking': stats.ranking.tolist() if stats.ranking is not None else None,
+            'hist_total': session.histograms.total,
+            'scores_dtype': scores.dtype.str,
+            'words': len(session.candidates)
+        }
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+        payload = b''.join((
+            HEADER.pack(MAGIC, FORMAT_VERSION, len(header_bytes)),
+            header_bytes,
+            session.candidates.tobytes(),
+            scores.tobytes(),
+            counts.tobytes()
+        ))
+        return zlib.compress(payload, self.compress_level)
+
+    def nbytes(self, data: bytes) -> int:
+        return sys.getsizeof(data)
+
+    def loads(self, data: bytes) -> SessionState:
+        """
+        Raises:
+            ValueError: Si los datos no tienen un formato de sesión compatible
+        """
+        try:
+            payload = zlib.decompress(data)
+            magic, format_version, header_length = HEADER.unpack_from(payload)
+        except (zlib.error, struct.error) as e:
+            raise ValueError(f'Sesión ilegible: {e}')
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f'Formato de sesión no soportado: {format_version}')
+
+        offset = HEADER.size
+        header = json.loads(payload[offset:offset + header_length])
+        offset += header_length
+
+        question_ids = np.array(header['questions'], dtype=np.int32)
+        answer_values = np.array(header['values'], dtype=np.int8)
+        model = self.model_for(header['model'])
+        if model is None:
+            return self.rebuild(question_ids, answer_values)
+
+        words = header['words']
+        candidates = np.frombuffer(payload, dtype=np.uint64, count=words, offset=offset).copy()
+        offset += candidates.nbytes
+
+        rows = bits_to_rows(candidates, model.num_characters)
+        scores_dtype = np.dtype(header['scores_dtype'])
+        # Solo se guardan las puntuaciones de los candidatos: las demás no se vuelven a leer
+        scores = np.zeros(model.num_characters, dtype=scores_dtype)
+        scores[rows] = np.frombuffer(payload, dtype=scores_dtype, count=len(rows), offset=offset)
+        offset += len(rows) * scores_dtype.itemsize
+
+        num_cols = len(model.attribute_keys)
+        counts = np.frombuffer(payload, dtype=np.int32, count=num_cols * 5, offset=offset)
+        counts = counts.reshape(num_cols, 5).copy()
+
+        leader, leader_score, total, count, pruned_max = header['stats']
+        if scores_dtype.kind == 'i':
+            leader_score, total = int(leader_score), int(total)
+        ranking = header.get('ranking')
+        if ranking is not None:
+            ranking = np.array(ranking, dtype=np.int64)
+
+        return SessionState(
+            model,
+            candidates,
+            scores,
+            CandidateStats(leader, leader_score, total, count, pruned_max, ranking),
+            CandidateHistograms(counts, header['hist_total']),
+            question_ids,
+            answer_values,
+            self.tree_for(model) if header['tree'] else None
+        )
+
+
+class SessionStore:
+    """
+    Interfaz de un almacenamiento de sesiones con concurrencia optimista
+
+    `codec` convierte el estado de una sesión al formato almacenado. Los
+    backends que serializan lo reciben del GameEngine (necesita resolver
+    modelos y árboles de aperturas).
+    """
+
+    name = 'base'
+
+    def __init__(self, codec=None):
+        self.codec = codec
+
+    def create(self, session_id: str, session: SessionState) -> int:
+        """Guarda una sesión nueva y devuelve su versión"""
+        raise NotImplementedError
+
+    def load(self, session_id: str) -> Optional[Tuple[SessionState, int]]:
+        """Devuelve (sesión, versión), o None si no existe"""
+        raise NotImplementedError
+
+    def save(self, session_id: str, session: SessionState, version: int) -> int:
+        """
+        Guarda la sesión si sigue en `version` y devuelve la nueva versión
+
+        Raises:
+            SessionConflictError: Si la sesión cambió o ya no existe
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str, version: Optional[int] = None) -> bool:
+        """
+        Elimina la sesión (solo si sigue en `version`, cuando se indica)
+
+        Returns:
+            True si se eliminó
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Número de sesiones almacenadas"""
+        raise NotImplementedError
+
+    def get_metrics(self) -> Dict:
+        """Indicadores del almacenamiento (sesiones activas, bytes, desalojos)"""
+        return {'store': self.name, 'active': self.count()}
+
+    @property
+    def shared_client(self):
+        """Cliente compartido entre workers que otras cachés pueden reutilizar (None si no hay)"""
+        return None
+
+
+class _StoredSession:
+    """Entrada del almacenamiento en memoria"""
+
+    __slots__ = ('version', 'data', 'nbytes', 'touched')
+
+    def __init__(self, version: int, data, nbytes: int, touched: float):
+        self.version = version
+        self.data = data
+        self.nbytes = nbytes
+        self.touched = touched
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sesiones en un diccionario del proceso
+
+    Por defecto guarda el estado sin serializar (SessionCopier). Con
+    serialize=True usa el mismo codec binario que Redis, lo que permite probar
+    en un solo proceso el comportamiento de un despliegue con varios workers.
+
+    Las sesiones se mantienen en orden de último uso: las inactivas más de
+    `ttl` segundos expiran (al leerlas o en el barrido periódico) y, al superar
+    `max_sessions` o `max_bytes`, se desalojan las menos recientes (LRU).
+    """
+
+    name = 'memory'
+
+    def __init__(
+        self,
+        serialize: bool = False,
+        ttl: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            serialize: Guardar las sesiones con el codec binario
+            ttl: Segundos de inactividad tras los que expira una sesión (None = nunca)
+            max_sessions: Máximo de sesiones en memoria (None = sin límite)
+            max_bytes: Máximo aproximado de bytes en memoria (None = sin límite)
+            sweep_interval: Segundos entre barridos de sesiones expiradas
+                (None = solo al leerlas). El barrido arranca con la primera sesión.
+            clock: Reloj en segundos para la inactividad (las pruebas lo controlan)
+        """
+        super().__init__(None if serialize else SessionCopier())
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+
+        self._sessions = OrderedDict()  # session_id -> _StoredSession, en orden de uso
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._sweeper = None
+        self.expired = 0
+        self.evicted = 0
+
+    def create(self, session_id: str, session: SessionState) -> int:
+        self._put(session_id, 1, self.codec.dumps(session))
+        self._start_sweeper()
+        return 1
+
+    def load(self, session_id: str) -> Optional[Tuple[SessionState, int]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            now = self.clock()
+            if self._is_expired(entry, now):
+                self._remove(session_id)
+                self.expired += 1
+                return None
+            entry.touched = now
+            self._sessions.move_to_end(session_id)
+            version, data = entry.version, entry.data
+        return self.codec.loads(data), version
+
+    def save(self, session_id: str, session: SessionState, version: int) -> int:
+        self._put(session_id, version + 1, self.codec.dumps(session), expected_version=version)
+        return version + 1
+
+    def delete(self, session_id: str, version: Optional[int] = None) -> bool:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or (version is not None and entry.version != version):
+                return False
+            self._remove(session_id)
+        return True
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def sweep(self) -> int:
+        """
+        Elimina las sesiones expiradas
+
+        Como las sesiones están en orden de último uso, solo recorre las
+        expiradas más la primera vigente.
+
+        Returns:
+            Número de sesiones eliminadas
+        """
+        if self.ttl is None:
+            return 0
+
+        removed = 0
+        now = self.clock()
+        with self._lock:
+            while self._sessions:
+                session_id, entry = next(iter(self._sessions.items()))
+                if not self._is_expired(entry, now):
+                    break
+                self._remove(session_id)
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def get_metrics(self) -> Dict:
+        return {
+            'store': self.name,
+            'active': len(self._sessions),
+            'bytes': self._bytes,
+            'bytes_per_session': self._bytes // len(self._sessions) if self._sessions else 0,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
+
+    def _put(self, session_id: str, version: int, data, expected_version: Optional[int] = None):
+        """
+        Guarda una entrada como la más reciente y aplica los límites
+
+        Raises:
+            SessionConflictError: Si se indica expected_version y la sesión no está en esa versión
+        """
+        nbytes = self.codec.nbytes(data)
+        with self._lock:
+            if expected_version is not None:
+                entry = self._sessions.get(session_id)
+                if entry is None or entry.version != expected_version:
+                    raise SessionConflictError(session_id)
+            if session_id in self._sessions:
+                self._remove(session_id)
+            self._sessions[session_id] = _StoredSession(version, data, nbytes, self.clock())
+            self._bytes += nbytes
+
+            # Desalojar las menos recientes, sin tocar la que se acaba de guardar
+            while len(self._sessions) > 1 and self._over_limits():
+                oldest = next(iter(self._sessions))
+                self._remove(oldest)
+                self.evicted += 1
+
+    def _remove(self, session_id: str):
+        entry = self._sessions.pop(session_id)
+        self._bytes -= entry.nbytes
+
+    def _over_limits(self) -> bool:
+        if self.max_sessions is not None and len(self._sessions) > self.max_sessions:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+    def _is_expired(self, entry: _StoredSession, now: float) -> bool:
+        return self.ttl is not None and now - entry.touched > self.ttl
+
+    def _start_sweeper(self):
+        """
+        Arranca el barrido periódico en un hilo daemon
+
+        Se inicia con la primera sesión (después del fork de gunicorn). Con los
+        workers gevent, threading y time.sleep están parcheados y el barrido
+        corre como un greenlet más.
+        """
+        if self.sweep_interval is None or self.ttl is None or self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop,
+                name='session-sweeper',
+                daemon=True
+            )
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error barriendo sesiones: {e}")
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sesiones compartidas entre workers en Redis
+
+    Cada sesión es un hash {v: versión, d: estado serializado}. Las escrituras
+    usan WATCH/MULTI: si otra petición cambió la sesión, la transacción falla
+    y se informa un conflicto.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix: str = 'akinator:session:', ttl: int = 86400):
+        """
+        Args:
+            client: Cliente redis-py (o compatible)
+            prefix: Prefijo de las claves
+            ttl: Segundos de vida de una sesión sin actividad
+        """
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.unreadable = 0
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def create(self, session_id: str, session: SessionState) -> int:
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={'v': 1, 'd': self.codec.dumps(session)})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        return 1
+
+    def load(self, session_id: str) -> Optional[Tuple[SessionState, int]]:
+        entry = self.client.hgetall(self._key(session_id))
+        if not entry:
+            return None
+        try:
+            session = self.codec.loads(entry[b'd'])
+        except ValueError as e:
+            # Estado corrupto o de un formato anterior (despliegue nuevo): la
+            # partida no se puede continuar y se trata como inexistente
+            self.unreadable += 1
+            print(f"Sesión ilegible en Redis ({session_id}): {e}")
+            return None
+        return session, int(entry[b'v'])
+
+    def save(self, session_id: str, session: SessionState, version: int) -> int:
+        from redis.exceptions import WatchError
+
+        key = self._key(session_id)
+        data = self.codec.dumps(session)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, 'v')
+                if current is None or int(current) != version:
+                    raise SessionConflictError(session_id)
+                pipe.multi()
+                pipe.hset(key, mapping={'v': version + 1, 'd': data})
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except WatchError:
+                raise SessionConflictError(session_id)
+        return version + 1
+
+    def delete(self, session_id: str, version: Optional[int] = None) -> bool:
+        from redis.exceptions import WatchError
+
+        key = self._key(session_id)
+        if version is None:
+            return bool(self.client.delete(key))
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, 'v')
+                if current is None or int(current) != version:
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def count(self) -> int:
+        """Recorre las claves con SCAN: O(claves de Redis), no usar en cada petición"""
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*', count=1000))
+
+    def get_metrics(self) -> Dict:
+        # Sin 'active': contar las sesiones exige un SCAN de todo Redis, y un
+        # contador propio se desvía cuando las claves expiran por TTL
+        return {'store': self.name, 'unreadable': self.unreadable}
+
+    @property
+    def shared_client(self):
+        return self.client
+
+
+def create_session_store(
+    name: str = 'memory',
+    redis_url: Optional[str] = None,
+    ttl: Optional[float] = None,
+    max_sessions: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    sweep_interval: Optional[float] = None
+) -> SessionStore:
+    """
+    Crea un almacenamiento de sesiones por nombre
+
+    Args:
+        name: 'memory' (un solo proceso) o 'redis' (compartido entre workers)
+        redis_url: URL de conexión, requerida para 'redis'
+        ttl: Segundos de inactividad tras los que expira una sesión
+        max_sessions: Máximo de sesiones en memoria (solo 'memory')
+        max_bytes: Máximo aproximado de bytes en memoria (solo 'memory')
+        sweep_interval: Segundos entre barridos de expiradas (solo 'memory')
+
+    Returns:
+        Instancia de SessionStore
+
+    Raises:
+        ValueError: Si el nombre es desconocido o falta la URL de Redis
+    """
+    if name == InMemorySessionStore.name:
+        return InMemorySessionStore(
+            ttl=ttl,
+            max_sessions=max_sessions,
+            max_bytes=max_bytes,
+            sweep_interval=sweep_interval
+        )
+
+    if name == RedisSessionStore.name:
+        if not redis_url:
+            raise ValueError('SESSION_STORE=redis requiere REDIS_URL')
+        import redis
+        # Redis expira las claves por sí mismo; sin TTL se usa el default del backend
+        kwargs = {'ttl': int(ttl)} if ttl else {}
+        return RedisSessionStore(redis.Redis.from_url(redis_url), **kwargs)
+
+    raise ValueError(f'Almacenamiento de sesiones desconocido: {name}')
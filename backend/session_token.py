@@ -0,0 +1,227 @@
+"""
+Tokens de sesión firmados
+Modo sin estado en el servidor: cada respuesta devuelve al cliente un token con
+el camino de respuestas de la partida, firmado con SECRET_KEY, y el estado
+(candidatos, puntuaciones, histogramas) se reconstruye desde ese camino o se
+toma de una caché acotada. Sin sesiones guardadas no hay memoria por sesión ni
+afinidad con un worker
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+import numpy as np
+from attribute_model import AttributeModel
+from session_state import SessionState
+
+
+FORMAT_VERSION = 1
+# formato, flags, ID de sesión (UUID), huella del modelo (SHA-256), emitido (s), respuestas
+HEADER = struct.Struct('<BB16s32sIH')
+MAC_SIZE = 32
+
+# Flags
+FLAG_TREE = 0x01  # la partida sigue el árbol de aperturas
+FLAG_COMPRESSED = 0x02  # el camino está comprimido con zlib
+
+
+class InvalidSessionToken(ValueError):
+    """El token no es válido: formato, firma, sesión o antigüedad"""
+
+
+class SessionTokens:
+    """
+    Emisión y verificación de tokens de sesión
+
+    Formato: base64url(cabecera + camino + HMAC-SHA256). El camino son los IDs
+    de pregunta (int32) y los valores de respuesta (int8), comprimido con zlib
+    solo si ocupa menos. La clave HMAC se deriva de SECRET_KEY con un prefijo
+    propio, así que un token no sirve como otra firma de la aplicación.
+
+    Al verificar un token se busca su estado en una caché LRU (normalmente el
+    que este worker acaba de emitir); si no está, se reproduce el camino sobre
+    el modelo de la huella. Si este proceso ya no conoce ese modelo, el camino
+    se reproduce sobre el modelo actual.
+
+    `model_for`, `tree_for` y `rebuild` los asigna el GameEngine (necesita
+    resolver modelos, árboles de aperturas y reproducir respuestas).
+    """
+
+    def __init__(self, secret_key: str, max_age: Optional[float] = 1800,
+                 max_answers: int = 200, max_length: int = 4096, cache_size: int = 1000):
+        """
+        Args:
+            secret_key: SECRET_KEY de la aplicación
+            max_age: Segundos de validez de un token desde su emisión (None = sin límite)
+            max_answers: Respuestas máximas en un token
+            max_length: Caracteres máximos de un token (se rechaza antes de decodificar)
+            cache_size: Estados recientes en memoria (0 = reconstruir siempre)
+        """
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode('utf-8')
+        self._key = hashlib.sha256(b'akinator-session-token:' + secret_key).digest()
+        self.max_age = max_age
+        self.max_answers = max_answers
+        self.max_length = max_length
+        self.cache_size = cache_size
+
+        self.model_for: Optional[Callable[[str], Optional[AttributeModel]]] = None
+        self.tree_for: Optional[Callable[[AttributeModel], object]] = None
+        self.rebuild: Optional[Callable[..., SessionState]] = None
+
+        self._states = OrderedDict()  # MAC -> SessionState
+        self._lock = threading.Lock()
+
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        self.replays = 0
+        self.stale_rebuilds = 0
+        self.total_bytes = 0
+
+    def issue(self, session_id: str, session: SessionState) -> str:
+        """
+        Emite el token del estado actual de una partida
+
+        Raises:
+            InvalidSessionToken: Si la partida supera max_answers respuestas
+        """
+        count = session.question_count
+        if count > self.max_answers:
+            raise InvalidSessionToken(f'La partida supera {self.max_answers} respuestas')
+
+        path = (np.ascontiguousarray(session.question_ids, dtype='<i4').tobytes()
+                + np.ascontiguousarray(session.answer_values, dtype=np.int8).tobytes())
+        flags = FLAG_TREE if session.opening_tree is not None else 0
+        compressed = zlib.compress(path)
+        if len(compressed) < len(path):
+            path = compressed
+            flags |= FLAG_COMPRESSED
+
+        payload = HEADER.pack(
+            FORMAT_VERSION,
+            flags,
+            uuid.UUID(session_id).bytes,
+            bytes.fromhex(session.model.fingerprint),
+            int(time.time()),
+            count
+        ) + path
+        mac = self._sign(payload)
+        token = base64.urlsafe_b64encode(payload + mac).rstrip(b'=').decode('ascii')
+
+        self._remember(mac, session)
+        self.issued += 1
+        self.total_bytes += len(token)
+        return token
+
+    def load(self, session_id: str, token: str) -> SessionState:
+        """
+        Verifica un token y devuelve el estado de la partida
+
+        Args:
+            session_id: Sesión a la que debe pertenecer el token
+            token: Token emitido por issue
+
+        Raises:
+            InvalidSessionToken: Si el token no es válido para la sesión
+        """
+        try:
+            return self._load(session_id, token)
+        except InvalidSessionToken:
+            self.rejected += 1
+            raise
+
+    def get_metrics(self) -> Dict:
+        return {
+            'issued': self.issued,
+            'verified': self.verified,
+            'rejected': self.rejected,
+            'cache_hits': self.cache_hits,
+            'replays': self.replays,
+            'stale_rebuilds': self.stale_rebuilds,
+            'cached_states': len(self._states),
+            'avg_token_bytes': round(self.total_bytes / self.issued, 1) if self.issued else 0
+        }
+
+    def _load(self, session_id: str, token: str) -> SessionState:
+        if not token or len(token) > self.max_length:
+            raise InvalidSessionToken('Token de sesión ausente o demasiado largo')
+        try:
+            data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except (binascii.Error, ValueError):
+            raise InvalidSessionToken('Token de sesión mal formado')
+        if len(data) < HEADER.size + MAC_SIZE:
+            raise InvalidSessionToken('Token de sesión truncado')
+
+        payload, mac = data[:-MAC_SIZE], data[-MAC_SIZE:]
+        if not hmac.compare_digest(mac, self._sign(payload)):
+            raise InvalidSessionToken('Firma del token de sesión inválida')
+
+        format_version, flags, session_bytes, fingerprint, issued_at, count = HEADER.unpack_from(payload)
+        if format_version != FORMAT_VERSION:
+            raise InvalidSessionToken(f'Formato de token no soportado: {format_version}')
+        try:
+            expected_session = uuid.UUID(session_id)
+        except (TypeError, ValueError):
+            raise InvalidSessionToken('ID de sesión inválido')
+        if uuid.UUID(bytes=session_bytes) != expected_session:
+            raise InvalidSessionToken('El token pertenece a otra sesión')
+        if self.max_age is not None and time.time() - issued_at > self.max_age:
+            raise InvalidSessionToken('Token de sesión expirado')
+        if count > self.max_answers:
+            raise InvalidSessionToken(f'El token supera {self.max_answers} respuestas')
+
+        self.verified += 1
+        with self._lock:
+            cached = self._states.get(mac)
+            if cached is not None:
+                self._states.move_to_end(mac)
+        if cached is not None:
+            self.cache_hits += 1
+            # Copia: las modificaciones de la petición no alteran el estado cacheado
+            return cached.copy()
+
+        path = payload[HEADER.size:]
+        if flags & FLAG_COMPRESSED:
+            try:
+                # Cota de descompresión: nunca más que el camino declarado
+                decompressor = zlib.decompressobj()
+                path = decompressor.decompress(path, count * 5)
+            except zlib.error:
+                raise InvalidSessionToken('Camino del token de sesión corrupto')
+        if len(path) != count * 5:
+            raise InvalidSessionToken('Camino del token de sesión inválido')
+
+        question_ids = np.frombuffer(path, dtype='<i4', count=count).astype(np.int32)
+        answer_values = np.frombuffer(path, dtype=np.int8, count=count, offset=count * 4).copy()
+
+        model = self.model_for(fingerprint.hex())
+        if model is None:
+            # Modelo desconocido (viejo o de otro worker): reproducir sobre el modelo actual
+            self.stale_rebuilds += 1
+            return self.rebuild(question_ids, answer_values)
+
+        self.replays += 1
+        session = self.rebuild(question_ids, answer_values, model)
+        if flags & FLAG_TREE:
+            session.opening_tree = self.tree_for(model)
+        return session
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()
+
+    def _remember(self, mac: bytes, session: SessionState):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._states[mac] = session
+            while len(self._states) > self.cache_size:
+                self._states.popitem(last=False)
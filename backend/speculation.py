@@ -0,0 +1,285 @@
+"""
+Precomputación especulativa de respuestas
+Mientras el jugador lee una pregunta, un pool acotado de hilos calcula el
+resultado de cada respuesta posible; cuando llega la respuesta real el
+resultado ya está listo y las demás ramas se cancelan
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+
+def _gevent_patched() -> bool:
+    """Si threading está parcheado por gevent (gunicorn --worker-class gevent)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def native_lock():
+    """
+    Lock que se puede tomar desde greenlets y desde hilos nativos
+
+    Con gevent, threading.Lock es un lock de greenlets y no sirve entre los
+    hilos nativos del threadpool; el lock original de _thread sí.
+    """
+    if _gevent_patched():
+        from gevent import monkey
+        return monkey.get_original('_thread', 'allocate_lock')()
+    return threading.Lock()
+
+
+class _Branch:
+    """Rama de una especulación: su Future y si ya empezó a calcular"""
+
+    __slots__ = ('future', 'started', 'skip')
+
+    def __init__(self):
+        self.future = None
+        self.started = False
+        self.skip = False
+
+
+class _Speculation:
+    """Ramas calculadas para una sesión en una versión y pregunta dadas"""
+
+    __slots__ = ('version', 'question_id', 'branches')
+
+    def __init__(self, version: Union[int, str], question_id: int, branches: Dict[int, _Branch]):
+        self.version = version
+        self.question_id = question_id
+        self.branches = branches
+
+
+class Speculator:
+    """
+    Resultados especulativos por sesión y respuesta
+
+    Cada sesión tiene como máximo una especulación: la de su última pregunta,
+    válida solo para la versión de la sesión con la que se calculó. Al tomar
+    una rama las demás se cancelan; las que ya estaban corriendo no se pueden
+    interrumpir y su tiempo de CPU se cuenta como desperdiciado.
+
+    El trabajo está acotado: `max_workers` hilos, `max_sessions` especulaciones
+    guardadas (LRU) y `max_pending` ramas en cola; si la cola está llena, la
+    sesión simplemente no especula.
+
+    Con gevent, threading está parcheado y un ThreadPoolExecutor corre sus
+    hilos como greenlets en el loop del worker: las ramas, cálculo NumPy sin
+    E/S, bloquearían todas las peticiones del worker. Por eso las ramas corren
+    en el threadpool nativo de gevent. Ese pool bloquea submit mientras no haya
+    un hilo libre, así que tiene un hilo por rama pendiente (`max_pending`) y
+    solo `max_workers` calculan a la vez; las demás esperan turno sin CPU y se
+    pueden cancelar mientras esperan.
+    """
+
+    def __init__(self, max_workers: int = 2, max_sessions: int = 1000, max_pending: int = 50):
+        """
+        Args:
+            max_workers: Hilos del pool de especulación
+            max_sessions: Especulaciones guardadas como máximo (las más viejas se descartan)
+            max_pending: Ramas en cola o corriendo como máximo
+        """
+        self.max_workers = max_workers
+        self.max_sessions = max_sessions
+        self.max_pending = max_pending
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._speculations = OrderedDict()  # session_id -> _Speculation
+        self.native_threads = _gevent_patched()
+        self._cpu_slots = None
+        # Se toma también desde los hilos nativos (ver native_lock)
+        self._lock = native_lock()
+        if self.native_threads:
+            from gevent import monkey
+            self._cpu_slots = monkey.get_original('queue', 'SimpleQueue')()
+            for _ in range(max_workers):
+                self._cpu_slots.put(None)
+        self._pending = 0
+
+        self.scheduled = 0
+        self.skipped = 0
+        self.hits = 0
+        self.waited = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.used_cpu_ms = 0.0
+        self.wasted_cpu_ms = 0.0
+
+    def schedule(self, session_id: str, version: Union[int, str], question_id: int,
+                 branch_fn: Callable[[int], Any], answer_values):
+        """
+        Calcula en segundo plano el resultado de cada respuesta posible
+
+        Reemplaza (y cancela) la especulación anterior de la sesión.
+
+        Args:
+            session_id: ID de la sesión
+            version: Versión de la sesión en el almacenamiento (o su token de sesión)
+            question_id: Pregunta que el jugador está leyendo
+            branch_fn: Calcula el resultado de un valor de respuesta
+            answer_values: Valores de respuesta posibles
+        """
+        answer_values = sorted(set(answer_values))
+        with self._lock:
+            reserved = self._pending + len(answer_values) <= self.max_pending
+            if reserved:
+                self._pending += len(answer_values)
+
+        # submit fuera del lock: con gevent puede ceder el loop a otro greenlet,
+        # que se bloquearía (con todo el worker) esperando el lock nativo
+        branches = None
+        if reserved:
+            self.scheduled += 1
+            executor = self._get_executor()
+            branches = {}
+            for value in answer_values:
+                branch = _Branch()
+                branch.future = executor.submit(self._run, branch_fn, value, branch)
+                branches[value] = branch
+        else:
+            self.skipped += 1
+
+        with self._lock:
+            previous = self._speculations.pop(session_id, None)
+            if branches is not None:
+                self._speculations[session_id] = _Speculation(version, question_id, branches)
+
+            evicted = []
+            while len(self._speculations) > self.max_sessions:
+                evicted.append(self._speculations.popitem(last=False)[1])
+
+        for speculation in ([previous] if previous else []) + evicted:
+            self._discard(speculation.branches.values())
+
+    def take(self, session_id: str, version: Union[int, str], question_id: int, answer_value: int) -> Optional[Any]:
+        """
+        Resultado especulado para la respuesta recibida
+
+        Si la rama ya terminó se devuelve al instante; si está corriendo se
+        espera (termina antes que recalcularla); si todavía no empezó se
+        cancela y el llamador calcula la respuesta como siempre.
+
+        Returns:
+            Resultado de branch_fn, o None si no hay uno válido
+        """
+        with self._lock:
+            speculation = self._speculations.pop(session_id, None)
+
+        if speculation is None:
+            self.misses += 1
+            return None
+
+        branch = None
+        if speculation.version == version and speculation.question_id == question_id:
+            branch = speculation.branches.pop(answer_value, None)
+        self._discard(speculation.branches.values())
+
+        if branch is not None and self._cancel(branch):
+            branch = None
+        if branch is None:
+            self.misses += 1
+            return None
+
+        if not branch.future.done():
+            self.waited += 1
+        try:
+            result, cpu_ms = branch.future.result()
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.used_cpu_ms += cpu_ms
+        return result
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'workers': self.max_workers,
+            'native_threads': self.native_threads,
+            'sessions': len(self._speculations),
+            'pending_branches': self._pending,
+            'scheduled': self.scheduled,
+            'skipped': self.skipped,
+            'hits': self.hits,
+            'waited': self.waited,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'cancelled_branches': self.cancelled,
+            'errors': self.errors,
+            'used_cpu_ms': round(self.used_cpu_ms, 1),
+            'wasted_cpu_ms': round(self.wasted_cpu_ms, 1)
+        }
+
+    def _get_executor(self):
+        """Pool de ramas; se crea con la primera partida, después del fork"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self):
+        if self.native_threads:
+            from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+            return NativeThreadPoolExecutor(max_workers=self.max_pending)
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='speculation'
+        )
+
+    def _run(self, branch_fn: Callable[[int], Any], answer_value: int, branch: _Branch):
+        """Ejecuta una rama y mide su tiempo de CPU"""
+        if self._cpu_slots is not None:
+            self._cpu_slots.get()
+        try:
+            with self._lock:
+                if branch.skip:
+                    # Cancelada mientras esperaba turno: nadie leerá el resultado
+                    return None, 0.0
+                branch.started = True
+            start = time.thread_time()
+            return branch_fn(answer_value), (time.thread_time() - start) * 1000.0
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if self._cpu_slots is not None:
+                self._cpu_slots.put(None)
+            with self._lock:
+                self._pending -= 1
+
+    def _cancel(self, branch: _Branch) -> bool:
+        """Cancela una rama si todavía no empezó a calcular"""
+        if branch.future.cancel():
+            # _run no llegará a correr
+            with self._lock:
+                self._pending -= 1
+        else:
+            with self._lock:
+                if branch.started:
+                    return False
+                # Tiene hilo pero espera turno: _run la descarta al despertar
+                branch.skip = True
+        self.cancelled += 1
+        return True
+
+    def _discard(self, branches):
+        """Cancela ramas que no se usarán; las ya iniciadas cuentan como CPU desperdiciada"""
+        for branch in branches:
+            if not self._cancel(branch):
+                branch.future.add_done_callback(self._count_waste)
+
+    def _count_waste(self, branch: Future):
+        try:
+            _, cpu_ms = branch.result()
+        except (CancelledError, Exception):
+            return
+        self.wasted_cpu_ms += cpu_ms
@@ -5,6 +5,7 @@
 // Estado global del juego
 let gameState = {
     sessionId: null,
+    sessionToken: null,  // estado firmado de la partida (solo con SESSION_TOKENS)
     currentQuestion: null,
     questionCount: 0,
     guessedCharacter: null
@@ -12,6 +13,10 @@ let gameState = {
 
 const API_BASE = '';
 
+// Canal SSE de la partida (null = una petición REST por respuesta)
+const STREAMING_SUPPORTED = typeof EventSource !== 'undefined';
+let gameStream = null;
+
 // ===== INICIALIZACIÓN =====
 document.addEventListener('DOMContentLoaded', () => {
     loadStats();
@@ -21,6 +26,11 @@ document.addEventListener('DOMContentLoaded', () => {
 // ===== FUNCIONES DE JUEGO =====
 
 async function startGame() {
+    if (STREAMING_SUPPORTED) {
+        openGameStream(null);
+        return;
+    }
+    
     try {
         const response = await fetch(`${API_BASE}/api/game/start`, {
             method: 'POST',
@@ -36,16 +46,7 @@ async function startGame() {
             return;
         }
         
-        gameState.sessionId = data.session_id;
-        gameState.currentQuestion = data.question;
-        gameState.questionCount = 1;
-        
-        // Cambiar a pantalla de juego
-        document.getElementById('heroSection').classList.add('hidden');
-        document.getElementById('gameSection').classList.remove('hidden');
-        
-        // Mostrar primera pregunta
-        displayQuestion(data);
+        showFirstQuestion(data);
         
     } catch (error) {
         console.error('Error starting game:', error);
@@ -53,41 +54,45 @@ async function startGame() {
     }
 }
 
+function showFirstQuestion(data) {
+    gameState.sessionId = data.session_id;
+    gameState.sessionToken = data.session_token || null;
+    gameState.currentQuestion = data.question;
+    gameState.questionCount = 1;
+    
+    // Cambiar a pantalla de juego
+    document.getElementById('heroSection').classList.add('hidden');
+    document.getElementById('gameSection').classList.remove('hidden');
+    
+    // Mostrar primera pregunta
+    displayQuestion(data);
+}
+
 async function answerQuestion(answer) {
+    const body = JSON.stringify({
+        session_id: gameState.sessionId,
+        question_id: gameState.currentQuestion.id,
+        answer: answer,
+        session_token: gameState.sessionToken
+    });
+    
     try {
-        const response = await fetch(`${API_BASE}/api/game/answer`, {
+        // Con stream, el resultado llega como evento (202 sin cuerpo)
+        const url = gameStream ? '/api/game/stream/answer' : '/api/game/answer';
+        const response = await fetch(`${API_BASE}${url}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                session_id: gameState.sessionId,
-                question_id: gameState.currentQuestion.id,
-                answer: answer
-            })
+            body: body
         });
         
-        const data = await response.json();
-        
-        if (data.error) {
-            alert('Error: ' + data.error);
+        if (response.status === 202) {
             return;
         }
         
-        // Verificar tipo de respuesta
-        if (data.type === 'guess') {
-            // Mostrar adivinanza
-            showGuessModal(data.character);
-            gameState.guessedCharacter = data.character;
-        } else if (data.type === 'give_up') {
-            // No pudo adivinar
-            showAddCharacterModal();
-        } else {
-            // Siguiente pregunta
-            gameState.currentQuestion = data.question;
-            gameState.questionCount = data.question_count;
-            displayQuestion(data);
-        }
+        // Sin stream que la atienda, el servidor la procesó como en REST
+        handleAnswerResult(await response.json());
         
     } catch (error) {
         console.error('Error answering question:', error);
@@ -95,6 +100,79 @@ async function answerQuestion(answer) {
     }
 }
 
+function handleAnswerResult(data) {
+    if (data.error) {
+        alert('Error: ' + data.error);
+        return;
+    }
+    
+    if (data.session_token) {
+        gameState.sessionToken = data.session_token;
+    }
+    
+    // Verificar tipo de respuesta
+    if (data.type === 'guess') {
+        // Mostrar adivinanza
+        closeGameStream();
+        showGuessModal(data.character);
+        gameState.guessedCharacter = data.character;
+    } else if (data.type === 'give_up') {
+        // No pudo adivinar
+        closeGameStream();
+        showAddCharacterModal();
+    } else {
+        // Siguiente pregunta
+        gameState.currentQuestion = data.question;
+        gameState.questionCount = data.question_count;
+        displayQuestion(data);
+    }
+}
+
+// ===== STREAM DE LA PARTIDA =====
+
+function openGameStream(sessionId) {
+    let query = sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : '';
+    if (sessionId && gameState.sessionToken) {
+        query += `&session_token=${encodeURIComponent(gameState.sessionToken)}`;
+    }
+    const stream = new EventSource(`${API_BASE}/api/game/stream${query}`);
+    gameStream = stream;
+    
+    stream.addEventListener('start', (event) => {
+        showFirstQuestion(JSON.parse(event.data));
+    });
+    
+    ['question', 'guess', 'give_up', 'failure'].forEach(type => {
+        stream.addEventListener(type, (event) => {
+            handleAnswerResult(JSON.parse(event.data));
+        });
+    });
+    
+    stream.addEventListener('timeout', () => closeGameStream());
+    
+    stream.onerror = () => {
+        if (gameStream !== stream) {
+            return;
+        }
+        closeGameStream();
+        
+        if (!gameState.sessionId) {
+            alert('Error al iniciar el juego');
+        } else if (!sessionId) {
+            // EventSource reconectaría a una partida nueva: reconectar a la actual una vez
+            openGameStream(gameState.sessionId);
+        }
+        // Si la reconexión también falla, las respuestas siguen por REST
+    };
+}
+
+function closeGameStream() {
+    if (gameStream) {
+        gameStream.close();
+        gameStream = null;
+    }
+}
+
 function displayQuestion(data) {
     // Actualizar texto de pregunta
     document.getElementById('questionText').textContent = data.question.text;
@@ -135,7 +213,8 @@ async function confirmGuess(correct) {
             body: JSON.stringify({
                 session_id: gameState.sessionId,
                 character_id: gameState.guessedCharacter.id,
-                correct: correct
+                correct: correct,
+                session_token: gameState.sessionToken
             })
         });
         
@@ -277,9 +356,12 @@ document.getElementById('addCharacterForm')?.addEventListener('submit', async (e
 // ===== RESET =====
 
 function resetGame() {
+    closeGameStream();
+    
     // Limpiar estado
     gameState = {
         sessionId: null,
+        sessionToken: null,
         currentQuestion: null,
         questionCount: 0,
         guessedCharacter: null
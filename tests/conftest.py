@@ -0,0 +1,48 @@
+"""
+Configuración común de las pruebas
+Los módulos del backend se importan por nombre (como en app.py), así que el
+directorio backend/ se agrega al path. Cada prueba que usa `app` recibe una
+base SQLite en memoria con los datos iniciales.
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """Aplicación mínima con la base de datos inicializada y su contexto activo"""
+    from init_data import initialize_data
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test-secret'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        initialize_data(db)
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def fake_redis():
+    from fake_redis import FakeRedis
+    return FakeRedis()
+
+
+@pytest.fixture
+def engine(app):
+    """GameEngine con sesiones en memoria y sin tareas en segundo plano"""
+    from game_engine import GameEngine
+    return GameEngine()
+
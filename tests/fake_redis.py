@@ -0,0 +1,230 @@
+"""
+Cliente Redis falso en memoria para las pruebas
+Implementa solo los comandos que usan los backends (claves, hashes, WATCH/MULTI
+y pub/sub) con la semántica de redis-py: valores en bytes, transacciones que
+fallan con WatchError si una clave vigilada cambió y `publish` que devuelve
+cuántos receptores hubo
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from redis.exceptions import ConnectionError, WatchError
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class FakeRedis:
+    """
+    Servidor y cliente a la vez: varios "workers" comparten una instancia
+
+    `before_execute` permite simular otra petición que escribe entre la
+    lectura vigilada y el EXEC de una transacción: se llama una vez, con el
+    propio cliente, justo antes de comprobar las claves vigiladas.
+    """
+
+    def __init__(self):
+        self._data = {}  # clave -> bytes o Dict[bytes, bytes]
+        self._expires = {}  # clave -> instante de expiración (time.monotonic)
+        self._revisions = {}  # clave -> escrituras, para WATCH
+        self._channels = {}  # canal -> List[FakePubSub]
+        self._lock = threading.RLock()
+        self.before_execute: Optional[Callable[['FakeRedis'], None]] = None
+
+    # Claves
+
+    def get(self, key):
+        with self._lock:
+            value = self._live(key)
+            return value if isinstance(value, bytes) else None
+
+    def set(self, key, value, ex: Optional[int] = None):
+        with self._lock:
+            self._write(key, _encode(value))
+            if ex is not None:
+                self._expires[_encode(key)] = time.monotonic() + ex
+        return True
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                if self._live(key) is not None:
+                    self._write(key, None)
+                    deleted += 1
+            return deleted
+
+    def expire(self, key, seconds: int) -> bool:
+        with self._lock:
+            if self._live(key) is None:
+                return False
+            self._expires[_encode(key)] = time.monotonic() + seconds
+            return True
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None):
+        import fnmatch
+        with self._lock:
+            keys = [key for key in list(self._data) if self._live(key) is not None]
+        for key in keys:
+            if match is None or fnmatch.fnmatchcase(key.decode('utf-8'), match):
+                yield key
+
+    # Hashes
+
+    def hset(self, key, field=None, value=None, mapping: Optional[Dict] = None) -> int:
+        with self._lock:
+            current = dict(self._live(key) or {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = 0
+            for item_field, item_value in items.items():
+                item_field = _encode(item_field)
+                added += item_field not in current
+                current[item_field] = _encode(item_value)
+            self._write(key, current)
+            return added
+
+    def hget(self, key, field):
+        with self._lock:
+            value = self._live(key)
+            return value.get(_encode(field)) if isinstance(value, dict) else None
+
+    def hgetall(self, key) -> Dict[bytes, bytes]:
+        with self._lock:
+            value = self._live(key)
+            return dict(value) if isinstance(value, dict) else {}
+
+    # Transacciones
+
+    def pipeline(self) -> 'FakePipeline':
+        return FakePipeline(self)
+
+    # Pub/sub
+
+    def publish(self, channel, message) -> int:
+        with self._lock:
+            subscribers = list(self._channels.get(_encode(channel), []))
+        for pubsub in subscribers:
+            pubsub._messages.put({
+                'type': 'message',
+                'channel': _encode(channel),
+                'data': _encode(message)
+            })
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> 'FakePubSub':
+        return FakePubSub(self)
+
+    def disconnect(self):
+        """Corta todas las conexiones de pub/sub (los receptores ven ConnectionError)"""
+        with self._lock:
+            subscribers = [pubsub for pubsubs in self._channels.values() for pubsub in pubsubs]
+            self._channels.clear()
+        for pubsub in subscribers:
+            pubsub._messages.put(None)
+
+    def subscribers(self, channel) -> int:
+        """Receptores suscritos a un canal"""
+        with self._lock:
+            return len(self._channels.get(_encode(channel), []))
+
+    # Internos
+
+    def _live(self, key):
+        key = _encode(key)
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._write(key, None)
+        return self._data.get(key)
+
+    def _write(self, key, value):
+        key = _encode(key)
+        if value is None:
+            self._data.pop(key, None)
+        else:
+            self._data[key] = value
+        self._expires.pop(key, None)
+        self._revisions[key] = self._revisions.get(key, 0) + 1
+
+    def _revision(self, key) -> int:
+        return self._revisions.get(_encode(key), 0)
+
+
+class FakePipeline:
+    """
+    Pipeline de redis-py: inmediato tras WATCH, en cola tras MULTI (o sin WATCH)
+    """
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._watched = {}  # clave -> revisión al vigilarla
+        self._immediate = False
+        self._commands = []
+
+    def __enter__(self) -> 'FakePipeline':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+        if self._immediate:
+            return command
+
+        def queued(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queued
+
+    def watch(self, *keys):
+        with self.client._lock:
+            for key in keys:
+                self._watched[key] = self.client._revision(key)
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def execute(self) -> List:
+        hook, self.client.before_execute = self.client.before_execute, None
+        if hook is not None and self._watched:
+            hook(self.client)
+        try:
+            with self.client._lock:
+                for key, revision in self._watched.items():
+                    if self.client._revision(key) != revision:
+                        raise WatchError('Watched variable changed.')
+                return [command(*args, **kwargs) for command, args, kwargs in self._commands]
+        finally:
+            self.reset()
+
+    def reset(self):
+        self._watched = {}
+        self._immediate = False
+        self._commands = []
+
+
+class FakePubSub:
+    """Suscripción de pub/sub; `listen` bloquea hasta el siguiente mensaje"""
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        with self.client._lock:
+            for channel in channels:
+                self.client._channels.setdefault(_encode(channel), []).append(self)
+
+    def listen(self):
+        while True:
+            message = self._messages.get()
+            if message is None:
+                raise ConnectionError('Conexión cerrada')
+            yield message
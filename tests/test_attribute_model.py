@@ -0,0 +1,158 @@
+"""
+Modelo de atributos: un delta (with_changes) equivale a reconstruir (from_db)
+"""
+import numpy as np
+import pytest
+
+from attribute_model import AttributeModel, BITSET_MIN_FRACTION, CandidateHistograms
+from bitset import rows_to_bits
+from models import db, Character, CharacterAttribute, Question
+
+
+@pytest.fixture
+def model(app):
+    """Modelo con los índices ya calculados, para comprobar que se heredan bien"""
+    model = AttributeModel.from_db(db.session)
+    model.base_histograms
+    model.postings
+    return model
+
+
+def _assert_same_model(model, expected):
+    assert model.fingerprint == expected.fingerprint
+    assert model.character_ids.tolist() == expected.character_ids.tolist()
+    assert model.attribute_keys == expected.attribute_keys
+    assert np.array_equal(model.values, expected.values)
+    assert np.array_equal(model.confidence, expected.confidence)
+    assert np.array_equal(model.base_histograms, expected.base_histograms)
+    assert np.array_equal(model.postings, expected.postings)
+
+
+def _add_character(name, attributes):
+    character = Character(name=name)
+    db.session.add(character)
+    db.session.flush()
+    for key, value in attributes.items():
+        db.session.add(CharacterAttribute(
+            character_id=character.id, attribute_key=key, value=value, confidence=0.7
+        ))
+    return character
+
+
+def test_without_changes(model):
+    updated = model.with_changes(db.session, [], version=2)
+
+    _assert_same_model(updated, AttributeModel.from_db(db.session))
+    assert updated.version == 2
+    # Sin filas modificadas las matrices siguen compartidas
+    assert np.shares_memory(updated.values, model.values)
+
+
+def test_changed_attributes(model):
+    attribute = db.session.query(CharacterAttribute).first()
+    attribute.value = -attribute.value or 1
+    attribute.confidence = 0.25
+    defined = {key for (key,) in db.session.query(CharacterAttribute.attribute_key).filter_by(
+        character_id=attribute.character_id)}
+    missing = next(key for key in model.attribute_keys if key not in defined)
+    db.session.add(CharacterAttribute(character_id=attribute.character_id, attribute_key=missing, value=2))
+    db.session.commit()
+    before = model.values.copy()
+
+    updated = model.with_changes(db.session, [attribute.character_id], version=2)
+
+    _assert_same_model(updated, AttributeModel.from_db(db.session))
+    # El modelo anterior no cambia: sigue en uso por otras partidas
+    assert np.array_equal(model.values, before)
+
+
+def test_new_characters_and_questions(model):
+    keys = model.attribute_keys
+    for index in range(100):
+        _add_character(f'Nuevo {index}', {keys[index % len(keys)]: 2, keys[(index * 7) % len(keys)]: -1})
+    question = db.session.query(Question).first()
+    question.effectiveness_score = 0.5
+    db.session.commit()
+
+    updated = model.with_changes(db.session, [], version=2)
+
+    _assert_same_model(updated, AttributeModel.from_db(db.session))
+    assert updated.get_question(question.id).effectiveness_score == 0.5
+
+
+def test_new_attribute_keys(model):
+    first, second = model.character_ids[:2].tolist()
+    db.session.add(Question(text='¿Es nuevo?', attribute_key='aaa_nuevo'))
+    db.session.add(CharacterAttribute(character_id=first, attribute_key='aaa_nuevo', value=2, confidence=0.8))
+    db.session.add(CharacterAttribute(character_id=second, attribute_key='mmm_nuevo', value=-1))
+    _add_character('Nuevo', {'zzz_nuevo': 1, model.attribute_keys[0]: -2})
+    db.session.commit()
+    before = model.values.copy()
+
+    updated = model.with_changes(db.session, [second], version=2)
+
+    _assert_same_model(updated, AttributeModel.from_db(db.session))
+    assert {'aaa_nuevo', 'mmm_nuevo', 'zzz_nuevo'} <= set(updated.attribute_keys)
+    assert np.array_equal(model.values, before)
+
+
+@pytest.fixture
+def synthetic_model():
+    """Modelo de 256 personajes: la estrategia de bitsets empieza en 8 eliminados"""
+    from flask import Flask
+    from benchmark import create_synthetic_data
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        create_synthetic_data(db, 256, 30, seed=0)
+        yield AttributeModel.from_db(db.session)
+        db.session.remove()
+        db.drop_all()
+
+
+def _recount(model, rows):
+    values = model.values[rows]
+    return np.stack([(values == value).sum(axis=0) for value in range(-2, 3)], axis=1)
+
+
+@pytest.mark.parametrize('strategy, keep', [
+    ('recount', lambda total, threshold: total // 3),
+    ('bitset', lambda total, threshold: total - threshold - 4),
+    ('dense', lambda total, threshold: total - max(1, threshold // 2)),
+])
+def test_histogram_update_strategies_match_a_recount(synthetic_model, monkeypatch, strategy, keep):
+    model = synthetic_model
+    threshold = int(np.ceil(model.num_characters * BITSET_MIN_FRACTION))
+    calls = []
+    for name in ('answer_histograms', 'bitset_histograms'):
+        method = getattr(AttributeModel, name)
+
+        def spy(self, rows, cols, method=method, name=name):
+            calls.append((name, len(rows)))
+            return method(self, rows, cols)
+        monkeypatch.setattr(AttributeModel, name, spy)
+
+    rng = np.random.default_rng(0)
+    histograms = CandidateHistograms.for_all(model)
+    rows = np.arange(model.num_characters)
+    # Varios filtrados seguidos: cada uno parte de los conteos ajustados del anterior
+    for _ in range(3):
+        new_rows = np.sort(rng.choice(rows, size=keep(len(rows), threshold), replace=False))
+        calls.clear()
+        histograms.update(model, rows, new_rows,
+                          rows_to_bits(rows, model.num_characters),
+                          rows_to_bits(new_rows, model.num_characters))
+
+        removed = len(rows) - len(new_rows)
+        expected_call = {
+            'recount': ('answer_histograms', len(new_rows)),
+            'bitset': ('bitset_histograms', len(rows_to_bits(rows, model.num_characters))),
+            'dense': ('answer_histograms', removed),
+        }[strategy]
+        assert calls[0] == expected_call
+        assert histograms.total == len(new_rows)
+        assert np.array_equal(histograms.counts, _recount(model, new_rows))
+        rows = new_rows
@@ -0,0 +1,106 @@
+"""
+Lotes de respuestas: process_answers deja la partida igual que enviar las
+mismas respuestas de a una con process_answer
+"""
+from models import db, Character
+
+VALUE_ANSWERS = {2: 'yes', 1: 'probably_yes', 0: 'dont_know', -1: 'probably_no', -2: 'no'}
+
+
+def _summary(result):
+    """Lo que decide la partida (times_asked de la pregunta cambia entre juegos)"""
+    chosen = result.get('question') or result.get('character') or {}
+    return result.get('type'), chosen.get('id'), result.get('candidates_remaining'), result.get('error')
+
+
+def _state(engine, session_id):
+    session, _ = engine.session_store.load(session_id)
+    candidates = None if session.candidates is None else session.candidates.tolist()
+    return (session.question_ids.tolist(), session.answer_values.tolist(),
+            session.scores.tolist(), candidates)
+
+
+def _play(engine, character):
+    """Partida secuencial hasta la adivinanza: respuestas enviadas y resultados"""
+    attributes = {attribute.attribute_key: attribute.value for attribute in character.attributes}
+    result = engine.start_game()
+    session_id = result['session_id']
+    answers, results = [], []
+    while result.get('type', 'question') == 'question':
+        question = result['question']
+        answers.append((question['id'], VALUE_ANSWERS[attributes.get(question['attribute_key'], 0)]))
+        result = engine.process_answer(session_id, *answers[-1])
+        results.append(result)
+    return answers, results
+
+
+def _sequential(engine, answers):
+    session_id = engine.start_game()['session_id']
+    for answer in answers:
+        result = engine.process_answer(session_id, *answer)
+    return session_id, result
+
+
+def _characters(limit):
+    return db.session.query(Character).order_by(Character.id).limit(limit).all()
+
+
+def test_batch_equals_sequential_answers(engine):
+    for character in _characters(3):
+        answers, results = _play(engine, character)
+        for count in range(1, len(answers)):
+            sequential_id, sequential = _sequential(engine, answers[:count])
+            batch_id = engine.start_game()['session_id']
+            batch = engine.process_answers(batch_id, answers[:count])
+
+            assert batch['answers_applied'] == count
+            assert _summary(batch) == _summary(sequential) == _summary(results[count - 1])
+            assert _state(engine, batch_id) == _state(engine, sequential_id)
+
+
+def test_batch_ending_on_a_guess_ignores_the_remaining_answers(engine):
+    for character in _characters(3):
+        answers, results = _play(engine, character)
+        assert results[-1]['type'] == 'guess'
+        sequential_id, sequential = _sequential(engine, answers)
+
+        # Respuestas de más tras la adivinanza: un cliente secuencial no las enviaría
+        extra = [(answers[0][0], 'no'), (answers[-1][0], 'yes')]
+        batch_id = engine.start_game()['session_id']
+        batch = engine.process_answers(batch_id, answers + extra)
+
+        assert batch['answers_applied'] == len(answers)
+        assert _summary(batch) == _summary(sequential) == _summary(results[-1])
+        assert _state(engine, batch_id) == _state(engine, sequential_id)
+
+
+def test_batch_with_invalid_and_conflicting_answers(engine):
+    first = engine.start_game()
+    second = engine.process_answer(first['session_id'], first['question']['id'], 'yes')
+    # Respuesta desconocida (cuenta como no sé) y la primera pregunta contradicha
+    answers = [
+        (first['question']['id'], 'yes'),
+        (second['question']['id'], 'maybe'),
+        (first['question']['id'], 'no'),
+    ]
+    sequential_id, sequential = _sequential(engine, answers)
+    batch_id = engine.start_game()['session_id']
+    batch = engine.process_answers(batch_id, answers)
+
+    assert batch['answers_applied'] == len(answers)
+    assert _summary(batch) == _summary(sequential)
+    assert _state(engine, batch_id) == _state(engine, sequential_id)
+    assert _state(engine, batch_id)[1] == [2, 0, -2]
+
+
+def test_batch_with_an_unknown_question_applies_nothing(engine):
+    start = engine.start_game()
+    session_id = start['session_id']
+    before = _state(engine, session_id)
+
+    result = engine.process_answers(session_id, [(start['question']['id'], 'yes'), (999999, 'no')])
+
+    assert result == {'error': 'Pregunta no encontrada'}
+    assert _state(engine, session_id) == before
+    # La sesión sigue utilizable tras el lote rechazado
+    assert engine.process_answers(session_id, [(start['question']['id'], 'yes')])['answers_applied'] == 1
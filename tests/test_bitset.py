@@ -0,0 +1,41 @@
+"""
+Utilidades de bitsets empaquetados
+"""
+import numpy as np
+import pytest
+
+from bitset import bits_to_rows, num_words, pack_mask, popcount, rows_to_bits
+
+
+@pytest.mark.parametrize('size', [0, 1, 63, 64, 65, 200])
+def test_rows_round_trip(size):
+    rng = np.random.default_rng(size)
+    rows = np.flatnonzero(rng.random(size) < 0.3)
+
+    bits = rows_to_bits(rows, size)
+
+    assert bits.dtype == np.uint64
+    assert len(bits) == num_words(size)
+    assert np.array_equal(bits_to_rows(bits, size), rows)
+    assert int(popcount(bits)) == len(rows)
+
+
+def test_pack_mask_matches_rows_to_bits():
+    rng = np.random.default_rng(0)
+    mask = rng.random((3, 130)) < 0.5
+
+    packed = pack_mask(mask)
+
+    assert packed.shape == (3, num_words(130))
+    for row in range(3):
+        assert np.array_equal(packed[row], rows_to_bits(np.flatnonzero(mask[row]), 130))
+    assert np.array_equal(popcount(packed), mask.sum(axis=1))
+
+
+def test_set_operations():
+    a = rows_to_bits(np.array([0, 5, 64, 99]), 100)
+    b = rows_to_bits(np.array([5, 70, 99]), 100)
+
+    assert bits_to_rows(a & b, 100).tolist() == [5, 99]
+    assert bits_to_rows(a | b, 100).tolist() == [0, 5, 64, 70, 99]
+    assert bits_to_rows(a & ~b, 100).tolist() == [0, 64]
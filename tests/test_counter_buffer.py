@@ -0,0 +1,117 @@
+"""
+Contadores con escritura diferida: acumulación, disparadores de escritura y
+reintento sin contar dos veces
+"""
+import threading
+
+import counter_buffer
+from counter_buffer import CounterBuffer, question_times_asked_writer
+from models import db, Question
+
+TIMEOUT = 5
+
+
+class _Writer:
+    """flush_fn que guarda cada lote y avisa al recibirlo"""
+
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def __call__(self, counts):
+        self.batches.append(dict(counts))
+        self.written.set()
+
+
+def test_increments_are_coalesced_per_key():
+    writer = _Writer()
+    buffer = CounterBuffer(writer, interval=3600, max_pending=100)
+    for key in (1, 2, 1, 1):
+        buffer.increment(key)
+    buffer.increment(2, 5)
+
+    assert buffer.get_metrics()['pending'] == 9
+    assert buffer.flush() == 2
+    assert writer.batches == [{1: 3, 2: 6}]
+    assert buffer.get_metrics() == {'pending': 0, 'flushes': 1, 'flushed': 9, 'errors': 0}
+    # Sin pendientes no se llama a la escritura
+    assert buffer.flush() == 0
+    assert len(writer.batches) == 1
+
+
+def test_max_pending_keys_trigger_a_flush():
+    writer = _Writer()
+    buffer = CounterBuffer(writer, interval=3600, max_pending=3)
+    buffer.increment(1)
+    buffer.increment(1)
+    buffer.increment(2)
+    assert not writer.written.wait(0.1)
+
+    buffer.increment(3)
+
+    assert writer.written.wait(TIMEOUT)
+    assert writer.batches == [{1: 2, 2: 1, 3: 1}]
+
+
+def test_interval_triggers_a_flush():
+    writer = _Writer()
+    buffer = CounterBuffer(writer, interval=0.05, max_pending=100)
+    buffer.increment(7)
+
+    assert writer.written.wait(TIMEOUT)
+    assert writer.batches == [{7: 1}]
+
+
+def test_pending_increments_are_flushed_at_exit(monkeypatch):
+    registered = []
+    monkeypatch.setattr(counter_buffer.atexit, 'register', registered.append)
+    writer = _Writer()
+    buffer = CounterBuffer(writer, interval=3600, max_pending=100)
+
+    buffer.increment(4, 2)
+    buffer.increment(5)
+
+    # Se registra una sola vez, al arrancar el hilo con el primer incremento
+    assert registered == [buffer.flush]
+    registered[0]()
+    assert writer.batches == [{4: 2, 5: 1}]
+
+
+def test_failed_flush_requeues_without_double_counting():
+    attempts = []
+
+    def flaky(counts):
+        attempts.append(dict(counts))
+        if len(attempts) == 1:
+            # Una respuesta llega mientras se escribe el lote que va a fallar
+            buffer.increment(1)
+            raise RuntimeError('base no disponible')
+
+    buffer = CounterBuffer(flaky, interval=3600, max_pending=100)
+    buffer.increment(1, 2)
+    buffer.increment(2)
+
+    assert buffer.flush() == 0
+    assert buffer.get_metrics() == {'pending': 4, 'flushes': 0, 'flushed': 0, 'errors': 1}
+
+    buffer.increment(2)
+    assert buffer.flush() == 2
+    assert attempts == [{1: 2, 2: 1}, {1: 3, 2: 2}]
+    assert buffer.get_metrics() == {'pending': 0, 'flushes': 1, 'flushed': 5, 'errors': 1}
+
+
+def _times_asked(limit):
+    questions = db.session.query(Question).order_by(Question.id).limit(limit)
+    return {question.id: question.times_asked for question in questions}
+
+
+def test_times_asked_writer_adds_to_the_stored_counts(app):
+    before = _times_asked(2)
+    first, second = before
+    buffer = CounterBuffer(question_times_asked_writer(app), interval=3600)
+    buffer.increment(first, 3)
+    buffer.increment(second)
+    buffer.flush()
+
+    db.session.expire_all()
+    assert _times_asked(2) == {first: before[first] + 3, second: before[second] + 1}
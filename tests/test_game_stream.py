@@ -0,0 +1,92 @@
+"""
+Streams de partidas: enrutamiento entre workers y protocolo SSE
+"""
+import json
+import time
+
+import pytest
+
+from game_engine import GameEngine
+from game_stream import GameStreams, InMemoryStreamHub, RedisStreamHub
+from session_token import SessionTokens
+
+TIMEOUT = 5
+
+
+def _wait_subscribed(client, channel):
+    deadline = time.monotonic() + TIMEOUT
+    while not client.subscribers(channel):
+        assert time.monotonic() < deadline, 'el receptor no se suscribió'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def hubs(app, fake_redis):
+    """Dos workers: el primero tiene el stream, el segundo recibe los POST"""
+    owner = RedisStreamHub(fake_redis)
+    other = RedisStreamHub(fake_redis)
+    owner.start(app)
+    _wait_subscribed(fake_redis, owner.channel)
+    return owner, other
+
+
+def test_answers_are_routed_to_the_stream_owner(hubs):
+    owner, other = hubs
+    subscription = owner.subscribe('game')
+
+    assert other.publish('game', {'answer': 'yes'})
+    assert subscription.get(TIMEOUT) == {'answer': 'yes'}
+    assert other.routed == 1
+
+
+def test_closed_stream_releases_its_owner(hubs, fake_redis):
+    owner, other = hubs
+    owner.subscribe('game').close()
+
+    assert fake_redis.get(owner._owner_key('game')) is None
+    assert not other.publish('game', {'answer': 'yes'})
+
+
+def test_reconnect_to_another_worker_keeps_the_new_owner(hubs, fake_redis):
+    owner, other = hubs
+    old = owner.subscribe('game')
+    other.subscribe('game')
+    old.close()
+
+    assert fake_redis.get(owner._owner_key('game')) == other.origin.encode('ascii')
+
+
+def test_dead_owner_falls_back(hubs, fake_redis):
+    owner, other = hubs
+    owner.subscribe('game')
+    # El worker dueño murió: nadie escucha su canal
+    fake_redis.set(owner._owner_key('game'), 'dead-worker')
+
+    assert not other.publish('game', {'answer': 'yes'})
+
+
+def _events(stream):
+    """Eventos (nombre, datos) de un stream SSE, sin keepalives"""
+    for chunk in stream:
+        if chunk.startswith(':'):
+            continue
+        lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        yield lines['event'], json.loads(lines['data'])
+
+
+def test_stream_uses_the_token_sent_with_the_answer(app):
+    engine = GameEngine(session_tokens=SessionTokens(app.config['SECRET_KEY']))
+    streams = GameStreams(engine, InMemoryStreamHub(), heartbeat=0.05)
+    events = _events(streams.open())
+    event, start = next(events)
+    assert event == 'start'
+    session_id = start['session_id']
+
+    # Una respuesta por REST avanza el token sin que el stream se entere
+    rest = engine.process_answer(session_id, start['question']['id'], 'no', start['session_token'])
+    assert streams.submit(session_id, rest['question']['id'], 'yes', rest['session_token'])
+
+    event, result = next(events)
+    assert event == 'question', result
+    session = engine.get_session_info(session_id, result['session_token'])
+    assert session.question_ids.tolist() == [start['question']['id'], rest['question']['id']]
@@ -0,0 +1,49 @@
+"""
+Cola de aprendizaje: la partida y su tarea se confirman juntas
+"""
+from game_engine import GameEngine
+from learning_queue import LearningQueue
+from learning_system import LearningSystem
+from models import db, Character, GameSession, LearningTask
+from session_token import SessionTokens
+
+
+def _guess(engine):
+    """Juega pensando en el primer personaje hasta la adivinanza"""
+    character = db.session.query(Character).order_by(Character.id).first()
+    attributes = {attribute.attribute_key: attribute.value for attribute in character.attributes}
+    result = engine.start_game()
+    session_id, token = result['session_id'], result.get('session_token')
+    while 'question' in result:
+        value = attributes.get(result['question']['attribute_key'], 0)
+        answer = {2: 'yes', 1: 'probably_yes', 0: 'dont_know', -1: 'probably_no', -2: 'no'}[value]
+        result = engine.process_answer(session_id, result['question']['id'], answer, token)
+        token = result.get('session_token', token)
+    assert result['type'] == 'guess'
+    return session_id, result
+
+
+def test_confirm_enqueues_the_game(app):
+    engine = GameEngine()
+    session_id, guess = _guess(engine)
+
+    result = engine.confirm_guess(session_id, guess['character']['id'], True)
+
+    assert 'error' not in result
+    assert db.session.query(LearningTask.session_id).all() == [(session_id,)]
+
+    queue = LearningQueue(app, LearningSystem())
+    assert queue.process_batch() == 1
+    assert db.session.query(LearningTask).count() == 0
+    assert db.session.query(GameSession).filter_by(session_id=session_id).count() == 1
+
+
+def test_repeated_confirm_does_not_enqueue_twice(app):
+    engine = GameEngine(session_tokens=SessionTokens(app.config['SECRET_KEY']))
+    session_id, guess = _guess(engine)
+    character_id, token = guess['character']['id'], guess['session_token']
+
+    assert 'error' not in engine.confirm_guess(session_id, character_id, True, token)
+    assert 'error' in engine.confirm_guess(session_id, character_id, True, token)
+
+    assert db.session.query(LearningTask).count() == 1
@@ -0,0 +1,79 @@
+"""
+Aprendizaje: la lectura previa al upsert bloquea a otros escritores y el
+promedio móvil de efectividad en lote equivale a aplicarlo partida a partida
+"""
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from init_data import initialize_data
+from learning_system import LearningSystem
+from models import db, GameSession, Question
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """Aplicación sobre un archivo SQLite, para abrir una segunda conexión"""
+    path = tmp_path / 'learning.db'
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        initialize_data(db)
+        yield app, str(path)
+        db.session.remove()
+
+
+def test_load_attributes_takes_the_sqlite_write_lock(file_app):
+    _, path = file_app
+    other = sqlite3.connect(path, timeout=0.1)
+
+    LearningSystem()._load_attributes([1])
+
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        other.execute('UPDATE character_attributes SET value = value')
+    db.session.rollback()
+    other.execute('UPDATE character_attributes SET value = value')
+    other.commit()
+
+
+def _effectiveness(question_ids):
+    db.session.expire_all()
+    return [db.session.get(Question, question_id).effectiveness_score for question_id in question_ids]
+
+
+def test_batched_effectiveness_equals_sequential_updates(app):
+    learning = LearningSystem()
+    question_ids = [question.id for question in db.session.query(Question).order_by(Question.id).limit(4)]
+    db.session.query(Question).filter(Question.id == question_ids[0]).update({'effectiveness_score': 0.4})
+    db.session.commit()
+    before = _effectiveness(question_ids)
+    # Preguntas repetidas entre partidas (y dentro de una), éxitos y fallos
+    sessions = [
+        GameSession(questions_asked=question_ids[:3], num_questions=3, success=True),
+        GameSession(questions_asked=[question_ids[1], question_ids[3]], num_questions=8, success=False),
+        GameSession(questions_asked=[], num_questions=0, success=True),
+        GameSession(questions_asked=[question_ids[0], question_ids[0]], num_questions=2, success=True),
+        GameSession(questions_asked=question_ids, num_questions=12, success=True),
+    ]
+
+    expected = dict(zip(question_ids, before))
+    decay = LearningSystem.EFFECTIVENESS_DECAY
+    for session in sessions:
+        boost = learning._effectiveness_boost(session)
+        for question_id in session.questions_asked:
+            expected[question_id] = expected[question_id] * decay + boost * (1 - decay)
+
+    learning._apply_question_effectiveness(sessions)
+    batched = _effectiveness(question_ids)
+    db.session.rollback()
+
+    for session in sessions:
+        learning._apply_question_effectiveness([session])
+    sequential = _effectiveness(question_ids)
+
+    assert batched == pytest.approx([expected[question_id] for question_id in question_ids], abs=1e-12)
+    assert batched == pytest.approx(sequential, abs=1e-12)
+    assert batched != pytest.approx(before)
@@ -0,0 +1,66 @@
+"""
+Difusión de cambios del modelo entre workers por Redis pub/sub
+"""
+import queue
+import time
+
+import pytest
+
+from model_changes import RedisChangeFeed
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def feeds(app, fake_redis, monkeypatch):
+    """Dos workers conectados al mismo Redis; el segundo escucha y anota los avisos"""
+    monkeypatch.setattr(RedisChangeFeed, 'RECONNECT_DELAY', 0)
+    publisher = RedisChangeFeed(fake_redis)
+    listener = RedisChangeFeed(fake_redis)
+    received = queue.Queue()
+    listener.subscribe(received.put)
+    listener.start(app)
+    _wait_subscribed(fake_redis, listener.channel)
+    return publisher, listener, received
+
+
+def _wait_subscribed(client, channel):
+    deadline = time.monotonic() + TIMEOUT
+    while not client.subscribers(channel):
+        assert time.monotonic() < deadline, 'el receptor no se suscribió'
+        time.sleep(0.01)
+
+
+def test_changes_reach_other_workers(feeds):
+    publisher, listener, received = feeds
+
+    listener.publish(1, [7])  # los avisos propios se ignoran
+    publisher.publish(3, [1, 2], records=True)
+
+    change = received.get(timeout=TIMEOUT)
+    assert change.origin == publisher.origin
+    assert change.version == 3
+    assert change.character_ids == [1, 2]
+    assert change.records
+    assert listener.received == 1
+
+
+def test_resync_after_reconnect(feeds, fake_redis, monkeypatch):
+    publisher, listener, received = feeds
+    monkeypatch.setattr(RedisChangeFeed, 'RECONNECT_DELAY', 0.2)
+
+    # Los avisos publicados mientras la conexión está cortada se pierden
+    fake_redis.disconnect()
+    assert fake_redis.subscribers(listener.channel) == 0
+    publisher.publish(4, [5])
+
+    change = received.get(timeout=TIMEOUT)
+    assert change.origin == 'resync'
+    assert change.character_ids is None
+    assert change.records
+    assert listener.errors == 1
+
+    _wait_subscribed(fake_redis, listener.channel)
+    publisher.publish(5, [6])
+    assert received.get(timeout=TIMEOUT).character_ids == [6]
+    assert received.empty()
@@ -0,0 +1,105 @@
+"""
+Archivo del modelo: ida y vuelta, checksum y puesta al día desde la marca de
+aprendizaje
+"""
+import numpy as np
+import pytest
+
+from attribute_model import AttributeModel
+from model_file import HEADER, learning_watermark, load_model, read_model_file, write_model_file
+from models import db, Character, CharacterAttribute, GameSession, LearningTask
+
+
+def _assert_same_matrices(model, expected):
+    assert model.character_ids.tolist() == expected.character_ids.tolist()
+    assert model.attribute_keys == expected.attribute_keys
+    assert np.array_equal(model.values, expected.values)
+    assert np.array_equal(model.confidence, expected.confidence)
+
+
+def _add_game(character_id, pending=False):
+    """Partida acertada; con `pending`, su tarea de aprendizaje sigue en la cola"""
+    game = GameSession(
+        session_id=f'game-{db.session.query(GameSession).count()}',
+        guessed_character_id=character_id,
+        success=True
+    )
+    db.session.add(game)
+    if pending:
+        db.session.add(LearningTask(session_id=game.session_id))
+    db.session.commit()
+    return game
+
+
+def test_round_trip(app, tmp_path):
+    path = str(tmp_path / 'model.akm')
+    model = AttributeModel.from_db(db.session, version=3)
+    write_model_file(model, path, watermark=7)
+
+    loaded, watermark = read_model_file(path)
+
+    assert watermark == 7
+    assert loaded.version == 3
+    assert loaded.fingerprint == model.fingerprint
+    _assert_same_matrices(loaded, model)
+    assert [q.to_dict() for q in loaded.questions] == [q.to_dict() for q in model.questions]
+    # Las matrices son vistas de solo lectura del archivo mapeado
+    assert not loaded.values.flags.writeable
+
+
+def test_corrupt_file_is_rejected(app, tmp_path):
+    path = tmp_path / 'model.akm'
+    write_model_file(AttributeModel.from_db(db.session), str(path))
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match='Checksum'):
+        read_model_file(str(path))
+    # Sin verificar se lee igual (lo usa la CLI para leer la versión anterior)
+    assert read_model_file(str(path), verify=False)[0].num_characters > 0
+
+    path.write_bytes(bytes(data[:HEADER.size - 1]))
+    with pytest.raises(ValueError, match='truncado'):
+        read_model_file(str(path))
+    path.write_bytes(b'XXXX' + bytes(data[4:]))
+    with pytest.raises(ValueError, match='No es un archivo de modelo'):
+        read_model_file(str(path))
+
+
+def test_watermark_stays_below_pending_learning(app):
+    characters = db.session.query(Character.id).order_by(Character.id).limit(3).all()
+    characters = [char_id for (char_id,) in characters]
+    assert learning_watermark(db.session) == 0
+
+    first = _add_game(characters[0])
+    pending = _add_game(characters[1], pending=True)
+    _add_game(characters[2])
+
+    # La última partida ya se aprendió, pero la anterior sigue pendiente
+    assert learning_watermark(db.session) == pending.id - 1 == first.id
+
+    db.session.query(LearningTask).delete()
+    db.session.commit()
+    assert learning_watermark(db.session) == db.session.query(GameSession).count()
+
+
+def test_load_replays_games_above_the_watermark(app, tmp_path):
+    path = str(tmp_path / 'model.akm')
+    characters = db.session.query(Character).order_by(Character.id).limit(3).all()
+    _add_game(characters[0].id)
+    pending = _add_game(characters[1].id, pending=True)
+    _add_game(characters[2].id)
+    write_model_file(AttributeModel.from_db(db.session), path, learning_watermark(db.session))
+
+    # El aprendizaje de la partida pendiente llega después de escribir el archivo
+    attribute = db.session.query(CharacterAttribute).filter_by(
+        character_id=pending.guessed_character_id).first()
+    attribute.value = -attribute.value or 2
+    attribute.confidence = 0.95
+    db.session.query(LearningTask).delete()
+    db.session.commit()
+
+    loaded = load_model(path, db.session)
+
+    _assert_same_matrices(loaded, AttributeModel.from_db(db.session))
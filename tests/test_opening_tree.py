@@ -0,0 +1,62 @@
+"""
+Árbol de aperturas: solo se usa con el modelo y la configuración de selección
+con los que se compiló
+"""
+import json
+
+from game_engine import GameEngine
+from models import db
+from opening_tree import OpeningTree
+from question_selector import QuestionSelector
+from scoring import ProbabilisticScoringEngine
+
+
+def _compile(engine, depth=2):
+    return OpeningTree.compile(
+        engine.question_selector.model,
+        engine.question_selector,
+        engine.scoring,
+        depth,
+        engine.MIN_QUESTIONS,
+        engine.selection_namespace()
+    )
+
+
+def test_artifact_round_trip(app, tmp_path):
+    engine = GameEngine()
+    tree = _compile(engine)
+    path = tmp_path / 'opening_tree.json'
+    tree.save(str(path))
+
+    loaded = OpeningTree.load(str(path))
+
+    assert loaded.nodes == tree.nodes
+    assert loaded.selection == 'points:0'
+    assert loaded.matches(engine.question_selector.model, engine.selection_namespace())
+
+
+def test_tree_requires_the_same_selection(app):
+    tree = _compile(GameEngine())
+    model = GameEngine().question_selector.model
+
+    lookahead = GameEngine(question_selector=QuestionSelector(db.session, lookahead_top_k=3))
+    probabilistic = GameEngine(scoring=ProbabilisticScoringEngine())
+
+    assert not tree.matches(model, lookahead.selection_namespace())
+    assert not tree.matches(model, probabilistic.selection_namespace())
+
+    lookahead.opening_tree = tree
+    assert lookahead._opening_tree_for(model) is None
+
+
+def test_old_artifacts_are_ignored(app, tmp_path):
+    data = _compile(GameEngine()).to_dict()
+    data['format_version'] = 1
+    data['scoring'] = data.pop('selection').split(':')[0]
+    path = tmp_path / 'opening_tree.json'
+    path.write_text(json.dumps(data))
+
+    engine = GameEngine(opening_tree_path=str(path))
+
+    assert engine.opening_tree is None
+    assert 'question' in engine.start_game()
@@ -0,0 +1,163 @@
+"""
+Selector de preguntas: la búsqueda por cotas elige lo mismo que la exhaustiva,
+y el lookahead a dos pasos respeta su presupuesto y mejora a la greedy
+"""
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from attribute_model import AttributeModel, CandidateHistograms, QuestionRecord
+from models import db
+from question_selector import QuestionSelector, information_gain_from_histograms
+
+
+def _model(effectiveness):
+    """Lo que _best_question lee del modelo: effectiveness y los registros"""
+    return SimpleNamespace(
+        question_effectiveness=np.asarray(effectiveness, dtype=np.float64),
+        questions=[f'q{index}' for index in range(len(effectiveness))]
+    )
+
+
+def _exhaustive(histograms, effectiveness, total):
+    gains = information_gain_from_histograms(histograms, total) * effectiveness
+    return int(np.argmax(gains))  # el primer índice ante empates
+
+
+def _pruned(selector, model, histograms, distinct, total):
+    indices = np.arange(len(histograms))
+    chosen = selector._best_question(model, indices, distinct, lambda rows: histograms[rows], total)
+    return model.questions.index(chosen)
+
+
+def _histograms(rng, patterns, count, total):
+    """`count` histogramas tomados de `patterns` distintos: muchas preguntas empatan"""
+    pool = []
+    for _ in range(patterns):
+        cuts = np.sort(rng.integers(0, total + 1, size=4))
+        pool.append(np.diff(np.concatenate(([0], cuts, [total]))))
+    return np.array(pool)[rng.integers(0, patterns, size=count)]
+
+
+def test_bound_pruning_matches_exhaustive_argmax():
+    selector = QuestionSelector(None)
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        count = int(rng.integers(1, 6 * QuestionSelector.SEARCH_CHUNK))
+        total = int(rng.integers(2, 60))
+        histograms = _histograms(rng, int(rng.integers(1, 6)), count, total)
+        effectiveness = rng.choice([0.5, 1.0, 1.0], size=count)
+        # La cota de valores distintos puede ser holgada (cuenta de más, nunca de menos)
+        distinct = np.count_nonzero(histograms > 0, axis=1) + rng.integers(0, 6, size=count)
+
+        expected = _exhaustive(histograms, effectiveness, total)
+        assert _pruned(selector, _model(effectiveness), histograms, distinct, total) == expected
+
+
+def test_tie_across_chunks_keeps_the_first_index():
+    selector = QuestionSelector(None)
+    chunk = QuestionSelector.SEARCH_CHUNK
+    total = 10
+    count = 3 * chunk
+    # Relleno sin ganancia; empatadas en la mejor, la 3 y la última
+    histograms = np.tile([10, 0, 0, 0, 0], (count, 1))
+    histograms[[3, count - 1]] = [2, 2, 2, 2, 2]
+    # Cotas holgadas: la última se evalúa primero y la 3 en el último bloque
+    distinct = np.full(count, 6)
+    distinct[count - 1] = 8
+    distinct[3] = 5
+    effectiveness = np.ones(count)
+    bound_order = list(np.argsort(-np.log2(distinct), kind='stable'))
+    assert bound_order.index(count - 1) < chunk <= 2 * chunk <= bound_order.index(3)
+
+    assert _exhaustive(histograms, effectiveness, total) == 3
+    assert _pruned(selector, _model(effectiveness), histograms, distinct, total) == 3
+
+
+# 8 personajes × 4 atributos: la mejor pregunta a un paso (k0) deja ramas
+# peores que la segunda (k1)
+LOOKAHEAD_VALUES = [
+    [0, 0, 2, 2], [-2, -2, 2, 2], [-2, -2, 2, 0], [-2, 2, -2, 0],
+    [0, 0, -2, -2], [2, 2, 2, 0], [2, -2, 0, 2], [-2, -2, -2, 0],
+]
+
+
+def _lookahead_model():
+    values = np.array(LOOKAHEAD_VALUES, dtype=np.int8)
+    keys = [f'k{col}' for col in range(values.shape[1])]
+    questions = [QuestionRecord(col + 1, key, key, 0, 1.0) for col, key in enumerate(keys)]
+    return AttributeModel(list(range(1, len(values) + 1)), keys, values, questions)
+
+
+def _two_step_value(model, col):
+    """Ganancia esperada a dos pasos calculada por fuerza bruta"""
+    def gains(rows):
+        values = model.values[rows]
+        histograms = np.stack([(values == value).sum(axis=0) for value in range(-2, 3)], axis=1)
+        return information_gain_from_histograms(histograms, len(rows))
+
+    everyone = np.arange(model.num_characters)
+    value = gains(everyone)[col]
+    for answer in range(-2, 3):
+        rows = np.flatnonzero(model.values[:, col] == answer)
+        if len(rows) > 1:
+            value += len(rows) / len(everyone) * gains(rows).max()
+    return value
+
+
+def _select(selector, model):
+    return selector.select_best_question_from_histograms(
+        CandidateHistograms.for_all(model), [], model, model.all_candidates
+    )
+
+
+def test_lookahead_beats_greedy():
+    model = _lookahead_model()
+    greedy = _select(QuestionSelector(None, model=model), model)
+    selector = QuestionSelector(None, model=model, lookahead_top_k=4, lookahead_budget_ms=10000)
+    chosen = _select(selector, model)
+
+    assert (greedy.attribute_key, chosen.attribute_key) == ('k0', 'k1')
+    assert _two_step_value(model, 1) > _two_step_value(model, 0)
+    stats = selector.get_lookahead_stats()
+    assert (stats['selections'], stats['changed'], stats['budget_exhausted']) == (1, 1, 0)
+
+
+def test_exhausted_budget_falls_back_to_greedy():
+    model = _lookahead_model()
+    selector = QuestionSelector(None, model=model, lookahead_top_k=4, lookahead_budget_ms=0)
+
+    # Sin presupuesto solo se evalúa la greedy
+    assert _select(selector, model).attribute_key == 'k0'
+    stats = selector.get_lookahead_stats()
+    assert (stats['selections'], stats['changed'], stats['budget_exhausted']) == (1, 0, 1)
+
+
+def test_lookahead_stats_from_several_threads():
+    model = _lookahead_model()
+    selector = QuestionSelector(None, model=model, lookahead_top_k=4, lookahead_budget_ms=10000)
+
+    def select_many():
+        for _ in range(100):
+            _select(selector, model)
+
+    threads = [threading.Thread(target=select_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = selector.get_lookahead_stats()
+    assert stats['selections'] == stats['changed'] == 400
+
+
+def test_refresh_counts_delta_and_full_builds(app):
+    selector = QuestionSelector(db.session)
+    selector.model
+    selector.refresh_model([1])
+    selector.refresh_model()
+
+    stats = selector.get_model_stats()
+    # La primera construcción (al leer el modelo) también es completa
+    assert (stats['full_builds'], stats['delta_builds'], stats['version']) == (2, 1, 3)
@@ -0,0 +1,43 @@
+"""
+Caché de registros: los cambios de otros procesos (herramientas de importación)
+la invalidan a través de la versión publicada en data_versions
+"""
+from sqlalchemy import update
+
+from models import db, Question
+from record_cache import RecordCache, publish_record_changes
+
+
+def _write_from_other_process(question_id, text):
+    """Cambia una pregunta sin pasar por la sesión ORM (no dispara los eventos locales)"""
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(Question.__table__).where(Question.__table__.c.id == question_id).values(text=text)
+        )
+
+
+def test_import_tools_invalidate_other_processes(app):
+    cache = RecordCache(db.session, check_interval=0)
+    question_id = cache.question(1).id
+    original = cache.question(question_id).text
+
+    _write_from_other_process(question_id, '¿Importada?')
+    # Sin aviso, el worker no ve el commit de otro proceso
+    assert cache.question(question_id).text == original
+
+    publish_record_changes(db.session)
+
+    assert cache.question(question_id).text == '¿Importada?'
+    assert cache.external_invalidations == 1
+
+
+def test_version_is_checked_once_per_interval(app):
+    cache = RecordCache(db.session, check_interval=3600)
+    original = cache.question(1).text
+
+    _write_from_other_process(1, '¿Importada?')
+    publish_record_changes(db.session)
+
+    assert cache.question(1).text == original
+    cache._next_check = 0.0
+    assert cache.question(1).text == '¿Importada?'
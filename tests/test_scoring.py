@@ -0,0 +1,176 @@
+"""
+Motores de puntuación: las puntuaciones vectorizadas y las estadísticas
+incrementales coinciden con el cálculo directo
+"""
+import numpy as np
+import pytest
+
+from bitset import bits_to_rows
+from game_engine import GameEngine
+from models import db, Character, CharacterAttribute, Question
+from scoring import PointsScoringEngine, ProbabilisticScoringEngine
+
+VALUE_ANSWERS = {2: 'yes', 1: 'probably_yes', 0: 'dont_know', -1: 'probably_no', -2: 'no'}
+
+
+def _play(engine, character_id):
+    """Juega pensando en un personaje y devuelve la sesión final (o la última guardada, si se rindió)"""
+    attributes = {
+        attribute.attribute_key: attribute.value
+        for attribute in db.session.get(Character, character_id).attributes
+    }
+    result = engine.start_game()
+    session_id = result['session_id']
+    session = engine.get_session_info(session_id)
+    while result.get('type', 'question') == 'question':
+        session = engine.get_session_info(session_id)
+        question = result['question']
+        answer = VALUE_ANSWERS[attributes.get(question['attribute_key'], 0)]
+        result = engine.process_answer(session_id, question['id'], answer)
+    return engine.get_session_info(session_id) or session
+
+
+def _answered_columns(session):
+    model = session.model
+    return [model.key_to_col[model.get_question(qid).attribute_key] for qid in session.question_ids.tolist()]
+
+
+def _direct_points(session, rows):
+    scores = np.zeros(len(rows), dtype=np.int64)
+    for col, answer in zip(_answered_columns(session), session.answer_values.tolist()):
+        scores += 4 - 2 * np.abs(session.model.values[rows, col].astype(np.int64) - answer)
+    return scores
+
+
+def _direct_log_probability(scoring, session, rows):
+    model = session.model
+    weights = np.array(scoring.DISTANCE_WEIGHTS)
+    scores = np.zeros(len(rows))
+    for col, answer in zip(_answered_columns(session), session.answer_values.tolist()):
+        for index, row in enumerate(rows):
+            value = int(model.values[row, col])
+            likelihood = weights[abs(value - answer)] / sum(weights[abs(value - other)] for other in range(-2, 3))
+            confidence = float(model.confidence[row, col])
+            scores[index] += np.log(confidence * likelihood + (1 - confidence) / 5)
+    return scores
+
+
+@pytest.fixture(params=['points', 'probabilistic'])
+def scoring(request):
+    if request.param == 'points':
+        return PointsScoringEngine()
+    return ProbabilisticScoringEngine()
+
+
+def test_scores_match_direct_computation(app, scoring):
+    engine = GameEngine(scoring=scoring)
+    for (character_id,) in db.session.query(Character.id).order_by(Character.id).limit(5):
+        session = _play(engine, character_id)
+        rows = bits_to_rows(session.candidates, session.model.num_characters)
+        stats = session.stats
+        assert session.question_count > 0
+
+        if isinstance(scoring, PointsScoringEngine):
+            expected = _direct_points(session, rows)
+            assert np.array_equal(session.scores[rows], expected)
+            assert stats.total == int(expected.sum())
+        else:
+            expected = _direct_log_probability(scoring, session, rows)
+            assert np.allclose(session.scores[rows], expected)
+            assert stats.total == pytest.approx(np.exp(expected - expected.max()).sum())
+
+        assert stats.count == len(rows)
+        assert stats.leader == rows[int(np.argmax(session.scores[rows]))]
+        assert stats.leader_score == pytest.approx(session.scores[rows].max())
+
+
+@pytest.fixture
+def synthetic_app():
+    """Base con 150 personajes y 8 atributos de valor ±2: muchos empates de puntos"""
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        rng = np.random.default_rng(0)
+        keys = [f'attr_{index:02d}' for index in range(8)]
+        for key in keys:
+            db.session.add(Question(text=key, attribute_key=key))
+        for index in range(150):
+            character = Character(name=f'P{index}')
+            db.session.add(character)
+            db.session.flush()
+            for key in keys:
+                if rng.random() < 0.6:
+                    db.session.add(CharacterAttribute(
+                        character_id=character.id, attribute_key=key, value=int(rng.choice([-2, 2]))
+                    ))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+class _BaselineGame:
+    """Lógica original de puntos sobre diccionarios y la lista de candidatos"""
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+        self.candidate_ids = sorted(attributes)
+        self.scores = {char_id: 0 for char_id in attributes}
+        self.question_count = 0
+
+    def answer(self, attribute_key, answer_value):
+        self.question_count += 1
+        for char_id in self.candidate_ids:
+            self.scores[char_id] += 4 - 2 * abs(self.attributes[char_id].get(attribute_key, 0) - answer_value)
+
+        threshold = max(self.scores.values()) - 10
+        filtered = [char_id for char_id in self.candidate_ids if self.scores[char_id] >= threshold]
+        if len(filtered) < 5 and len(self.candidate_ids) >= 5:
+            filtered = sorted(self.candidate_ids, key=lambda char_id: self.scores[char_id], reverse=True)[:5]
+        self.candidate_ids = filtered or self.candidate_ids
+
+    def best(self):
+        return max(self.candidate_ids, key=lambda char_id: self.scores[char_id])
+
+    def should_guess(self):
+        if self.question_count < GameEngine.MIN_QUESTIONS or not self.candidate_ids:
+            return None
+        top = self.best()
+        others = [self.scores[char_id] for char_id in self.candidate_ids if char_id != top]
+        if not others or self.scores[top] > sum(others) / len(others) + 8:
+            return top
+        return None
+
+
+def test_guesses_match_the_original_list_logic(synthetic_app):
+    attributes = {char_id: {} for (char_id,) in db.session.query(Character.id)}
+    for attribute in db.session.query(CharacterAttribute):
+        attributes[attribute.character_id][attribute.attribute_key] = attribute.value
+    engine = GameEngine()
+    rng = np.random.default_rng(1)
+
+    for character_id in sorted(attributes):
+        baseline = _BaselineGame(attributes)
+        result = engine.start_game()
+        session_id = result['session_id']
+        while result.get('type', 'question') == 'question':
+            question = result['question']
+            value = attributes[character_id].get(question['attribute_key'], 0)
+            if rng.random() < 0.15:
+                value = int(rng.integers(-2, 3))
+            result = engine.process_answer(session_id, question['id'], VALUE_ANSWERS[value])
+            baseline.answer(question['attribute_key'], value)
+
+            expected = baseline.should_guess()
+            if expected is None and result['type'] == 'guess':
+                # Máximo de preguntas o sin preguntas: el mejor candidato de la lista
+                expected = baseline.best()
+            assert result['type'] == ('guess' if expected is not None else 'question')
+            if expected is not None:
+                assert result['character']['id'] == expected
+            else:
+                assert result['candidates_remaining'] == len(baseline.candidate_ids)
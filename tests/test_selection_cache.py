@@ -0,0 +1,62 @@
+"""
+Caché de selección: solo se reutiliza una pregunta para el mismo modelo y la
+misma configuración de selección
+"""
+from game_engine import GameEngine
+from models import db, CharacterAttribute
+from question_selector import QuestionSelector
+from scoring import ProbabilisticScoringEngine
+from selection_cache import SelectionCache
+
+
+def _answer_first_question(engine):
+    """Dos selecciones: la primera pregunta y la siguiente tras responderla"""
+    result = engine.start_game()
+    engine.process_answer(result['session_id'], result['question']['id'], 'yes')
+
+
+def _lookups(cache):
+    metrics = cache.get_metrics()
+    return metrics['hits'] + metrics['shared_hits'], metrics['misses']
+
+
+def test_same_model_and_namespace_hit(app):
+    cache = SelectionCache()
+    _answer_first_question(GameEngine(selection_cache=cache))
+    hits, misses = _lookups(cache)
+
+    _answer_first_question(GameEngine(selection_cache=cache))
+
+    assert _lookups(cache) == (hits + 2, misses)
+
+
+def test_other_namespace_misses(app):
+    cache = SelectionCache()
+    engine = GameEngine(selection_cache=cache)
+    _answer_first_question(engine)
+
+    for other in (
+        GameEngine(selection_cache=cache, scoring=ProbabilisticScoringEngine()),
+        GameEngine(selection_cache=cache, question_selector=QuestionSelector(db.session, lookahead_top_k=3)),
+    ):
+        assert other.selection_namespace() != engine.selection_namespace()
+        hits, misses = _lookups(cache)
+        _answer_first_question(other)
+        assert _lookups(cache) == (hits, misses + 2)
+
+
+def test_model_change_misses(app):
+    cache = SelectionCache()
+    engine = GameEngine(selection_cache=cache)
+    _answer_first_question(engine)
+    fingerprint = engine.question_selector.model.fingerprint
+
+    attribute = db.session.query(CharacterAttribute).first()
+    attribute.value = -attribute.value or 2
+    db.session.commit()
+    engine.question_selector.refresh_model([attribute.character_id])
+    assert engine.question_selector.model.fingerprint != fingerprint
+
+    hits, misses = _lookups(cache)
+    _answer_first_question(engine)
+    assert _lookups(cache) == (hits, misses + 2)
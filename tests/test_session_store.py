@@ -0,0 +1,238 @@
+"""
+Almacenamiento de sesiones: codec binario, concurrencia optimista en Redis y
+límites de las sesiones en memoria
+"""
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from game_engine import GameEngine
+from session_store import InMemorySessionStore, RedisSessionStore, SessionCodec, SessionConflictError
+
+
+def _play(engine, answers=('yes', 'no', 'probably_yes')):
+    """Inicia una partida y responde algunas preguntas; devuelve el ID de sesión"""
+    result = engine.start_game()
+    session_id = result['session_id']
+    for answer in answers:
+        if 'question' not in result:
+            break
+        result = engine.process_answer(session_id, result['question']['id'], answer)
+    return session_id, result
+
+
+def _assert_same_session(restored, session):
+    rows = np.flatnonzero(np.unpackbits(session.candidates.view(np.uint8), bitorder='little'))
+    assert restored.model is session.model
+    assert np.array_equal(restored.candidates, session.candidates)
+    assert np.array_equal(restored.scores[rows], session.scores[rows])
+    assert np.array_equal(restored.histograms.counts, session.histograms.counts)
+    assert restored.histograms.total == session.histograms.total
+    assert np.array_equal(restored.question_ids, session.question_ids)
+    assert np.array_equal(restored.answer_values, session.answer_values)
+    assert restored.stats.leader == session.stats.leader
+    assert restored.stats.leader_score == session.stats.leader_score
+    assert restored.stats.total == session.stats.total
+    assert restored.stats.count == session.stats.count
+
+
+@pytest.fixture
+def redis_engine(app, fake_redis):
+    return GameEngine(session_store=RedisSessionStore(fake_redis))
+
+
+def test_codec_round_trip(engine):
+    session_id, _ = _play(engine)
+    session = engine.get_session_info(session_id)
+    codec = SessionCodec(engine._model_for, engine._opening_tree_for, engine._rebuild_session)
+
+    _assert_same_session(codec.loads(codec.dumps(session)), session)
+
+
+def test_codec_rebuilds_sessions_of_unknown_models(engine):
+    session_id, _ = _play(engine)
+    session = engine.get_session_info(session_id)
+    codec = SessionCodec(lambda fingerprint: None, engine._opening_tree_for, engine._rebuild_session)
+
+    _assert_same_session(codec.loads(codec.dumps(session)), session)
+
+
+def test_redis_store_plays_a_game(redis_engine):
+    session_id, result = _play(redis_engine)
+    assert 'error' not in result
+
+    session, version = redis_engine.session_store.load(session_id)
+    assert version == 1 + len(session.question_ids)
+    assert redis_engine.session_store.count() == 1
+
+
+def test_save_rejects_stale_version(redis_engine):
+    session_id, _ = _play(redis_engine, answers=())
+    store = redis_engine.session_store
+    first, version = store.load(session_id)
+    second, _ = store.load(session_id)
+
+    assert store.save(session_id, first, version) == version + 1
+    with pytest.raises(SessionConflictError):
+        store.save(session_id, second, version)
+
+
+def test_save_loses_to_a_concurrent_write(redis_engine, fake_redis):
+    session_id, _ = _play(redis_engine, answers=())
+    store = redis_engine.session_store
+    session, version = store.load(session_id)
+    other, _ = store.load(session_id)
+
+    # La otra petición escribe entre la lectura vigilada (WATCH) y el EXEC
+    fake_redis.before_execute = lambda client: store.save(session_id, other, version)
+    with pytest.raises(SessionConflictError):
+        store.save(session_id, session, version)
+
+    assert store.load(session_id)[1] == version + 1
+
+
+def test_concurrent_answers_to_one_game(redis_engine, fake_redis):
+    result = redis_engine.start_game()
+    session_id, question_id = result['session_id'], result['question']['id']
+
+    def other_request(client):
+        assert 'error' not in redis_engine.process_answer(session_id, question_id, 'no')
+
+    fake_redis.before_execute = other_request
+    result = redis_engine.process_answer(session_id, question_id, 'yes')
+
+    assert 'error' in result
+    assert redis_engine.session_conflicts == 1
+    session, _ = redis_engine.session_store.load(session_id)
+    assert session.answer_values.tolist() == [GameEngine.ANSWER_VALUES['no']]
+
+
+def test_delete_with_version(redis_engine):
+    session_id, _ = _play(redis_engine, answers=())
+    store = redis_engine.session_store
+
+    assert not store.delete(session_id, version=2)
+    assert store.delete(session_id, version=1)
+    assert store.load(session_id) is None
+
+
+def test_delete_loses_to_a_concurrent_write(redis_engine, fake_redis):
+    session_id, _ = _play(redis_engine, answers=())
+    store = redis_engine.session_store
+    session, version = store.load(session_id)
+
+    fake_redis.before_execute = lambda client: store.save(session_id, session, version)
+
+    assert not store.delete(session_id, version)
+    assert store.load(session_id)[1] == version + 1
+
+
+
+@pytest.mark.parametrize('blob', [
+    b'no es zlib',
+    zlib.compress(b'AKS'),
+    zlib.compress(b'AKS\x01\x00\x00\x00\x00'),
+])
+def test_unreadable_redis_session_is_not_found(redis_engine, fake_redis, blob):
+    session_id, result = _play(redis_engine, answers=())
+    store = redis_engine.session_store
+    # Estado corrupto, truncado o de un formato anterior
+    fake_redis.hset(store._key(session_id), 'd', blob)
+
+    assert store.load(session_id) is None
+    result = redis_engine.process_answer(session_id, result['question']['id'], 'yes')
+    assert result == {'error': 'Sesión no encontrada'}
+    assert store.get_metrics()['unreadable'] == 2
+
+
+def test_redis_metrics_do_not_scan_keys(redis_engine, fake_redis, monkeypatch):
+    _play(redis_engine, answers=())
+    monkeypatch.setattr(fake_redis, 'scan_iter', lambda *args, **kwargs: pytest.fail('SCAN en las métricas'))
+
+    assert redis_engine.session_store.get_metrics() == {'store': 'redis', 'unreadable': 0}
+
+class _Clock:
+    """Reloj manual para InMemorySessionStore"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _memory_engine(**limits):
+    clock = _Clock()
+    return GameEngine(session_store=InMemorySessionStore(clock=clock, **limits)), clock
+
+
+def test_memory_sessions_expire_after_ttl_of_inactivity(app):
+    engine, clock = _memory_engine(ttl=60)
+    store = engine.session_store
+    idle, _ = _play(engine, answers=())
+    active, _ = _play(engine, answers=())
+
+    clock.now += 50
+    assert store.load(active) is not None
+    clock.now += 50
+    # Leerla renueva su inactividad; la otra lleva 100 segundos sin uso
+    assert store.load(idle) is None
+    assert store.load(active) is not None
+    assert store.get_metrics()['expired'] == 1
+    assert 'error' in engine.process_answer(idle, 1, 'yes')
+
+
+def test_memory_store_evicts_least_recently_used_sessions(app):
+    engine, clock = _memory_engine(max_sessions=2)
+    store = engine.session_store
+    first, _ = _play(engine, answers=())
+    second, _ = _play(engine, answers=())
+    store.load(first)
+
+    third, _ = _play(engine, answers=())
+
+    assert store.load(second) is None
+    assert store.load(first) is not None and store.load(third) is not None
+    assert store.count() == 2
+    assert store.get_metrics()['evicted'] == 1
+
+
+def test_memory_store_caps_bytes(app):
+    engine, clock = _memory_engine()
+    store = engine.session_store
+    sessions = [_play(engine, answers=())[0]]
+    session_bytes = store.get_metrics()['bytes']
+    assert session_bytes > 0
+
+    store.max_bytes = int(session_bytes * 2.5)
+    sessions += [_play(engine, answers=())[0] for _ in range(3)]
+
+    metrics = store.get_metrics()
+    assert metrics['active'] == 2 and metrics['evicted'] == 2
+    assert metrics['bytes'] <= store.max_bytes
+    assert [store.load(session_id) is not None for session_id in sessions] == [False, False, True, True]
+
+    # La sesión recién guardada nunca se desaloja, aunque sola supere el límite
+    store.max_bytes = 1
+    last, _ = _play(engine, answers=())
+    assert store.count() == 1 and store.load(last) is not None
+
+
+def test_memory_sweeper_removes_expired_sessions(app):
+    engine, clock = _memory_engine(ttl=10, sweep_interval=0.01)
+    store = engine.session_store
+    old = [_play(engine, answers=())[0] for _ in range(2)]
+    clock.now += 8
+    recent, _ = _play(engine, answers=())
+
+    clock.now += 4
+    deadline = time.monotonic() + 5
+    while store.count() > 1:
+        assert time.monotonic() < deadline, 'el barrido no eliminó las sesiones expiradas'
+        time.sleep(0.01)
+
+    assert store.get_metrics()['expired'] == 2
+    assert store.load(recent) is not None
+    assert all(store.load(session_id) is None for session_id in old)
@@ -0,0 +1,88 @@
+"""
+Tokens de sesión firmados: ida y vuelta, alteraciones y caducidad
+"""
+import base64
+import time
+import uuid
+
+import numpy as np
+import pytest
+
+import session_token
+from game_engine import GameEngine
+from session_token import InvalidSessionToken, SessionTokens
+
+
+@pytest.fixture
+def tokens(app):
+    return SessionTokens(app.config['SECRET_KEY'], max_age=60, cache_size=0)
+
+
+@pytest.fixture
+def game(tokens):
+    """Partida con dos respuestas; devuelve (motor, ID de sesión, token)"""
+    engine = GameEngine(session_tokens=tokens)
+    result = engine.start_game()
+    session_id = result['session_id']
+    for answer in ('yes', 'no'):
+        result = engine.process_answer(session_id, result['question']['id'], answer, result['session_token'])
+    return engine, session_id, result['session_token']
+
+
+def _tamper(token: str, index: int) -> str:
+    data = bytearray(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    data[index] ^= 0x01
+    return base64.urlsafe_b64encode(bytes(data)).rstrip(b'=').decode('ascii')
+
+
+def test_replay_restores_the_session(game, tokens):
+    engine, session_id, token = game
+    replays = tokens.replays
+
+    session = tokens.load(session_id, token)
+
+    assert session.question_count == 2
+    assert tokens.replays == replays + 1
+    rebuilt = engine._rebuild_session(session.question_ids, session.answer_values)
+    assert np.array_equal(session.candidates, rebuilt.candidates)
+
+
+@pytest.mark.parametrize('index', [0, 2, 20, -40, -1])
+def test_tampered_token_is_rejected(game, tokens, index):
+    _, session_id, token = game
+
+    with pytest.raises(InvalidSessionToken):
+        tokens.load(session_id, _tamper(token, index))
+    assert tokens.rejected == 1
+
+
+def test_token_of_another_session_is_rejected(game, tokens):
+    _, _, token = game
+
+    with pytest.raises(InvalidSessionToken):
+        tokens.load(str(uuid.uuid4()), token)
+
+
+def test_token_signed_with_another_key_is_rejected(game):
+    _, session_id, token = game
+
+    with pytest.raises(InvalidSessionToken):
+        SessionTokens('another-secret').load(session_id, token)
+
+
+def test_expired_token_is_rejected(game, tokens, monkeypatch):
+    _, session_id, token = game
+    tokens.load(session_id, token)
+
+    now = time.time()
+    monkeypatch.setattr(session_token.time, 'time', lambda: now + 61)
+    with pytest.raises(InvalidSessionToken):
+        tokens.load(session_id, token)
+
+
+def test_malformed_tokens_are_rejected(game, tokens):
+    _, session_id, token = game
+
+    for bad in ('', 'not base64!', token[:20], 'A' * (tokens.max_length + 1)):
+        with pytest.raises(InvalidSessionToken):
+            tokens.load(session_id, bad)
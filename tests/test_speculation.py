@@ -0,0 +1,143 @@
+"""
+Especulación: contabilidad de aciertos, cancelaciones y CPU desperdiciada, y
+ramas que son cálculo puro (sin base de datos ni cachés compartidas)
+"""
+import threading
+import time
+
+from sqlalchemy import event
+
+from game_engine import GameEngine
+from models import db, Character
+from selection_cache import SelectionCache
+from speculation import Speculator
+
+TIMEOUT = 5
+VALUES = (-2, -1, 0, 1, 2)
+VALUE_ANSWERS = {2: 'yes', 1: 'probably_yes', 0: 'dont_know', -1: 'probably_no', -2: 'no'}
+
+
+def _burn(ms):
+    """Consume CPU del hilo durante `ms` milisegundos"""
+    deadline = time.thread_time() + ms / 1000.0
+    while time.thread_time() < deadline:
+        pass
+
+
+def _wait_idle(speculator):
+    deadline = time.monotonic() + TIMEOUT
+    while speculator.get_metrics()['pending_branches']:
+        assert time.monotonic() < deadline, 'las ramas no terminaron'
+        time.sleep(0.01)
+
+
+def _blocking_branch(started, gate):
+    """Rama que avisa al empezar y espera a `gate` antes de calcular"""
+    def branch(value):
+        started.set()
+        gate.wait(TIMEOUT)
+        _burn(20)
+        return value * 10
+    return branch
+
+
+def test_hit_waits_for_the_running_branch_and_cancels_the_queued():
+    speculator = Speculator(max_workers=1)
+    started, gate = threading.Event(), threading.Event()
+    # Con un hilo, la rama de -2 corre y las otras cuatro esperan en la cola
+    speculator.schedule('s', 1, 7, _blocking_branch(started, gate), VALUES)
+    assert started.wait(TIMEOUT)
+
+    threading.Timer(0.05, gate.set).start()
+    assert speculator.take('s', 1, 7, -2) == -20
+    _wait_idle(speculator)
+
+    metrics = speculator.get_metrics()
+    assert (metrics['hits'], metrics['waited'], metrics['misses']) == (1, 1, 0)
+    assert metrics['cancelled_branches'] == 4
+    assert metrics['used_cpu_ms'] >= 15
+    assert metrics['wasted_cpu_ms'] == 0
+
+
+def test_queued_branch_is_cancelled_and_running_ones_count_as_waste():
+    speculator = Speculator(max_workers=1)
+    started, gate = threading.Event(), threading.Event()
+    speculator.schedule('s', 1, 7, _blocking_branch(started, gate), VALUES)
+    assert started.wait(TIMEOUT)
+
+    # La rama de 2 no empezó: se cancela y el llamador calcula en línea
+    assert speculator.take('s', 1, 7, 2) is None
+    gate.set()
+    _wait_idle(speculator)
+
+    metrics = speculator.get_metrics()
+    assert (metrics['hits'], metrics['misses']) == (0, 1)
+    assert metrics['cancelled_branches'] == 4
+    assert metrics['used_cpu_ms'] == 0
+    # La de -2 ya corría: no se puede interrumpir y su CPU se desperdicia
+    assert metrics['wasted_cpu_ms'] >= 15
+
+
+def test_stale_speculation_is_a_miss():
+    speculator = Speculator(max_workers=2)
+    speculator.schedule('s', 1, 7, lambda value: value, VALUES)
+    _wait_idle(speculator)
+
+    assert speculator.take('s', 2, 7, 0) is None
+    assert speculator.take('s', 2, 7, 0) is None
+    metrics = speculator.get_metrics()
+    assert (metrics['hits'], metrics['misses']) == (0, 2)
+    assert metrics['wasted_cpu_ms'] >= 0
+    assert metrics['pending_branches'] == 0
+
+
+def _play(engine, attributes, wait=None):
+    result = engine.start_game()
+    session_id = result['session_id']
+    results = []
+    while 'question' in result:
+        if wait is not None:
+            wait()
+        answer = VALUE_ANSWERS[attributes.get(result['question']['attribute_key'], 0)]
+        result = engine.process_answer(session_id, result['question']['id'], answer)
+        chosen = result.get('question') or result.get('character') or {}
+        results.append((result['type'], chosen.get('id'), result.get('candidates_remaining')))
+    return results
+
+
+def test_branches_do_not_touch_the_database_or_caches(app):
+    speculator = Speculator(max_workers=2)
+    engine = GameEngine(selection_cache=SelectionCache(), speculator=speculator)
+    main = threading.current_thread()
+    foreign = []
+
+    def record_thread(*args, **kwargs):
+        if threading.current_thread() is not main:
+            foreign.append(threading.current_thread().name)
+
+    def watched(method):
+        def wrapper(*args, **kwargs):
+            record_thread()
+            return method(*args, **kwargs)
+        return wrapper
+
+    engine.records.question = watched(engine.records.question)
+    engine.records.character = watched(engine.records.character)
+    engine.selection_cache.get = watched(engine.selection_cache.get)
+    engine.selection_cache.put = watched(engine.selection_cache.put)
+    event.listen(db.engine, 'before_cursor_execute', record_thread)
+    try:
+        for character in db.session.query(Character).order_by(Character.id).limit(3):
+            attributes = {attribute.attribute_key: attribute.value for attribute in character.attributes}
+            # Sin caché de registros, las adivinanzas tendrían que leer la base
+            engine.records.invalidate()
+            speculated = _play(engine, attributes, wait=lambda: _wait_idle(speculator))
+            assert speculated == _play(GameEngine(), attributes)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_thread)
+
+    assert foreign == []
+    metrics = speculator.get_metrics()
+    assert metrics['hits'] > 0 and metrics['misses'] == 0
+    # Las preguntas elegidas en las ramas se guardaron al tomarlas (además de la primera)
+    assert engine.selection_cache.get_metrics()['entries'] > 1